@@ -1,52 +1,114 @@
 import ast
-from typing import Optional
-from moduleobjects import Scope, ClassDef, FuncDef, ExprType, ClassRef, FuncRef, TList, TMapping
+from functools import lru_cache
+from typing import Optional, List
+from moduleobjects import Scope, ClassDef, FuncDef, SymbolPath, ExprType, TSequence, TList, TMapping, \
+    make_union_type
+
+
+# generic types by the last part of their name, p.e. List, typing.List or list
+_LIST_NAMES = {'List', 'list'}
+_SEQUENCE_NAMES = {'Sequence', 'MutableSequence', 'Iterable', 'Iterator', 'Collection', 'Generator',
+                   'Set', 'MutableSet', 'AbstractSet', 'FrozenSet', 'Deque', 'set', 'frozenset'}
+_MAPPING_NAMES = {'Mapping', 'MutableMapping', 'Dict', 'DefaultDict', 'OrderedDict', 'dict'}
+_TUPLE_NAMES = {'Tuple', 'tuple'}
 
 
 class AnnotationAnalyzer:
+    """ evaluates a type annotation in the scope, which it belongs to
+
+        Names and dotted names of classes, the generic types of typing (List, Sequence, Iterator,
+        Mapping, Dict, Tuple, Optional, Union), X | Y and string forward references are understood.
+        Other annotations have no type.
+    """
 
     def __init__(self, anno_node: ast.AST, anno_scope: Scope):
         self._anno_node = anno_node
         self._anno_scope = anno_scope
 
     def evaluate_type(self) -> Optional[ExprType]:
-        anno_node = self._anno_node
-        if isinstance(anno_node, ast.Name):
-            return self._evaluate_scope_type(anno_node.id)
-        elif isinstance(anno_node, ast.Str):
-            return self._evaluate_scope_type(anno_node.s)
+        if self._anno_node is None:
+            return None
+        return self._evaluate(self._anno_node)
+
+    def _evaluate(self, anno_node: ast.AST) -> Optional[ExprType]:
+        if isinstance(anno_node, (ast.Name, ast.Attribute)):
+            return self._evaluate_scope_type(anno_node)
         elif isinstance(anno_node, ast.Subscript):
-            if anno_node.value.id == 'List':
-                return self._evaluate_list()
-            elif anno_node.value.id == 'Mapping':
-                return self._evaluate_mapping()
+            return self._evaluate_generic(_get_dotted_name(anno_node.value), _get_type_arg_nodes(anno_node))
+        elif isinstance(anno_node, ast.BinOp) and isinstance(anno_node.op, ast.BitOr):  # X | Y
+            return make_union_type([self._evaluate(anno_node.left), self._evaluate(anno_node.right)])
 
-    def _evaluate_scope_type(self, symb_name: str) -> Optional[ExprType]:
-        symbol = self._anno_scope.find_symbol_by_name(symb_name)
+        str_value = get_str_value(anno_node)
+        if str_value is not None:  # forward reference
+            parsed_node = parse_annotation(str_value)
+            if parsed_node is not None:
+                return self._evaluate(parsed_node)
+
+    def _evaluate_scope_type(self, anno_node: ast.AST) -> Optional[ExprType]:
+        dotted_name = _get_dotted_name(anno_node)
+        if dotted_name is None:
+            return None
+        symbol = self._anno_scope.find_symbol_by_path(SymbolPath(dotted_name.split('.')))
         if isinstance(symbol, ClassDef):
-            return ClassRef(symbol)
+            return symbol.class_ref
         elif isinstance(symbol, FuncDef):
-            return FuncRef(symbol)
-
-    def _evaluate_list(self) -> Optional[ExprType]:
-        anno_node = self._anno_node
-        item_anno_node = anno_node.slice.value
-        item_type = AnnotationAnalyzer(item_anno_node, self._anno_scope).evaluate_type()
-        if item_type is not None:
-            return TList(item_type)
-
-    def _evaluate_mapping(self) -> Optional[ExprType]:
-        anno_node = self._anno_node
-        slice_ = anno_node.slice.value
-        if isinstance(slice_, ast.Tuple):
-            key_anno_node = slice_.elts[0]
-            key_type = None
-            if key_anno_node is not None:
-                key_type = AnnotationAnalyzer(key_anno_node, self._anno_scope).evaluate_type()
-            value_anno_node = slice_.elts[1]
-            value_type = None
-            if value_anno_node is not None:
-                value_type = AnnotationAnalyzer(value_anno_node, self._anno_scope).evaluate_type()
+            return symbol.func_ref
+
+    def _evaluate_generic(self, dotted_name: Optional[str], arg_nodes: List[ast.AST]) -> Optional[ExprType]:
+        if dotted_name is None or not arg_nodes:
+            return None
+        name = dotted_name.rpartition('.')[2]
+        if name == 'Optional':
+            return self._evaluate(arg_nodes[0])
+        elif name == 'Union':
+            return make_union_type([self._evaluate(x) for x in arg_nodes])
+        elif name in _LIST_NAMES or name in _SEQUENCE_NAMES:
+            item_type = self._evaluate(arg_nodes[0])
+            if item_type is not None:
+                return TList(item_type) if name in _LIST_NAMES else TSequence(item_type)
+        elif name in _TUPLE_NAMES:
+            if len(arg_nodes) == 2 and _is_ellipsis(arg_nodes[1]):  # Tuple[A, ...]
+                arg_nodes = arg_nodes[:1]
+            item_type = make_union_type([self._evaluate(x) for x in arg_nodes])
+            if item_type is not None:
+                return TSequence(item_type)
+        elif name in _MAPPING_NAMES and len(arg_nodes) == 2:
+            value_type = self._evaluate(arg_nodes[1])
             if value_type is not None:
-                return TMapping(key_type, value_type)
+                return TMapping(self._evaluate(arg_nodes[0]), value_type)
+
+
+@lru_cache(maxsize=4096)
+def parse_annotation(text: str) -> Optional[ast.AST]:
+    """ parses a string annotation once. The returned node must not be changed. """
+    try:
+        return ast.parse(text.strip(), mode='eval').body
+    except SyntaxError:
+        return None
+
+
+def _get_dotted_name(node: ast.AST) -> Optional[str]:
+    if isinstance(node, ast.Name):
+        return node.id
+    elif isinstance(node, ast.Attribute):
+        parent_name = _get_dotted_name(node.value)
+        if parent_name is not None:
+            return parent_name + '.' + node.attr
+
+
+def _get_type_arg_nodes(subscript_node: ast.Subscript) -> List[ast.AST]:
+    slice_node = subscript_node.slice
+    if type(slice_node).__name__ == 'Index':  # python < 3.9
+        slice_node = slice_node.value
+    if isinstance(slice_node, ast.Tuple):
+        return slice_node.elts
+    return [slice_node]
+
+
+def get_str_value(node: ast.AST) -> Optional[str]:
+    value = node.s if type(node).__name__ == 'Str' else getattr(node, 'value', None)  # ast.Str: python < 3.8
+    return value if isinstance(value, str) else None
+
 
+def _is_ellipsis(node: ast.AST) -> bool:
+    return type(node).__name__ == 'Ellipsis' or getattr(node, 'value', None) is Ellipsis  # python < 3.8
@@ -0,0 +1,269 @@
+"""
+Directories in zip and tar archives, p.e. wheels and sdists, which are analysed without extracting them.
+
+The listings come from the index of the archive (the central directory of a zip file, the member
+headers of a tar file), which is read once. The content of a file is read, when it is needed.
+"""
+
+from typing import Mapping, Optional, Iterator, Tuple
+from pathlib import Path
+import tarfile
+import zipfile
+
+from filesystem import Dir, File
+
+
+class ArchiveDir(Dir):
+    """ a directory in an archive, ZipDir and TarDir are the roots """
+
+    def __init__(self, root: 'ArchiveDir', path: str):
+        self._root = root
+        self._path = path  # relative to the root with '/', '' for the root
+
+    def __reduce__(self):
+        return _find_archive_member, (type(self._root), self._root._archive_path, self._path, True)
+
+    def __str__(self):
+        return self._root._join_path(self._path)
+
+    @property
+    def name(self):
+        return self._path.rpartition('/')[2] if self._path else self._root._archive_path.name
+
+    @property
+    def parent_dir(self) -> Optional['ArchiveDir']:
+        if self is self._root:
+            return None
+        return self._root._get_dir(self._path.rpartition('/')[0])
+
+    def refresh(self):
+        """ reads the index again, if the archive has changed """
+        self._root._refresh_index()
+
+    def iter_children(self):
+        yield from self.iter_subdirs()
+        yield from self.iter_files()
+
+    def iter_subdirs(self):
+        for name, is_dir in self._iter_entries():
+            if is_dir:
+                yield self._root._get_dir(self._join(name))
+
+    def iter_files(self):
+        for name, is_dir in self._iter_entries():
+            if not is_dir:
+                yield self._root._get_file(self._join(name))
+
+    def get_subdir(self, dname):
+        if self.has_subdir(dname):
+            return self._root._get_dir(self._join(dname))
+
+    def get_file(self, fname):
+        if self.has_file(fname):
+            return self._root._get_file(self._join(fname))
+
+    def has_subdir(self, dname):
+        return self._root._get_entries(self._path).get(dname, False)
+
+    def has_file(self, fname):
+        return self._root._get_entries(self._path).get(fname, True) is False
+
+    def _iter_entries(self) -> Iterator[Tuple[str, bool]]:
+        yield from self._root._get_entries(self._path).items()
+
+    def _join(self, name: str) -> str:
+        return self._path + '/' + name if self._path else name
+
+
+class ArchiveFile(File):
+    """ a file in an archive, its content is decompressed, when it is read """
+
+    def __init__(self, root: ArchiveDir, path: str):
+        self._root = root
+        self._path = path
+
+    def __reduce__(self):
+        return _find_archive_member, (type(self._root), self._root._archive_path, self._path, False)
+
+    def __str__(self):
+        return self._root._join_path(self._path)
+
+    @property
+    def name(self):
+        return self._path.rpartition('/')[2]
+
+    @property
+    def stem(self):
+        return self.name.split('.')[0]
+
+    @property
+    def suffix(self):
+        return '.' + self.name.split('.')[-1]
+
+    @property
+    def dir_(self) -> ArchiveDir:
+        return self._root._get_dir(self._path.rpartition('/')[0])
+
+    @property
+    def mtime(self):
+        return self._root._get_member_mtime(self._root._find_member(self._path))
+
+    @property
+    def size(self):
+        return self._root._get_member_size(self._root._find_member(self._path))
+
+    def read_bytes(self):
+        return self._root._read_member(self._root._find_member(self._path))
+
+
+class _ArchiveRoot(ArchiveDir):
+    """ the root of an archive: the index, the open archive and the canonical dirs and files """
+
+    def __init__(self, archive_path: Path):
+        super().__init__(self, '')
+        self._archive_path = Path(archive_path).absolute()
+        self._archive = None     # the open archive, opened on first use
+        self._archive_state = None  # type: Optional[Tuple[float, int]]  # mtime and size of the indexed archive
+        self._members = {}       # type: Mapping[str, object]  # file path -> member info
+        self._entries = {}       # type: Mapping[str, Mapping[str, bool]]  # dir path -> name -> is dir
+        self._dirs = {'': self}  # type: Mapping[str, ArchiveDir]
+        self._files = {}         # type: Mapping[str, ArchiveFile]
+
+    def close(self):
+        """ closes the archive, it is opened and indexed again, when it is used """
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+        self._archive_state = None
+
+    def _join_path(self, path: str) -> str:
+        return str(self._archive_path) + '/' + path if path else str(self._archive_path)
+
+    def _refresh_index(self):
+        if self._archive_state != self._stat_archive():
+            self._archive_state = None
+
+    def _stat_archive(self) -> Tuple[Optional[float], Optional[int]]:
+        try:
+            stat = self._archive_path.stat()
+        except OSError:  # p.e. removed
+            return None, None
+        return stat.st_mtime, stat.st_size
+
+    def _get_entries(self, path: str) -> Mapping[str, bool]:
+        if self._archive_state is None:
+            self._read_index()
+        return self._entries.get(path, {})
+
+    def _find_member(self, path: str):
+        if self._archive_state is None:
+            self._read_index()
+        member = self._members.get(path, None)
+        if member is None:
+            raise Exception('{} was removed'.format(self._join_path(path)))
+        return member
+
+    def _get_dir(self, path: str) -> ArchiveDir:
+        archive_dir = self._dirs.get(path, None)
+        if archive_dir is None:
+            archive_dir = self._dirs[path] = ArchiveDir(self, path)
+        return archive_dir
+
+    def _get_file(self, path: str) -> ArchiveFile:
+        archive_file = self._files.get(path, None)
+        if archive_file is None:
+            archive_file = self._files[path] = ArchiveFile(self, path)
+        return archive_file
+
+    def _read_index(self):
+        self.close()
+        archive_state = self._stat_archive()
+        self._members = {}
+        self._entries = {'': {}}
+        self._archive_state = archive_state
+        if archive_state[0] is None:
+            return
+        self._archive = self._open_archive()
+        for member_name, member, is_dir in self._iter_members():
+            name_parts = [x for x in member_name.split('/') if x and x != '.']
+            if not name_parts or '..' in name_parts:
+                continue
+            for i in range(1, len(name_parts)):
+                self._add_entry(name_parts[:i], True)
+            self._add_entry(name_parts, is_dir)
+            if not is_dir:
+                self._members['/'.join(name_parts)] = member
+
+    def _add_entry(self, name_parts, is_dir: bool):
+        parent_path = '/'.join(name_parts[:-1])
+        self._entries[parent_path][name_parts[-1]] = is_dir
+        if is_dir:
+            self._entries.setdefault('/'.join(name_parts), {})
+
+    def _open_archive(self):
+        raise Exception('abstract class')
+
+    def _iter_members(self) -> Iterator[Tuple[str, object, bool]]:
+        """ yields the name, the info and whether it is a directory for the members """
+        raise Exception('abstract class')
+
+    def _get_member_mtime(self, member):
+        raise Exception('abstract class')
+
+    def _get_member_size(self, member) -> int:
+        raise Exception('abstract class')
+
+    def _read_member(self, member) -> bytes:
+        raise Exception('abstract class')
+
+
+class ZipDir(_ArchiveRoot):
+    """ the root of a zip archive, p.e. a wheel """
+
+    def _open_archive(self):
+        return zipfile.ZipFile(str(self._archive_path))
+
+    def _iter_members(self):
+        for info in self._archive.infolist():
+            yield info.filename, info, info.filename.endswith('/')
+
+    def _get_member_mtime(self, member: zipfile.ZipInfo):
+        # the time stamps have a resolution of 2 seconds, the crc notices changes in between
+        return member.date_time, member.CRC
+
+    def _get_member_size(self, member: zipfile.ZipInfo) -> int:
+        return member.file_size
+
+    def _read_member(self, member: zipfile.ZipInfo) -> bytes:
+        return self._archive.read(member)
+
+
+class TarDir(_ArchiveRoot):
+    """ the root of a tar archive, p.e. an sdist, which may be compressed by gzip, bzip2 or lzma """
+
+    def _open_archive(self):
+        return tarfile.open(str(self._archive_path), 'r:*')
+
+    def _iter_members(self):
+        for info in self._archive.getmembers():
+            if info.isfile() or info.isdir():
+                yield info.name, info, info.isdir()
+
+    def _get_member_mtime(self, member: tarfile.TarInfo):
+        return member.mtime
+
+    def _get_member_size(self, member: tarfile.TarInfo) -> int:
+        return member.size
+
+    def _read_member(self, member: tarfile.TarInfo) -> bytes:
+        return self._archive.extractfile(member).read()
+
+
+_unpickled_roots = {}  # type: Mapping[Tuple[type, Path], _ArchiveRoot]  # one index per archive and process
+
+
+def _find_archive_member(root_type: type, archive_path: Path, path: str, is_dir: bool):
+    root = _unpickled_roots.get((root_type, archive_path), None)
+    if root is None:
+        root = _unpickled_roots[root_type, archive_path] = root_type(archive_path)
+    return root._get_dir(path) if is_dir else root._get_file(path)
@@ -0,0 +1,119 @@
+"""
+Measures the build time and the memory of a synthetic program.
+
+usage: python benchmark.py [num_modules] [num_classes_per_module] [jobs]
+
+p.e. "python benchmark.py 60 20 4" compares the parallel build with "python benchmark.py 60 20" on a multi core
+machine.
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+from filesystem import VirtualDir
+from proglib import Program
+
+
+def create_source(module_index: int, num_modules: int, num_classes: int) -> str:
+    lines = []
+    if module_index + 1 < num_modules:
+        lines.append('import mod{}'.format(module_index + 1))
+        lines.append('from mod{} import C0 as Base'.format(module_index + 1))
+    else:
+        lines.append('class Base:')
+        lines.append('    def run(self) -> Base:')
+        lines.append('        return self')
+    lines.append('')
+
+    for i in range(num_classes):
+        lines.append('class C{}(Base):'.format(i))
+        lines.append('    def __init__(self):')
+        lines.append('        self.other: C{} = C{}()'.format(max(i - 1, 0), max(i - 1, 0)))
+        lines.append('')
+        lines.append('    def run(self) -> C{}:'.format(i))
+        lines.append('        x: C{} = C{}()'.format(i, i))
+        lines.append('        x.run().run().other.run()')
+        lines.append('        self.other.run()')
+        lines.append('        for k in range(10):')
+        lines.append('            print(k, len(str(k)), self.helper(k, x.run()))')
+        lines.append('        return x')
+        lines.append('')
+        lines.append('    def helper(self, a, b: C{}) -> C{}:'.format(i, i))
+        lines.append('        b.run()')
+        lines.append('        return b.run().run()')
+        lines.append('')
+
+    lines.append('def main():')
+    for i in range(num_classes):
+        lines.append('    c{} = C{}()'.format(i, i))
+        lines.append('    c{}.run().helper(1, c{})'.format(i, i))
+    return '\n'.join(lines) + '\n'
+
+
+def create_program(num_modules: int, num_classes: int) -> Program:
+    root_dir = VirtualDir(name='', parent_dir=None)
+    main_file = root_dir.add_file('main.py', 'import mod0\n')
+    for module_index in range(num_modules):
+        source = create_source(module_index, num_modules, num_classes)
+        root_dir.add_file('mod{}.py'.format(module_index), source)
+    return Program(main_file)
+
+
+def count_symbols(prg: Program) -> int:
+    """ counts the scopes and variables of all modules """
+    num_symbols = 0
+    for module in prg.iter_modules():
+        scopes = [module] + list(module.iter_descendant_scopes())
+        num_symbols += len(scopes) + sum(len(list(x.iter_variables())) for x in scopes)
+    return num_symbols
+
+
+def measure_memory(num_modules: int, num_classes: int) -> None:
+    """ prints the memory of the program, of the objects of moduleobjects.py and of the kept ast nodes
+
+        The peak is reached, while the ast of a module is alive. After the build only the nodes of the
+        bases and annotations, which are not linked and typed yet, may remain.
+    """
+    prg = create_program(num_modules, num_classes)
+    tracemalloc.start()
+    prg.build()
+    size, peak_size = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    model_size = _sum_traces(snapshot, '*moduleobjects.py')
+    ast_size = _sum_traces(snapshot, '*ast.py')  # the nodes are allocated by ast.parse
+
+    num_symbols = count_symbols(prg)
+    print('memory: {:.1f} MB, {} symbols, {:.0f} bytes per symbol, peak {:.1f} MB'.format(
+        size / 1e6, num_symbols, size / num_symbols, peak_size / 1e6))
+    print('object model: {:.1f} MB, {:.0f} bytes per symbol'.format(model_size / 1e6, model_size / num_symbols))
+    print('kept ast: {:.1f} MB'.format(ast_size / 1e6))
+
+
+def _sum_traces(snapshot: tracemalloc.Snapshot, file_pattern: str) -> int:
+    traces = snapshot.filter_traces([tracemalloc.Filter(True, file_pattern)])
+    return sum(x.size for x in traces.statistics('filename'))
+
+
+def main():
+    num_modules = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    num_classes = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    jobs = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    prg = create_program(num_modules, num_classes)
+    start_time = time.perf_counter()
+    prg.build(jobs=jobs)
+    duration = time.perf_counter() - start_time
+
+    num_call_sites = sum(x.call_graph.num_call_sites for x in prg.iter_modules())
+    print('{} modules, {} classes per module, jobs={}, {} cpus'.format(
+        num_modules, num_classes, jobs, os.cpu_count()))  # a single cpu builds without workers
+    print('build: {:.3f} s, {:.2f} ms per module, {} call sites, {} calls'.format(
+        duration, 1000 * duration / (num_modules + 1), num_call_sites, prg.call_graph.num_calls))
+    measure_memory(num_modules, num_classes)
+
+
+if __name__ == '__main__':
+    main()
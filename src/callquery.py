@@ -0,0 +1,174 @@
+from typing import List, Optional, Mapping, Tuple
+from array import array
+
+from moduleobjects import Scope, ProgCallGraph
+
+
+class CallQuery:
+    """ reachability and path queries over the call graph of a program
+
+        The visited sets are bitsets over the node ids of the ProgCallGraph, so a query allocates
+        num_nodes / 8 bytes and touches only the nodes, which it visits.
+    """
+
+    def __init__(self, call_graph: ProgCallGraph):
+        self._call_graph = call_graph
+        self._num_nodes = call_graph.num_nodes
+
+    def find_callees(self, scope: Scope, max_depth: Optional[int] = None) -> List[Scope]:
+        """ returns the scopes, which are called directly or indirectly, in the order of their call depth
+
+            max_depth = 1 returns only the direct callees. The scope itself is not returned.
+        """
+        return self._find_reachable(scope, self._call_graph.forward_adjacency, max_depth)
+
+    def find_callers(self, scope: Scope, max_depth: Optional[int] = None) -> List[Scope]:
+        """ returns the scopes, which call the scope directly or indirectly (the impact of a change) """
+        return self._find_reachable(scope, self._call_graph.reverse_adjacency, max_depth)
+
+    def _find_reachable(self, scope: Scope, adjacency: Tuple[array, array], max_depth: Optional[int]) -> List[Scope]:
+        start_id = self._call_graph.find_node_id(scope)
+        if start_id is None:
+            return []
+
+        offsets, ids = adjacency
+        visited = self._create_bitset()
+        visited[start_id >> 3] |= 1 << (start_id & 7)
+        result = []
+        frontier = [start_id]
+        depth = 0
+        while frontier and (max_depth is None or depth < max_depth):
+            depth += 1
+            next_frontier = []
+            for node_id in frontier:
+                for i in range(offsets[node_id], offsets[node_id + 1]):
+                    next_id = ids[i]
+                    if not visited[next_id >> 3] & (1 << (next_id & 7)):
+                        visited[next_id >> 3] |= 1 << (next_id & 7)
+                        next_frontier.append(next_id)
+            result.extend(next_frontier)
+            frontier = next_frontier
+        return [self._call_graph.get_node(x) for x in result]
+
+    def find_shortest_path(self, caller: Scope, callee: Scope) -> Optional[List[Scope]]:
+        """ returns a shortest call chain [caller, ..., callee] or None
+
+            The search runs from both ends and expands always the smaller frontier.
+        """
+        start_id = self._call_graph.find_node_id(caller)
+        end_id = self._call_graph.find_node_id(callee)
+        if start_id is None or end_id is None:
+            return None
+        if start_id == end_id:
+            return [caller]
+
+        forward_parents = {start_id: -1}   # type: Mapping[int, int]
+        reverse_parents = {end_id: -1}     # type: Mapping[int, int]
+        forward_visited = self._create_bitset()
+        forward_visited[start_id >> 3] |= 1 << (start_id & 7)
+        reverse_visited = self._create_bitset()
+        reverse_visited[end_id >> 3] |= 1 << (end_id & 7)
+        forward_frontier = [start_id]
+        reverse_frontier = [end_id]
+
+        while forward_frontier and reverse_frontier:
+            if len(forward_frontier) <= len(reverse_frontier):
+                forward_frontier, meeting_id = self._expand_level(
+                    forward_frontier, self._call_graph.forward_adjacency, forward_visited, forward_parents,
+                    reverse_visited)
+            else:
+                reverse_frontier, meeting_id = self._expand_level(
+                    reverse_frontier, self._call_graph.reverse_adjacency, reverse_visited, reverse_parents,
+                    forward_visited)
+            if meeting_id is not None:
+                path_ids = _trace_back(meeting_id, forward_parents)[::-1] + _trace_back(meeting_id, reverse_parents)[1:]
+                return [self._call_graph.get_node(x) for x in path_ids]
+        return None
+
+    def _expand_level(self, frontier: List[int], adjacency: Tuple[array, array], visited: bytearray,
+                      parents: Mapping[int, int], other_visited: bytearray) -> Tuple[List[int], Optional[int]]:
+        """ expands one level and returns the new frontier and a node, which the other side has visited """
+        offsets, ids = adjacency
+        next_frontier = []
+        for node_id in frontier:
+            for i in range(offsets[node_id], offsets[node_id + 1]):
+                next_id = ids[i]
+                if not visited[next_id >> 3] & (1 << (next_id & 7)):
+                    visited[next_id >> 3] |= 1 << (next_id & 7)
+                    parents[next_id] = node_id
+                    if other_visited[next_id >> 3] & (1 << (next_id & 7)):
+                        # the other side has visited only complete levels, so this path is a shortest one
+                        return next_frontier, next_id
+                    next_frontier.append(next_id)
+        return next_frontier, None
+
+    def find_paths(self, caller: Scope, callee: Scope, max_length: int, max_paths: int = 1000) -> List[List[Scope]]:
+        """ returns the call chains [caller, ..., callee] without repeated scopes and with at most max_length calls
+
+            The enumeration stops after max_paths paths. Only nodes, from which the callee can be reached
+            in the remaining number of calls, are entered.
+        """
+        start_id = self._call_graph.find_node_id(caller)
+        end_id = self._call_graph.find_node_id(callee)
+        if start_id is None or end_id is None or max_paths <= 0:
+            return []
+        if start_id == end_id:
+            return [[caller]]
+
+        distances = self._calc_distances_to(end_id, max_length)
+        if start_id not in distances:
+            return []
+
+        result = []
+        on_path = self._create_bitset()
+        on_path[start_id >> 3] |= 1 << (start_id & 7)
+        path = [start_id]
+        stack = [self._call_graph.iter_callee_ids(start_id)]
+        while stack:
+            next_id = next(stack[-1], None)
+            if next_id is None:
+                stack.pop()
+                node_id = path.pop()
+                on_path[node_id >> 3] &= ~(1 << (node_id & 7))
+                continue
+            if on_path[next_id >> 3] & (1 << (next_id & 7)):
+                continue
+            distance = distances.get(next_id, None)
+            if distance is None or len(path) + distance > max_length:
+                continue
+            if next_id == end_id:
+                result.append([self._call_graph.get_node(x) for x in path + [end_id]])
+                if len(result) >= max_paths:
+                    break
+                continue
+            on_path[next_id >> 3] |= 1 << (next_id & 7)
+            path.append(next_id)
+            stack.append(self._call_graph.iter_callee_ids(next_id))
+        return result
+
+    def _calc_distances_to(self, end_id: int, max_distance: int) -> Mapping[int, int]:
+        """ returns the number of calls from the nodes to end_id, if it is not greater than max_distance """
+        offsets, ids = self._call_graph.reverse_adjacency
+        distances = {end_id: 0}
+        frontier = [end_id]
+        for distance in range(1, max_distance + 1):
+            next_frontier = []
+            for node_id in frontier:
+                for i in range(offsets[node_id], offsets[node_id + 1]):
+                    next_id = ids[i]
+                    if next_id not in distances:
+                        distances[next_id] = distance
+                        next_frontier.append(next_id)
+            frontier = next_frontier
+        return distances
+
+    def _create_bitset(self) -> bytearray:
+        return bytearray((self._num_nodes + 7) >> 3)
+
+
+def _trace_back(node_id: int, parents: Mapping[int, int]) -> List[int]:
+    path_ids = []
+    while node_id != -1:
+        path_ids.append(node_id)
+        node_id = parents[node_id]
+    return path_ids
@@ -0,0 +1,114 @@
+from typing import List, Optional, Mapping, Set, Iterable
+
+from moduleobjects import Module, Scope, ClassDef, FuncDef
+from proglib import Program
+
+
+class DeadCodeFinder:
+    """ finds the classes and functions, which can not be reached from the entry points
+
+        A definition is reached, if it is an entry point or called by executed code. Executed code is:
+        - the top level of an entry module and of all modules, which executed code imports,
+          "if __name__ == '__main__':" blocks only in entry modules,
+        - the bodies of reached functions,
+        - class bodies, when the enclosing scope is executed or the class is reached.
+        Reaching a class reaches its special methods (p.e. __init__), because the runtime calls them.
+
+        Each scope is visited at most once, so the traversal is linear in the number of definitions
+        and calls.
+    """
+
+    def __init__(self, prg: Program):
+        self._prg = prg
+        self._call_graph = prg.call_graph
+        self._entry_modules = set()   # type: Set[Module]
+        self._executed = set()        # type: Set[Scope]
+        self._reached = set()         # type: Set[Scope]
+        self._todo = []               # type: List[Scope]  # scopes to execute
+
+    def find_unreachable(self, entry_points: Optional[Iterable[str]] = None,
+                         include_main_blocks: bool = False) -> Mapping[Module, List[Scope]]:
+        """ returns the unreachable definitions grouped by module and sorted by line
+
+            entry_points are fullnames of modules, classes or functions. The main module is the default.
+            include_main_blocks makes every module with an "if __name__ == '__main__':" block an entry.
+        """
+        entry_symbols = [self._find_entry_point(x) for x in entry_points or [self._prg.main_module.fullname]]
+        if include_main_blocks:
+            entry_symbols.extend(x for x in self._prg.iter_modules() if x.has_main_block)
+
+        for symbol in entry_symbols:
+            if isinstance(symbol, Module):
+                self._entry_modules.add(symbol)
+                self._execute(symbol)
+            else:
+                self._reach(symbol)
+        self._run()
+
+        unreachable = {}
+        for module in self._prg.iter_modules():
+            definitions = []
+            stack = [module]
+            while stack:
+                for child_scope in stack.pop().iter_child_scopes():
+                    if child_scope not in self._reached:
+                        definitions.append(child_scope)
+                    stack.append(child_scope)
+            if definitions:
+                unreachable[module] = sorted(definitions, key=lambda x: x.lineno)
+        return unreachable
+
+    def _find_entry_point(self, fullname: str) -> Scope:
+        symbol = self._prg.find_symbol(fullname)
+        if not isinstance(symbol, (Module, ClassDef, FuncDef)):
+            raise Exception('unknown entry point {}'.format(fullname))
+        return symbol
+
+    def _run(self) -> None:
+        while self._todo:
+            scope = self._todo.pop()
+            if isinstance(scope, Module):
+                for imported_module in scope.iter_imported_modules():
+                    self._execute(imported_module)
+                in_entry_module = scope in self._entry_modules
+                for call_site in self._call_graph.iter_calls_from(scope, expand=False):
+                    if in_entry_module or not scope.is_in_main_block(call_site.lineno):
+                        for callee in call_site.targets:
+                            self._reach(callee)
+            else:
+                call_graph = self._call_graph
+                node_id = call_graph.find_node_id(scope)
+                if node_id is not None:
+                    for callee_id in call_graph.iter_callee_ids(node_id):
+                        self._reach(call_graph.get_node(callee_id))
+            for child_scope in scope.iter_child_scopes():
+                if isinstance(child_scope, ClassDef):
+                    self._execute(child_scope)  # the class body runs, when the class is defined
+
+    def _reach(self, scope: Scope) -> None:
+        if scope in self._reached:
+            return
+        self._reached.add(scope)
+        self._execute(scope)
+        if isinstance(scope, ClassDef):
+            for child_scope in scope.iter_child_scopes():
+                if isinstance(child_scope, FuncDef) and _is_special_name(child_scope.name):
+                    self._reach(child_scope)
+
+    def _execute(self, scope: Scope) -> None:
+        if scope not in self._executed:
+            self._executed.add(scope)
+            self._todo.append(scope)
+
+
+def _is_special_name(name: str) -> bool:
+    return name.startswith('__') and name.endswith('__')
+
+
+def format_report(unreachable: Mapping[Module, List[Scope]]) -> str:
+    lines = []
+    for module in sorted(unreachable, key=lambda x: x.fullname):
+        lines.append(module.fullname)
+        for scope in unreachable[module]:
+            lines.append('  {}: {}'.format(scope.lineno, scope.fullname))
+    return '\n'.join(lines)
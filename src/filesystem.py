@@ -1,4 +1,36 @@
+from typing import Mapping, Optional, Union
 from pathlib import Path
+from importlib.util import decode_source
+import contextlib
+import hashlib
+import mmap
+import os
+import weakref
+
+
+def calc_source_hash(source) -> str:
+    """ hash of the raw content: bytes or a buffer like mmap, a str is hashed as utf-8 """
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+    return hashlib.sha1(source).hexdigest()
+
+
+class FileState:
+    """ identity of a file content at a certain time """
+
+    def __init__(self, mtime, size: int, source_hash: str):
+        self.mtime = mtime
+        self.size = size
+        self.source_hash = source_hash
+
+    @staticmethod
+    def of(file_: 'File', source_hash: str) -> 'FileState':
+        return FileState(file_.mtime, file_.size, source_hash)
+
+    def matches(self, file_: 'File') -> bool:
+        if self.mtime is not None and self.mtime == file_.mtime and self.size == file_.size:
+            return True
+        return self.source_hash == calc_source_hash(file_.read_bytes())
 
 
 class Dir:
@@ -31,6 +63,10 @@ class Dir:
         
     def has_file(self, fname):
         raise Exception('abstract class')
+
+    def refresh(self):
+        """ forgets cached listings and file states, p.e. before a build """
+        pass
         
      
 class File:
@@ -63,8 +99,54 @@ class File:
         raise Exception('abstract class')
 
     def read(self):
+        """ the decoded content, the encoding is detected like python does (PEP 263) """
+        return decode_source(self.read_bytes())
+
+    def read_bytes(self) -> bytes:
         raise Exception('abstract class')
 
+    @contextlib.contextmanager
+    def open_bytes(self):
+        """ yields the raw content as buffer, which is only valid in the with block """
+        yield self.read_bytes()
+
+
+class NamespacePackageFile(File):
+    """ stands for the missing __init__.py of a namespace package, a package directory without it """
+
+    def __init__(self, dir_: Dir):
+        self._dir = dir_
+
+    def __str__(self):
+        return str(self._dir) + '/__init__.py'
+
+    @property
+    def name(self):
+        return '__init__.py'
+
+    @property
+    def stem(self):
+        return '__init__'
+
+    @property
+    def suffix(self):
+        return '.py'
+
+    @property
+    def dir_(self):
+        return self._dir
+
+    @property
+    def mtime(self):
+        return None
+
+    @property
+    def size(self):
+        return 0
+
+    def read_bytes(self):
+        return b''
+
 
 class VirtualDir(Dir):
 
@@ -76,7 +158,7 @@ class VirtualDir(Dir):
         
     def __str__(self):
         if self._parent_dir:
-            return self._parent_dir + '/' + self._name
+            return str(self._parent_dir) + '/' + self._name
         else:
             return self._name
         
@@ -93,6 +175,11 @@ class VirtualDir(Dir):
         new_file = VirtualFile(file_name, self, file_buf)
         self._files[file_name] = new_file
         return new_file
+
+    def remove_file(self, file_name):
+        if file_name not in self._files:
+            raise Exception('{} does not exist in {}'.format(file_name, self._name))
+        del self._files[file_name]
         
     @property
     def name(self):
@@ -163,14 +250,46 @@ class VirtualFile(File):
         return self._dir
         
     def read(self):
+        if isinstance(self._buf, str):
+            return self._buf
+        return decode_source(self._buf)
+
+    def read_bytes(self):
+        if isinstance(self._buf, str):
+            return self._buf.encode('utf-8')
         return self._buf
+
+    def write(self, file_buf):
+        self._buf = file_buf
+        self._size = len(file_buf)
         
         
 class RegularDir(Dir):
+    """ a directory of the file system
+
+        The entries are listed once by os.scandir and kept, until refresh() is called, p.e. at the
+        start of a build. There is one instance per path and a directory keeps its subdirectories and
+        files, so import resolution touches the file system once per directory.
+    """
+
+    _instances = weakref.WeakValueDictionary()  # type: Mapping[Path, RegularDir]
+    _scan_generation = 0  # incremented by refresh(), older listings are stale
+
+    def __new__(cls, dpath: Path):
+        dpath = Path(dpath).absolute()
+        instance = cls._instances.get(dpath, None)
+        if instance is None:
+            instance = super().__new__(cls)
+            instance._dpath = dpath
+            instance._entries = None   # type: Optional[Mapping[str, os.DirEntry]]
+            instance._entries_generation = -1
+            instance._children = {}    # type: Mapping[str, Union[RegularDir, RegularFile]]
+            cls._instances[dpath] = instance
+        return instance
+
+    def __reduce__(self):
+        return RegularDir, (self._dpath,)
 
-    def __init__(self, dpath):
-        self._dpath = dpath
-        
     def __str__(self):
         return str(self._dpath)
         
@@ -178,49 +297,89 @@ class RegularDir(Dir):
     def name(self):
         return self._dpath.name
 
+    @property
+    def parent_dir(self) -> Optional['RegularDir']:
+        parent_dpath = self._dpath.parent
+        return RegularDir(parent_dpath) if parent_dpath != self._dpath else None
+
+    def refresh(self):
+        """ forgets the listings of all regular directories and the states of their files """
+        RegularDir._scan_generation += 1
+
     def iter_children(self):
-        for x in self._dpath.iterdir():
-            if x.is_file():
-                yield RegularFile(x)
-            elif x.is_dir():
-                yield RegularDir(x)
+        for name, entry in self._get_entries().items():
+            if entry.is_file():
+                yield self._get_child(name, RegularFile)
+            elif entry.is_dir():
+                yield self._get_child(name, RegularDir)
 
     def iter_subdirs(self):
-        for x in self._dpath.iterdir():
-            if x.is_dir():
-                yield RegularDir(x)
+        for name, entry in self._get_entries().items():
+            if entry.is_dir():
+                yield self._get_child(name, RegularDir)
             
     def iter_files(self):
-        for x in self._dpath.iterdir():
-            if x.is_file():
-                yield RegularFile(x)
+        for name, entry in self._get_entries().items():
+            if entry.is_file():
+                yield self._get_child(name, RegularFile)
         
     def get_subdir(self, subdir_name):
-        sub_dpath = self._dpath / subdir_name
-        if sub_dpath.exists() and sub_dpath.is_dir():
-            return RegularDir(sub_dpath)
+        if self.has_subdir(subdir_name):
+            return self._get_child(subdir_name, RegularDir)
         
     def get_file(self, file_name):
-        fpath = self._dpath / file_name
-        if fpath.exists() and fpath.is_file():
-            return RegularFile(fpath)
+        if self.has_file(file_name):
+            return self._get_child(file_name, RegularFile)
         
     def has_subdir(self, subdir_name):
-        subdir_path = self._dpath / subdir_name
-        return subdir_path.exists()
+        entry = self._get_entries().get(subdir_name, None)
+        return entry is not None and entry.is_dir()
         
     def has_file(self, file_name):
-        file_path = self._dpath / file_name
-        return file_path.exists()
+        entry = self._get_entries().get(file_name, None)
+        return entry is not None and entry.is_file()
+
+    def find_entry(self, name: str) -> Optional[os.DirEntry]:
+        """ the cached directory entry, its stat() is cached too """
+        return self._get_entries().get(name, None)
+
+    def _get_entries(self) -> Mapping[str, os.DirEntry]:
+        if self._entries_generation != RegularDir._scan_generation:
+            try:
+                with os.scandir(str(self._dpath)) as entries:
+                    self._entries = {x.name: x for x in entries}
+            except OSError:  # p.e. removed
+                self._entries = {}
+            self._entries_generation = RegularDir._scan_generation
+        return self._entries
+
+    def _get_child(self, name: str, child_type: type):
+        child = self._children.get(name, None)
+        if type(child) is not child_type:  # p.e. a file was replaced by a directory
+            child = self._children[name] = child_type(self._dpath / name)
+        return child
         
         
 class RegularFile(File):
-    
-    def __init__(self, fpath: Path):
-        self._fpath = fpath.absolute()
+    """ a file of the file system. There is one instance per path, the state comes from its directory. """
+
+    _instances = weakref.WeakValueDictionary()  # type: Mapping[Path, RegularFile]
+
+    def __new__(cls, fpath: Path):
+        fpath = Path(fpath).absolute()
+        instance = cls._instances.get(fpath, None)
+        if instance is None:
+            instance = super().__new__(cls)
+            instance._fpath = fpath
+            instance._dir = None  # type: Optional[RegularDir]
+            cls._instances[fpath] = instance
+        return instance
+
+    def __reduce__(self):
+        return RegularFile, (self._fpath,)
 
     def __str__(self):
-        return str(self._dpath)
+        return str(self._fpath)
                 
     @property
     def name(self):
@@ -236,20 +395,37 @@ class RegularFile(File):
 
     @property
     def mtime(self):
-        return self._fpath.stat().st_mtime
+        return self._stat().st_mtime
         
     @property
     def size(self):
-        return self._fpath.stat().st_size
+        return self._stat().st_size
 
     @property
-    def dir_(self):
-        return RegularDir(self._fpath.parent)
+    def dir_(self) -> RegularDir:
+        if self._dir is None:
+            self._dir = RegularDir(self._fpath.parent)
+        return self._dir
 
-    def read(self):
-        with self._fpath.open('r') as fh:
-            self._buf = fh.read()
-        return self._buf
+    def read_bytes(self):
+        with self._fpath.open('rb') as fh:
+            return fh.read()
+
+    @contextlib.contextmanager
+    def open_bytes(self):
+        """ maps the file into memory, so it is parsed without a copy on the heap """
+        with self._fpath.open('rb') as fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                yield b''  # an empty file can't be mapped
+                return
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                yield buf
+
+    def _stat(self) -> os.stat_result:
+        entry = self.dir_.find_entry(self.name)
+        if entry is not None and entry.is_file():
+            return entry.stat()
+        return self._fpath.stat()  # raises, if the file was removed
         
         
 # class DirComparer:
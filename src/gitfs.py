@@ -0,0 +1,278 @@
+"""
+Directories of a git revision, which are read from the object store of a local repository without checkout.
+
+The listing of a directory comes from "git ls-tree" and is kept per tree id, the contents of the files
+are read through one long-lived "git cat-file --batch" process. The blob id of a file replaces its
+mtime, so the module cache recognizes unchanged files in other revisions.
+"""
+
+from typing import Mapping, Optional, Tuple
+from collections import namedtuple
+from pathlib import Path
+import subprocess
+
+from filesystem import Dir, File
+
+
+GitEntry = namedtuple('GitEntry', ['is_dir', 'object_id', 'size'])
+
+
+class GitRepository:
+    """ a local git repository """
+
+    def __init__(self, repo_path: Path):
+        self._repo_path = Path(repo_path).absolute()
+        self._cat_file = None  # type: Optional[subprocess.Popen]  # started on first use
+        self._trees = {}       # type: Mapping[str, Mapping[str, GitEntry]]  # tree id -> name -> entry
+
+    def __reduce__(self):
+        return _get_repository, (self._repo_path,)
+
+    @property
+    def repo_path(self) -> Path:
+        return self._repo_path
+
+    def get_root_dir(self, rev: str) -> 'GitDir':
+        """ the top directory of a revision, p.e. 'HEAD~1' or a commit id """
+        return GitDir(self, rev)
+
+    def find_file(self, rev_path: str) -> Optional['GitFile']:
+        """ finds a file by "rev:path", p.e. 'v1.0:src/main.py'. Without revision, p.e. 'src/main.py', in HEAD. """
+        if ':' in rev_path:
+            rev, _, path = rev_path.partition(':')
+        else:
+            rev, path = 'HEAD', rev_path
+        cur_dir = self.get_root_dir(rev or 'HEAD')
+        dir_names, _, file_name = path.strip('/').rpartition('/')
+        for dir_name in dir_names.split('/') if dir_names else []:
+            cur_dir = cur_dir.get_subdir(dir_name)
+            if cur_dir is None:
+                return
+        return cur_dir.get_file(file_name)
+
+    def resolve_tree_id(self, rev: str) -> str:
+        return self._run_git('rev-parse', '--verify', '--quiet', rev + '^{tree}').strip()
+
+    def list_tree(self, tree_id: str) -> Mapping[str, GitEntry]:
+        entries = self._trees.get(tree_id, None)
+        if entries is None:
+            entries = self._trees[tree_id] = {}
+            for line in self._run_git('ls-tree', '-z', '-l', tree_id).split('\0'):
+                if not line:
+                    continue
+                info, _, name = line.partition('\t')
+                mode, object_type, object_id, size = info.split()
+                if object_type == 'tree':
+                    entries[name] = GitEntry(True, object_id, 0)
+                elif object_type == 'blob' and mode != '120000':  # no symbolic links
+                    entries[name] = GitEntry(False, object_id, int(size))
+        return entries
+
+    def read_blob(self, blob_id: str) -> bytes:
+        if self._cat_file is None or self._cat_file.poll() is not None:
+            self._cat_file = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=str(self._repo_path),
+                                              stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._cat_file.stdin.write(blob_id.encode('ascii') + b'\n')
+        self._cat_file.stdin.flush()
+        header = self._cat_file.stdout.readline().split()
+        if len(header) != 3:
+            raise Exception('git object {} is missing in {}'.format(blob_id, self._repo_path))
+        content = self._cat_file.stdout.read(int(header[2]))
+        self._cat_file.stdout.read(1)  # line feed after the content
+        return content
+
+    def close(self):
+        if self._cat_file is not None:
+            self._cat_file.stdin.close()
+            self._cat_file.wait()
+            self._cat_file.stdout.close()
+            self._cat_file = None
+
+    def _run_git(self, *args) -> str:
+        result = subprocess.run(['git'] + list(args), cwd=str(self._repo_path),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise Exception('git {} failed in {}: {}'.format(
+                ' '.join(args), self._repo_path, result.stderr.decode('utf-8', 'replace').strip()))
+        return result.stdout.decode('utf-8', 'surrogateescape')
+
+
+class GitDir(Dir):
+    """ a directory of a revision
+
+        The top directory resolves the revision, refresh() resolves it again, p.e. after a commit to a
+        branch. The directories and files are canonical per path and follow the resolved revision.
+    """
+
+    def __init__(self, repository: GitRepository, rev: str, root: Optional['GitDir'] = None, path: str = ''):
+        self._repository = repository
+        self._rev = rev
+        self._root = root if root is not None else self
+        self._path = path  # relative to the top directory with '/', '' for the top directory
+        if root is None:
+            self._tree_id = None  # type: Optional[str]  # of the resolved revision
+            self._dirs = {'': self}  # type: Mapping[str, GitDir]
+            self._files = {}         # type: Mapping[str, GitFile]
+
+    def __reduce__(self):
+        # the tree id keeps the revision of the parent process
+        return _find_git_member, (self._repository, self._root._get_tree_id(), self._path, True)
+
+    def __str__(self):
+        return self._root._join_path(self._path)
+
+    @property
+    def name(self):
+        return self._path.rpartition('/')[2] if self._path else self._repository.repo_path.name
+
+    @property
+    def parent_dir(self) -> Optional['GitDir']:
+        if self is self._root:
+            return None
+        return self._root._get_dir(self._path.rpartition('/')[0])
+
+    @property
+    def rev(self) -> str:
+        return self._rev
+
+    def refresh(self):
+        """ resolves the revision again """
+        self._root._tree_id = None
+
+    def iter_children(self):
+        yield from self.iter_subdirs()
+        yield from self.iter_files()
+
+    def iter_subdirs(self):
+        for name, entry in self._get_entries().items():
+            if entry.is_dir:
+                yield self._root._get_dir(self._join(name))
+
+    def iter_files(self):
+        for name, entry in self._get_entries().items():
+            if not entry.is_dir:
+                yield self._root._get_file(self._join(name))
+
+    def get_subdir(self, dname):
+        if self.has_subdir(dname):
+            return self._root._get_dir(self._join(dname))
+
+    def get_file(self, fname):
+        if self.has_file(fname):
+            return self._root._get_file(self._join(fname))
+
+    def has_subdir(self, dname):
+        entry = self._get_entries().get(dname, None)
+        return entry is not None and entry.is_dir
+
+    def has_file(self, fname):
+        entry = self._get_entries().get(fname, None)
+        return entry is not None and not entry.is_dir
+
+    def _get_entries(self) -> Mapping[str, GitEntry]:
+        tree_id = self._root._get_tree_id()
+        for name in self._path.split('/') if self._path else []:
+            entry = self._repository.list_tree(tree_id).get(name, None)
+            if entry is None or not entry.is_dir:
+                return {}  # removed in the revision
+            tree_id = entry.object_id
+        return self._repository.list_tree(tree_id)
+
+    def _join(self, name: str) -> str:
+        return self._path + '/' + name if self._path else name
+
+    # --- the top directory
+
+    def _get_tree_id(self) -> str:
+        if self._tree_id is None:
+            self._tree_id = self._repository.resolve_tree_id(self._rev)
+        return self._tree_id
+
+    def _join_path(self, path: str) -> str:
+        # the path of the work tree, so the module cache is shared by the revisions
+        return str(self._repository.repo_path) + '/' + path if path else str(self._repository.repo_path)
+
+    def _find_entry(self, path: str) -> Optional[GitEntry]:
+        dir_path, _, name = path.rpartition('/')
+        return self._get_dir(dir_path)._get_entries().get(name, None)
+
+    def _get_dir(self, path: str) -> 'GitDir':
+        git_dir = self._dirs.get(path, None)
+        if git_dir is None:
+            git_dir = self._dirs[path] = GitDir(self._repository, self._rev, self, path)
+        return git_dir
+
+    def _get_file(self, path: str) -> 'GitFile':
+        git_file = self._files.get(path, None)
+        if git_file is None:
+            git_file = self._files[path] = GitFile(self, path)
+        return git_file
+
+
+class GitFile(File):
+    """ a file of a revision. The blob id is its mtime, the content is read on demand. """
+
+    def __init__(self, root: GitDir, path: str):
+        self._root = root
+        self._path = path
+
+    def __reduce__(self):
+        return _find_git_member, (self._root._repository, self._root._get_tree_id(), self._path, False)
+
+    def __str__(self):
+        return self._root._join_path(self._path)
+
+    @property
+    def name(self):
+        return self._path.rpartition('/')[2]
+
+    @property
+    def stem(self):
+        return self.name.split('.')[0]
+
+    @property
+    def suffix(self):
+        return '.' + self.name.split('.')[-1]
+
+    @property
+    def dir_(self) -> GitDir:
+        return self._root._get_dir(self._path.rpartition('/')[0])
+
+    @property
+    def blob_id(self) -> str:
+        return self._get_entry().object_id
+
+    @property
+    def mtime(self):
+        return self.blob_id
+
+    @property
+    def size(self):
+        return self._get_entry().size
+
+    def read_bytes(self):
+        return self._root._repository.read_blob(self.blob_id)
+
+    def _get_entry(self) -> GitEntry:
+        entry = self._root._find_entry(self._path)
+        if entry is None or entry.is_dir:
+            raise Exception('{} was removed in {}'.format(self._path, self._root.rev))
+        return entry
+
+
+_repositories = {}  # type: Mapping[Path, GitRepository]  # one per process, p.e. in the workers
+_unpickled_roots = {}  # type: Mapping[Tuple[Path, str], GitDir]
+
+
+def _get_repository(repo_path: Path) -> GitRepository:
+    repository = _repositories.get(repo_path, None)
+    if repository is None:
+        repository = _repositories[repo_path] = GitRepository(repo_path)
+    return repository
+
+
+def _find_git_member(repository: GitRepository, tree_id: str, path: str, is_dir: bool):
+    root = _unpickled_roots.get((repository.repo_path, tree_id), None)
+    if root is None:
+        root = _unpickled_roots[repository.repo_path, tree_id] = repository.get_root_dir(tree_id)
+    return root._get_dir(path) if is_dir else root._get_file(path)
@@ -0,0 +1,114 @@
+from typing import Iterable, Iterator, Callable, List, Dict, Optional, TypeVar, Generic
+
+
+T = TypeVar('T')
+
+
+def iter_strongly_connected_components(nodes: Iterable[T],
+                                       get_successors: Callable[[T], Iterable[T]]) -> Iterator[List[T]]:
+    """ Tarjan's algorithm without recursion
+
+        The components are yielded in reverse topological order, i.e. a component comes after
+        all components, which are reachable from it.
+    """
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+
+    for root in nodes:
+        if root in index:
+            continue
+
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(get_successors(root)))]
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = lowlink[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(get_successors(successor))))
+                    break
+                elif successor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member is node:
+                            break
+                    yield component
+
+
+class Condensation(Generic[T]):
+    """ the strongly connected components of a graph and the DAG between them
+
+        The components are numbered in topological order: an edge between different components goes
+        always from a lower to a higher component index.
+    """
+
+    def __init__(self, nodes: Iterable[T], get_successors: Callable[[T], Iterable[T]]):
+        self._components = list(iter_strongly_connected_components(nodes, get_successors))
+        self._components.reverse()
+        self._component_indices = {}  # type: Dict[T, int]
+        for index, component in enumerate(self._components):
+            for node in component:
+                self._component_indices[node] = index
+
+        self._successors = []     # type: List[List[int]]
+        self._is_cyclic = []      # type: List[bool]
+        for index, component in enumerate(self._components):
+            successors = set()
+            is_cyclic = len(component) > 1
+            for node in component:
+                for successor in get_successors(node):
+                    successor_index = self._component_indices[successor]
+                    if successor_index != index:
+                        successors.add(successor_index)
+                    else:
+                        is_cyclic = True  # p.e. a function, which calls itself
+            self._successors.append(sorted(successors))
+            self._is_cyclic.append(is_cyclic)
+
+    @property
+    def num_components(self) -> int:
+        return len(self._components)
+
+    def get_component(self, index: int) -> List[T]:
+        return self._components[index]
+
+    def find_component_index(self, node: T) -> Optional[int]:
+        return self._component_indices.get(node, None)
+
+    def iter_components(self) -> Iterator[List[T]]:
+        """ yields the components in topological order """
+        yield from self._components
+
+    def iter_successor_indices(self, index: int) -> Iterator[int]:
+        """ yields the components, which the component has edges to """
+        yield from self._successors[index]
+
+    def is_cyclic(self, index: int) -> bool:
+        """ True, if the nodes of the component reach each other, p.e. recursive functions """
+        return self._is_cyclic[index]
+
+    def iter_cyclic_components(self) -> Iterator[List[T]]:
+        for index, component in enumerate(self._components):
+            if self._is_cyclic[index]:
+                yield component
+
+    def iter_nodes_in_topological_order(self) -> Iterator[T]:
+        """ a node comes before the nodes, which it reaches, except in cycles """
+        for component in self._components:
+            yield from component
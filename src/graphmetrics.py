@@ -0,0 +1,128 @@
+"""
+Export of the program call graph as CSR arrays and metrics over it.
+
+NumPy is optional. Without it (or with use_numpy=False) the functions return lists and compute the
+metrics in plain python, which gives the same results, but is much slower on large graphs.
+"""
+
+from typing import List, Optional, Tuple
+
+from moduleobjects import ProgCallGraph
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def has_numpy() -> bool:
+    return numpy is not None
+
+
+def export_csr(call_graph: ProgCallGraph, use_numpy: Optional[bool] = None) -> Tuple[object, object, List[str]]:
+    """ returns (indptr, indices, names): the callees of node i are indices[indptr[i]:indptr[i + 1]]
+
+        Each called node is contained once per caller, the node ids index into names (the fullnames).
+    """
+    names = [x.fullname for x in call_graph.iter_nodes()]
+    offsets, callee_ids = call_graph.forward_adjacency
+    if _use_numpy(use_numpy):
+        num_nodes = call_graph.num_nodes
+        offsets = numpy.asarray(offsets, dtype=numpy.int64)
+        callee_ids = numpy.asarray(callee_ids, dtype=numpy.int64)
+        caller_ids = numpy.repeat(numpy.arange(num_nodes, dtype=numpy.int64), numpy.diff(offsets))
+        # the callees of a caller are sorted, so repeated calls are neighbours
+        is_first = numpy.ones(len(callee_ids), dtype=bool)
+        is_first[1:] = (caller_ids[1:] != caller_ids[:-1]) | (callee_ids[1:] != callee_ids[:-1])
+        indices = callee_ids[is_first]
+        indptr = numpy.zeros(num_nodes + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(caller_ids[is_first], minlength=num_nodes), out=indptr[1:])
+        return indptr, indices, names
+
+    indptr = [0]
+    indices = []
+    for node_id in range(call_graph.num_nodes):
+        indices.extend(call_graph.iter_callee_ids(node_id))
+        indptr.append(len(indices))
+    return indptr, indices, names
+
+
+def calc_fan_out(indptr, use_numpy: Optional[bool] = None):
+    """ number of different callees per node """
+    if _use_numpy(use_numpy):
+        return numpy.diff(numpy.asarray(indptr))
+    return [indptr[i + 1] - indptr[i] for i in range(len(indptr) - 1)]
+
+
+def calc_fan_in(indptr, indices, use_numpy: Optional[bool] = None):
+    """ number of different callers per node """
+    num_nodes = len(indptr) - 1
+    if _use_numpy(use_numpy):
+        return numpy.bincount(numpy.asarray(indices), minlength=num_nodes)
+    fan_in = [0] * num_nodes
+    for callee_id in indices:
+        fan_in[callee_id] += 1
+    return fan_in
+
+
+def calc_pagerank(indptr, indices, damping: float = 0.85, tolerance: float = 1e-8, max_iterations: int = 100,
+                  use_numpy: Optional[bool] = None):
+    """ centrality by power iteration: a node is important, if important nodes call it
+
+        The rank of nodes without callees is spread over all nodes. The ranks sum up to 1.
+    """
+    num_nodes = len(indptr) - 1
+    if num_nodes == 0:
+        return numpy.zeros(0) if _use_numpy(use_numpy) else []
+    if _use_numpy(use_numpy):
+        return _calc_pagerank_numpy(numpy.asarray(indptr), numpy.asarray(indices), damping, tolerance,
+                                    max_iterations)
+    return _calc_pagerank_python(indptr, indices, damping, tolerance, max_iterations)
+
+
+def _calc_pagerank_numpy(indptr, indices, damping: float, tolerance: float, max_iterations: int):
+    num_nodes = len(indptr) - 1
+    fan_out = numpy.diff(indptr)
+    caller_ids = numpy.repeat(numpy.arange(num_nodes), fan_out)
+    is_dangling = fan_out == 0
+    edge_weights = 1.0 / fan_out[caller_ids]
+    ranks = numpy.full(num_nodes, 1.0 / num_nodes)
+    for _ in range(max_iterations):
+        new_ranks = numpy.bincount(indices, weights=ranks[caller_ids] * edge_weights, minlength=num_nodes)
+        new_ranks = damping * (new_ranks + ranks[is_dangling].sum() / num_nodes) + (1.0 - damping) / num_nodes
+        delta = numpy.abs(new_ranks - ranks).sum()
+        ranks = new_ranks
+        if delta < tolerance:
+            break
+    return ranks
+
+
+def _calc_pagerank_python(indptr, indices, damping: float, tolerance: float, max_iterations: int) -> List[float]:
+    num_nodes = len(indptr) - 1
+    ranks = [1.0 / num_nodes] * num_nodes
+    for _ in range(max_iterations):
+        new_ranks = [0.0] * num_nodes
+        dangling_rank = 0.0
+        for caller_id in range(num_nodes):
+            start, end = indptr[caller_id], indptr[caller_id + 1]
+            if start == end:
+                dangling_rank += ranks[caller_id]
+                continue
+            share = ranks[caller_id] / (end - start)
+            for i in range(start, end):
+                new_ranks[indices[i]] += share
+        base_rank = damping * dangling_rank / num_nodes + (1.0 - damping) / num_nodes
+        new_ranks = [damping * x + base_rank for x in new_ranks]
+        delta = sum(abs(x - y) for x, y in zip(new_ranks, ranks))
+        ranks = new_ranks
+        if delta < tolerance:
+            break
+    return ranks
+
+
+def _use_numpy(use_numpy: Optional[bool]) -> bool:
+    if use_numpy is None:
+        return numpy is not None
+    if use_numpy and numpy is None:
+        raise Exception('numpy is not installed')
+    return use_numpy
@@ -0,0 +1,248 @@
+from typing import Optional, Mapping, List
+from pathlib import Path
+from array import array
+import hashlib
+import io
+import os
+import pickle
+
+from filesystem import Dir, File, FileState
+from moduleobjects import Module, Symbol, SymbolPath, ClassDef, ClassRef, FuncDef, FuncRef, ProgContext, \
+    CallGraph, get_attribute_state
+
+
+CACHE_VERSION = 18
+
+
+class CacheEntry:
+    """ header of a cache file: file identity and the modules, the analysis depends on """
+
+    def __init__(self, path: str, file_state: FileState,
+                 imports: List[str], dependencies: Mapping[str, str]):
+        self.version = CACHE_VERSION
+        self.path = path
+        self.file_state = file_state
+        self.imports = imports            # type: List[str]  # imported modules in import order
+        self.dependencies = dependencies  # type: Mapping[str, str]  # module fullname -> source hash
+
+
+class StaleEntryError(Exception):
+    pass
+
+
+class ModuleCache:
+    """ persistent on-disk cache of analysed modules
+
+        Each module is stored in an own file. The header (CacheEntry) identifies
+        the source file by path, mtime, size and content hash. The module local
+        state (scopes, variables, types, expressions) is pickled behind the header.
+        References to symbols of other modules are stored by name and resolved
+        again, when the module is restored. The calls are not stored, because they
+        can dispatch to classes of modules, which are not imported. They are found
+        again after the restore.
+    """
+
+    def __init__(self, cache_dir: Path):
+        self._cache_dir = cache_dir
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_evictions = 0
+
+    @property
+    def cache_dir(self) -> Path:
+        return self._cache_dir
+
+    def find_entry(self, file_: File) -> Optional[CacheEntry]:
+        """ returns a valid entry for the file or None. Stale entries are evicted. """
+        entry_path = self._get_entry_path(file_)
+        if not entry_path.exists():
+            self.num_misses += 1
+            return
+
+        try:
+            with entry_path.open('rb') as fh:
+                entry = pickle.load(fh)
+        except Exception:
+            self.evict(file_)
+            return
+
+        if not self._is_entry_valid(entry, file_):
+            self.evict(file_)
+            return
+        return entry
+
+    def _is_entry_valid(self, entry: CacheEntry, file_: File) -> bool:
+        if not isinstance(entry, CacheEntry) or entry.version != CACHE_VERSION:
+            return False
+        if entry.path != str(file_):
+            return False
+        return entry.file_state.matches(file_)
+
+    def restore(self, module: Module, entry: CacheEntry) -> bool:
+        """ restores the state of the module. All dependencies must be loaded before. """
+        for dep_fullname, dep_hash in entry.dependencies.items():
+            dep_module = module.prog_context.find_module(dep_fullname)
+            if dep_module is None or dep_module.source_hash != dep_hash:
+                self.evict(module.file_)
+                return False
+
+        try:
+            with self._get_entry_path(module.file_).open('rb') as fh:
+                pickle.load(fh)  # skip header
+                _load_module_state(module, fh)
+        except Exception:
+            self.evict(module.file_)
+            return False
+
+        self._relink_derived_classes(module)
+        self.num_hits += 1
+        return True
+
+    def _relink_derived_classes(self, module: Module):
+        for class_def in module.iter_descendant_scopes(ClassDef):
+            for base_class in class_def.iter_bases():
+                if base_class.module is not module:
+                    base_class.add_derived(class_def)
+
+    def store(self, module: Module) -> None:
+        file_ = module.file_
+        entry = CacheEntry(path=str(file_), file_state=FileState.of(file_, module.source_hash),
+                           imports=[x.fullname for x in module.iter_imported_modules()],
+                           dependencies=self._calc_dependencies(module))
+        entry_path = self._get_entry_path(file_)
+        tmp_path = entry_path.with_suffix('.tmp')
+        try:
+            with tmp_path.open('wb') as fh:
+                pickle.dump(entry, fh, protocol=pickle.HIGHEST_PROTOCOL)
+                _dump_module_state(module, fh)
+            os.replace(str(tmp_path), str(entry_path))
+        except (pickle.PicklingError, RecursionError, TypeError, OSError):
+            # the module is not cachable or the cache is not writable, the build goes on without entry
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def _calc_dependencies(self, module: Module) -> Mapping[str, str]:
+        dependencies = {}
+        todo = list(module.iter_imported_modules())
+        while todo:
+            dep_module = todo.pop()
+            if dep_module is module or dep_module.fullname in dependencies:
+                continue
+            dependencies[dep_module.fullname] = dep_module.source_hash
+            todo.extend(dep_module.iter_imported_modules())
+        return dependencies
+
+    def evict(self, file_: File) -> None:
+        entry_path = self._get_entry_path(file_)
+        if entry_path.exists():
+            entry_path.unlink()
+            self.num_evictions += 1
+        self.num_misses += 1
+
+    def clear(self) -> None:
+        for entry_path in self._cache_dir.glob('*.pickle'):
+            entry_path.unlink()
+
+    def _get_entry_path(self, file_: File) -> Path:
+        key = hashlib.sha1(str(file_).encode('utf-8')).hexdigest()
+        return self._cache_dir / (key + '.pickle')
+
+
+def dumps_module_state(module: Module) -> bytes:
+    """ pickles the state of the module without the state of other modules """
+    fh = io.BytesIO()
+    _dump_module_state(module, fh)
+    return fh.getvalue()
+
+
+def loads_module_state(module: Module, buf: bytes) -> None:
+    _load_module_state(module, io.BytesIO(buf))
+
+
+def _dump_module_state(module: Module, fh) -> None:
+    # the source is read again from the file on demand, the calls are found again
+    state = {k: v for k, v in get_attribute_state(module).items()
+             if k not in ('_file', '_prog_context', '_buf', '_lines')}
+    state['_call_graph'] = CallGraph()
+    _ModulePickler(fh, module).dump(state)
+
+
+def _load_module_state(module: Module, fh) -> None:
+    state = _ModuleUnpickler(fh, module).load()
+    for name, value in state.items():
+        setattr(module, name, value)
+
+
+_PLAIN_TYPES = frozenset([str, int, bool, float, tuple, list, dict, bytes, array, type(None)])
+
+
+class _ModulePickler(pickle.Pickler):
+
+    def __init__(self, fh, module: Module):
+        super().__init__(fh, protocol=pickle.HIGHEST_PROTOCOL)
+        self._module = module
+
+    def persistent_id(self, obj):
+        if type(obj) in _PLAIN_TYPES:  # most objects, so they are checked first
+            return None
+        elif obj is self._module:
+            return 'self',
+        elif obj is self._module.file_:
+            return 'file',
+        elif obj is self._module.prog_context:
+            return 'context',
+        elif isinstance(obj, (File, Dir, ProgContext)):
+            raise pickle.PicklingError('foreign {} in {}'.format(type(obj).__name__, self._module.fullname))
+        elif isinstance(obj, Module):
+            return 'module', obj.fullname
+        elif isinstance(obj, Symbol):
+            obj_module = obj.module
+            if obj_module is not self._module:
+                return 'symbol', obj_module.fullname, obj.path.parts[len(obj_module.path):]
+        elif isinstance(obj, (ClassRef, FuncRef)):
+            symbol = obj.class_def if isinstance(obj, ClassRef) else obj.func_def
+            obj_module = symbol.module
+            if obj_module is not self._module:  # keep the reference canonical
+                return 'ref', obj_module.fullname, symbol.path.parts[len(obj_module.path):]
+
+
+class _ModuleUnpickler(pickle.Unpickler):
+
+    def __init__(self, fh, module: Module):
+        super().__init__(fh)
+        self._module = module
+
+    def persistent_load(self, pid):
+        kind = pid[0]
+        if kind == 'self':
+            return self._module
+        elif kind == 'file':
+            return self._module.file_
+        elif kind == 'context':
+            return self._module.prog_context
+        elif kind == 'module':
+            found_module = self._module.prog_context.find_module(pid[1])
+            if found_module is None:
+                raise StaleEntryError(pid[1])
+            return found_module
+        elif kind == 'symbol':
+            return self._find_symbol(pid[1], pid[2])
+        elif kind == 'ref':
+            symbol = self._find_symbol(pid[1], pid[2])
+            if isinstance(symbol, ClassDef):
+                return symbol.class_ref
+            elif isinstance(symbol, FuncDef):
+                return symbol.func_ref
+            raise StaleEntryError('.'.join([pid[1]] + list(pid[2])))
+        raise pickle.UnpicklingError('unknown persistent id {}'.format(pid))
+
+    def _find_symbol(self, module_fullname: str, path_parts) -> Symbol:
+        found_module = self._module.prog_context.find_module(module_fullname)
+        if found_module is None:
+            raise StaleEntryError(module_fullname)
+        symbol = found_module.find_local_symbol_by_path(SymbolPath(list(path_parts)))
+        if symbol is None:
+            raise StaleEntryError('.'.join([module_fullname] + list(path_parts)))
+        return symbol
+
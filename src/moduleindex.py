@@ -0,0 +1,93 @@
+"""
+Index of the importable modules over ordered search directories, like sys.path.
+"""
+
+from typing import List, Mapping, Optional, Set, Iterator
+
+from filesystem import Dir, File, NamespacePackageFile
+
+
+class ModuleIndex:
+    """ maps dotted module names to their files
+
+        The search directories are searched in order like sys.path: the first regular package (a
+        directory with __init__.py) or module (name.py) wins, within a directory the package comes
+        first. Directories without __init__.py are the portions of a namespace package, if no search
+        directory has a regular package or module of that name. The modules of a namespace package
+        are found in all portions.
+
+        The directories of a package are listed, when a name in the package is looked up the first
+        time. So each directory is listed once and the later lookups are dict lookups.
+    """
+
+    def __init__(self, search_dirs: List[Dir]):
+        self._files = {}  # type: Mapping[str, File]  # module fullname -> file
+        self._package_dirs = {'': list(search_dirs)}  # type: Mapping[str, List[Dir]]  # packages to list
+        self._listed_packages = set()  # type: Set[str]
+
+    def find_module_file(self, module_fullname: str) -> Optional[File]:
+        """ returns the file of a module or package, the file of a namespace package has no content """
+        file_ = self._files.get(module_fullname, None)
+        if file_ is None:
+            package_fullname = module_fullname.rpartition('.')[0]
+            if package_fullname not in self._listed_packages:
+                self._list_package(package_fullname)
+                file_ = self._files.get(module_fullname, None)
+        return file_
+
+    def iter_module_names(self) -> Iterator[str]:
+        """ yields the names of all modules, all packages are listed for that """
+        todo = list(self._package_dirs)
+        while todo:
+            self._list_package(todo.pop())
+            todo.extend(self._package_dirs)
+        yield from self._files
+
+    def _list_package(self, package_fullname: str) -> None:
+        if package_fullname in self._listed_packages:
+            return
+        if package_fullname not in self._package_dirs:
+            if not package_fullname:
+                return
+            self._list_package(package_fullname.rpartition('.')[0])
+            if package_fullname not in self._package_dirs:
+                return  # not a package
+        self._listed_packages.add(package_fullname)
+        package_dirs = self._package_dirs.pop(package_fullname)
+        for name in _iter_module_names(package_dirs):
+            self._add_module(package_fullname + '.' + name if package_fullname else name, name, package_dirs)
+
+    def _add_module(self, module_fullname: str, name: str, package_dirs: List[Dir]) -> None:
+        namespace_dirs = []
+        for package_dir in package_dirs:
+            subdir = package_dir.get_subdir(name)
+            if subdir is not None:
+                init_file = subdir.get_file('__init__.py')
+                if init_file is not None:
+                    self._files[module_fullname] = init_file
+                    self._package_dirs[module_fullname] = [subdir]
+                    return
+            module_file = package_dir.get_file(name + '.py')
+            if module_file is not None:
+                self._files[module_fullname] = module_file
+                return
+            if subdir is not None:
+                namespace_dirs.append(subdir)
+
+        if namespace_dirs:
+            self._files[module_fullname] = NamespacePackageFile(namespace_dirs[0])
+            self._package_dirs[module_fullname] = namespace_dirs
+
+
+def _iter_module_names(package_dirs: List[Dir]) -> Iterator[str]:
+    names = set()
+    for package_dir in package_dirs:
+        for subdir in package_dir.iter_subdirs():
+            names.add(subdir.name)
+        for file_ in package_dir.iter_files():
+            stem, _, suffix = file_.name.rpartition('.')
+            if suffix == 'py':
+                names.add(stem)
+    names.discard('__init__')
+    names.discard('__pycache__')
+    return (x for x in sorted(names) if x.isidentifier())
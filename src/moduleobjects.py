@@ -1,10 +1,21 @@
-from typing import List, Optional, Iterator, Mapping
+from typing import List, Optional, Iterator, Iterable, Mapping, Set, FrozenSet, Tuple, Union
+from array import array
+from collections import namedtuple
 import ast
+import itertools
+import sys
 
-from filesystem import Dir, File
+from filesystem import Dir, File, calc_source_hash, decode_source
+from graphalgo import Condensation
+from moduleindex import ModuleIndex
+
+
+# The model uses __slots__ and creates the containers of a scope, when the first element is added,
+# because most scopes are small functions. Only Module keeps an instance dict.
 
 
 class SymbolPath:
+    __slots__ = ('_parts',)
 
     def __init__(self, parts: List[str]):
         assert isinstance(parts, list)
@@ -61,9 +72,11 @@ class SymbolPath:
         
 
 class Symbol:
+    __slots__ = ('_name', '_fullname')
 
     def __init__(self, name: str):
-        self._name = name  # type: str
+        self._name = sys.intern(name)  # type: str
+        self._fullname = None           # type: Optional[str]  # calculated on first use
 
     @property
     def name(self) -> str:
@@ -71,198 +84,462 @@ class Symbol:
 
     @property
     def fullname(self) -> str:
-        return self.path.fullname
+        if self._fullname is None:
+            self._fullname = sys.intern(self._calc_fullname())
+        return self._fullname
+
+    def _calc_fullname(self) -> str:
+        raise Exception('not implemented.')
 
     @property
     def path(self) -> SymbolPath:
+        fullname = self.fullname
+        return SymbolPath(fullname.split('.') if fullname else [])
+
+    @property
+    def module(self) -> 'Module':
         raise Exception('not implemented.')
 
 
 class Scope(Symbol):
+    __slots__ = ('_parent_scope', '_child_scopes', '_classes', '_functions', '_variables',
+                 '_symbol_table', '_resolved_names', '_resolved_generation')
+
+    # incremented, when a symbol is bound anywhere. The resolved names of a scope are valid,
+    # as long as their generation is the current one.
+    _symbol_generation = 0
 
-    def __init__(self, name: str, parent: Optional['Scope'], ast_node: ast.AST = None):
+    def __init__(self, name: str, parent: Optional['Scope']):
         super().__init__(name)
         self._parent_scope = parent  # type: Scope
-        self._child_scopes = []      # type: List[Scope]
-        self._classes = {}           # type: Mapping[str, ClassDef]
-        self._functions = {}         # type: Mapping[str, FuncDef]
-        self._variables = {}         # type: Mapping[str, Variable]
-        self._ast_node = ast_node    # type: ast.AST
-        self._calls = []             # type: List[Call]
-        self._symbol_table = {}      # type: Mapping[str, Symbol]
+        self._child_scopes = None    # type: Optional[List[Scope]]
+        self._classes = None         # type: Optional[Mapping[str, ClassDef]]
+        self._functions = None       # type: Optional[Mapping[str, FuncDef]]
+        self._variables = None       # type: Optional[Mapping[str, Variable]]
+        self._symbol_table = None    # type: Optional[Mapping[str, Symbol]]
+        self._resolved_names = None  # type: Optional[Mapping[str, Optional[Symbol]]]  # names of the parents
+        self._resolved_generation = 0
+
+    def __getstate__(self):
+        state = get_attribute_state(self)
+        state['_resolved_names'] = None  # the generation is only valid in this process
+        return None, state
 
     def __str__(self):
-        return str(self.path)
+        return self.fullname
 
     def clear(self):
-        self._child_scopes.clear()
-        self._classes.clear()
-        self._functions.clear()
-        self._variables.clear()
-        self._calls.clear()
-        self._symbol_table.clear()
+        self._child_scopes = None
+        self._classes = None
+        self._functions = None
+        self._variables = None
+        self._symbol_table = None
 
     def add_child_scope(self, child_scope: 'Scope'):
+        if self._child_scopes is None:
+            self._child_scopes = []
         self._child_scopes.append(child_scope)
-        self._symbol_table[child_scope.name] = child_scope
+        self._set_symbol(child_scope.name, child_scope)
 
     def add_class(self, class_def_node: ast.ClassDef):
         cls_name = class_def_node.name
+        if self._classes is None:
+            self._classes = {}
         assert cls_name not in self._classes
         new_class = ClassDef(class_def_node, parent=self)
-        self._classes[cls_name] = new_class
+        self._classes[new_class.name] = new_class
         self.add_child_scope(new_class)
         return new_class
 
     def add_function(self, func_def_node: ast.FunctionDef) -> 'FuncDef':
         func_name = func_def_node.name
+        if self._functions is None:
+            self._functions = {}
         assert func_name not in self._functions
         new_func = FuncDef(func_def_node, parent=self)
-        self._functions[func_name] = new_func
+        self._functions[new_func.name] = new_func
         self.add_child_scope(new_func)
         return new_func
 
     def add_ann_assign_variable(self, var_name: str, ann_assign_node: ast.AnnAssign) -> 'AnnAssignVariable':
-        assert var_name not in self._variables
-        new_var = AnnAssignVariable(var_name, ann_assign_node, scope=self)
-        self._variables[var_name] = new_var
-        self._symbol_table[var_name] = new_var
-        return new_var
+        assert self.find_variable(var_name) is None
+        return self._add_variable(AnnAssignVariable(var_name, ann_assign_node.annotation, scope=self))
 
     def add_assign_variable(self, var_name: str) -> Optional['Variable']:
-        if var_name in self._variables:
+        if self.find_variable(var_name) is not None:
             return
-        new_var = Variable(var_name, var_type=None, scope=self)
-        self._variables[var_name] = new_var
-        self._symbol_table[var_name] = new_var
+        return self._add_variable(AssignVariable(var_name, scope=self))
+
+    def _add_variable(self, new_var: 'Variable') -> 'Variable':
+        if self._variables is None:
+            self._variables = {}
+        self._variables[new_var.name] = new_var
+        self._set_symbol(new_var.name, new_var)
         return new_var
 
     def add_symbol(self, name, symbol: Symbol):
-        assert name not in self._symbol_table
-        self._symbol_table[name] = symbol
+        assert self.find_local_symbol_by_name(name) is None
+        self._set_symbol(name, symbol)
+
+    def _set_symbol(self, name: str, symbol) -> None:
+        if self._symbol_table is None:
+            self._symbol_table = {}
+        self._symbol_table[sys.intern(name)] = symbol
+        Scope._symbol_generation += 1
+
+    def _remove_symbol(self, name: str) -> None:
+        del self._symbol_table[name]
+        Scope._symbol_generation += 1  # the memorised names can refer to the symbol
 
     @property
     def parent_scope(self) -> Optional['Scope']:
         return self._parent_scope
 
-    @property
-    def path(self) -> SymbolPath:
-        if self._parent_scope:
-            return self._parent_scope.path + self.name
-        else:
-            if self.name:
-                return SymbolPath([self.name])
-            else:
-                return SymbolPath([])
+    def _calc_fullname(self) -> str:
+        if self._parent_scope is not None:
+            return _join_names(self._parent_scope.fullname, self.name)
+        return self.name
 
     @property
-    def ast_node(self):
-        return self._ast_node
+    def module(self) -> 'Scope':  # the root scope, normally a Module
+        scope = self
+        while scope._parent_scope is not None:
+            scope = scope._parent_scope
+        return scope
 
     def iter_child_scopes(self) -> Iterator['Scope']:
-        yield from self._child_scopes
+        if self._child_scopes is not None:
+            yield from self._child_scopes
+
+    def iter_descendant_scopes(self, scope_type: type = None) -> Iterator['Scope']:
+        for child_scope in self.iter_child_scopes():
+            if scope_type is None or isinstance(child_scope, scope_type):
+                yield child_scope
+            yield from child_scope.iter_descendant_scopes(scope_type)
 
     def iter_variables(self) -> Iterator['Variable']:
-        yield from self._variables.values()
+        if self._variables is not None:
+            yield from self._variables.values()
+
+    def find_variable(self, var_name: str) -> Optional['Variable']:
+        return self._variables.get(var_name, None) if self._variables is not None else None
+
+    def release_ast_nodes(self):
+        """ drops the ast nodes, which only linking and typing need """
+        for var in self.iter_variables():
+            var.release_anno_node()
 
     def iter_simple_symbols(self):  # = variables ?!
         yield
 
     def find_class_def(self, class_name):
-        return self._classes.get(class_name, None)
+        return self._classes.get(class_name, None) if self._classes is not None else None
 
     def find_function_def(self, func_name):
-        return self._functions.get(func_name, None)
+        return self._functions.get(func_name, None) if self._functions is not None else None
 
     def iter_calls_from_here(self) -> Iterator['Call']:
-        yield from self._calls
+        yield from self.module.prog_context.call_graph.iter_calls_from(self)
 
     def iter_calls_to_me(self) -> Iterator['Call']:
-        yield
+        yield from self.module.prog_context.call_graph.iter_calls_to(self)
 
     def add_symbol_annotation(self, name: str, anno_node: ast.AST):
-        self._symbol_table[name] = anno_node
+        self._set_symbol(name, anno_node)
 
     def find_symbol_annotation(self, name: str) -> Optional[ast.AST]:
-        return self._symbol_table.get(name, None)
+        return self.find_local_symbol_by_name(name)
 
     def find_local_symbol_by_name(self, name: str) -> Optional[Symbol]:
-        return self._symbol_table.get(name, None)
+        return self._symbol_table.get(name, None) if self._symbol_table is not None else None
+
+    def iter_local_symbols(self) -> Iterator[Tuple[str, Symbol]]:
+        if self._symbol_table is not None:
+            yield from self._symbol_table.items()
 
     def find_local_symbol_by_fullname(self, fullname: str) -> Optional[Symbol]:
         return self.find_local_symbol_by_path(SymbolPath(fullname.split('.')))
 
     def find_local_symbol_by_path(self, symb_path: SymbolPath) -> Optional[Symbol]:
-        n = len(symb_path)
-        if n == 0:
+        if len(symb_path) == 0:
             return
+        return _find_sub_symbol(self, symb_path.parts)
 
-        symbol = self.find_local_symbol_by_name(symb_path.head)
-        if symbol is None:
+    def find_symbol_by_name(self, name: str) -> Optional[Symbol]:
+        """ finds the symbol, which the name refers to in this scope
+
+            Like in python, the names of an enclosing class are not visible in the nested scopes.
+            The names, which are found in the parents (or not at all, p.e. builtins), are memorised
+            until a symbol is bound anywhere.
+        """
+        symbol_table = self._symbol_table
+        if symbol_table is not None and name in symbol_table:
+            return symbol_table[name]
+        if self._parent_scope is None:
             return
 
-        if n == 1:
-            return symbol
-
-        return symbol.find_local_symbol_by_path(symb_path.tail)
-
-    def find_symbol_by_name(self, name: str) -> Optional[Symbol]:
-        if name in self._symbol_table:
-            return self._symbol_table[name]
-        if self.parent_scope is not None:
-            return self.parent_scope.find_symbol_by_name(name)
+        resolved_names = self._resolved_names
+        if resolved_names is None or self._resolved_generation != Scope._symbol_generation:
+            resolved_names = self._resolved_names = {}
+            self._resolved_generation = Scope._symbol_generation
+        elif name in resolved_names:
+            return resolved_names[name]
+
+        symbol = None
+        scope = self._parent_scope
+        while scope is not None:
+            symbol_table = scope._symbol_table
+            if symbol_table is not None and name in symbol_table and not isinstance(scope, ClassDef):
+                symbol = symbol_table[name]
+                break
+            scope = scope._parent_scope
+        resolved_names[name] = symbol
+        return symbol
 
     def find_symbol_by_fullname(self, fullname: str) -> Optional[Symbol]:
         return self.find_symbol_by_path(SymbolPath(fullname.split('.')))
 
     def find_symbol_by_path(self, symb_path: SymbolPath) -> Optional[Symbol]:
-        n = len(symb_path)
-        if n == 0:
+        """ finds the first name like find_symbol_by_name and the others as members, p.e. 'os.path.join' """
+        if len(symb_path) == 0:
             return
-
-        name = symb_path.head
-        if name in self._symbol_table:
-            return self.find_local_symbol_by_path(symb_path.tail)
-
-        if self.parent_scope is not None:
-            return self.parent_scope.find_symbol_by_name(name)
+        symbol = self.find_symbol_by_name(symb_path.head)
+        if symbol is None:
+            return
+        return _find_sub_symbol(symbol, symb_path.parts[1:])
 
 
 class ProgContext:
 
-    def __init__(self, root_dir: Dir, module_map: Mapping[str, 'Module']):
+    def __init__(self, root_dir: Dir, module_map: Mapping[str, 'Module'], module_cache=None,
+                 search_dirs: Optional[List[Dir]] = None, keep_sources: bool = True):
         self._root_dir = root_dir
+        self._keep_sources = keep_sources  # type: bool  # False: modules are parsed from a memory map
+        if search_dirs is None:
+            search_dirs = [root_dir] if root_dir is not None else []
+        self._search_dirs = search_dirs    # type: List[Dir]  # ordered like sys.path
+        self._module_index = None          # type: Optional[ModuleIndex]  # built on first use
         self._module_map = module_map
+        self._module_cache = module_cache  # type: Optional[ModuleCache]
+        self._symbol_index = None          # type: Optional[Mapping[str, Symbol]]  # built on first use
+        self._call_graph = None            # type: Optional[ProgCallGraph]  # built on first use
+        self._class_hierarchy = None       # type: Optional[ClassHierarchy]  # built on first use
 
     @property
     def root_dir(self):
         return self._root_dir
 
+    @property
+    def module_cache(self):
+        return self._module_cache
+
+    @property
+    def keep_sources(self) -> bool:
+        return self._keep_sources
+
+    @property
+    def search_dirs(self) -> List[Dir]:
+        return self._search_dirs
+
+    @property
+    def module_index(self) -> ModuleIndex:
+        """ the importable modules of the search dirs """
+        if self._module_index is None:
+            self._module_index = ModuleIndex(self._search_dirs)
+        return self._module_index
+
+    def find_module_file(self, module_fullname: str) -> Optional[File]:
+        """ returns the file of a module or package, which is not necessarily loaded """
+        return self.module_index.find_module_file(module_fullname)
+
+    def refresh(self):
+        """ forgets the directory listings and the module index, p.e. before an update """
+        for search_dir in self._search_dirs:
+            search_dir.refresh()
+        self._module_index = None
+
     def add_module(self, module: 'Module'):
         assert module.fullname not in self._module_map
         self._module_map[module.fullname] = module
+        self.invalidate_indices()
+        self.invalidate_class_hierarchy()
+
+    def remove_module(self, module: 'Module'):
+        assert self._module_map.get(module.fullname, None) is module
+        del self._module_map[module.fullname]
+        self.invalidate_indices()
+        self.invalidate_class_hierarchy()
 
     def find_module(self, fullname: str):
         return self._module_map.get(fullname, None)
 
+    def find_symbol(self, fullname: str) -> Optional[Symbol]:
+        """ finds a module, class, function or variable, which is defined at fullname, p.e. 'a.b.C.f' """
+        if self._symbol_index is None:
+            self._symbol_index = self._build_symbol_index()
+        return self._symbol_index.get(fullname, None)
+
+    @property
+    def call_graph(self) -> 'ProgCallGraph':
+        """ the calls of all modules """
+        if self._call_graph is None:
+            self._call_graph = ProgCallGraph(self._module_map.values())
+        return self._call_graph
+
+    def invalidate_indices(self):
+        """ must be called, when symbols or calls were added or removed """
+        self._symbol_index = None
+        self._call_graph = None
+
+    @property
+    def class_hierarchy(self) -> 'ClassHierarchy':
+        """ the transitive subclasses and the method resolution orders of all classes """
+        if self._class_hierarchy is None:
+            self._class_hierarchy = ClassHierarchy(self._module_map.values())
+        return self._class_hierarchy
+
+    def invalidate_class_hierarchy(self):
+        """ must be called, when bases or derived classes were added or removed """
+        self._class_hierarchy = None
+
+    def _build_symbol_index(self) -> Mapping[str, Symbol]:
+        symbol_index = {}
+        for module in self._module_map.values():
+            symbol_index[module.fullname] = module
+            for scope in itertools.chain([module], module.iter_descendant_scopes()):
+                symbol_index[scope.fullname] = scope
+                for var in scope.iter_variables():
+                    symbol_index[var.fullname] = var
+        return symbol_index
+
+    def iter_modules(self) -> Iterator['Module']:
+        yield from self._module_map.values()
+
 
 class Module(Scope):
+    # no __slots__: a module has few instances and its state is pickled by the module cache as dict
 
     def __init__(self, name: str, file_: File, prog_context: ProgContext):
         super().__init__(name, parent=None)
         self._file = file_                 # type: File
         self._prog_context = prog_context  # type: ProgContext
-        self._buf = None                   # type: Optional[str]
+        self._ast_node = None              # type: Optional[ast.Module]  # only while the scopes are built
+        self._buf = None                   # type: Optional[bytes]  # raw source, if kept
+        self._lines = None                 # type: Optional[List[str]]  # built on first use
+        self._source_hash = None           # type: Optional[str]
         self._call_graph = CallGraph()     # type: Optional[CallGraph]
-        
+        self._import_nodes = []            # type: List[Tuple[Scope, ast.AST]]
+        self._expr_table = ExprTable()     # type: ExprTable
+        self._expr_worklists = []          # type: List[Tuple[Scope, List[int]]]
+        self._imported_modules = []        # type: List[Module]
+        self._unresolved_imports = []      # type: List[str]
+        self._main_blocks = []             # type: List[Tuple[int, int]]  # first and last line
+        self._hierarchy_signature = None   # type: Optional[str]
+
     def read(self):
         self.clear()
-        self._buf = self._file.read()
-        self._lines = self._buf.split('\n')
-        self._ast_node = ast.parse(self._buf)
+        self._import_nodes.clear()
+        self._expr_table = ExprTable()
+        self._expr_worklists.clear()
+        self._imported_modules.clear()
+        self._unresolved_imports.clear()
+        self._main_blocks.clear()
+        self._call_graph = CallGraph()
+        self._lines = None
+        if self._prog_context.keep_sources:
+            self._buf = self._file.read_bytes()
+            self._parse(self._buf)
+        else:
+            self._buf = None
+            with self._file.open_bytes() as buf:
+                self._parse(buf)
+
+    def _parse(self, buf):
+        # the parser detects the encoding of the bytes (PEP 263)
+        self._source_hash = calc_source_hash(buf)
+        self._ast_node = ast.parse(buf)
 
     @property
-    def lines(self):
+    def ast_node(self) -> Optional[ast.Module]:
+        return self._ast_node
+
+    def release_syntax_tree(self):
+        """ drops the ast, when the scopes are built. They keep the nodes, which linking and typing need. """
+        self._ast_node = None
+
+    def release_ast_nodes(self):
+        """ drops the remaining ast nodes, when the calls are found. Only the scopes and expressions remain. """
+        super().release_ast_nodes()
+        self._import_nodes = []
+        for scope in self.iter_descendant_scopes():
+            scope.release_ast_nodes()
+
+    def release_source(self):
+        """ frees the source and its lines, they are read again from the file on demand """
+        self._buf = None
+        self._lines = None
+
+    def add_import_node(self, scope: Scope, import_node: ast.AST):
+        self._import_nodes.append((scope, import_node))
+
+    def iter_import_nodes(self) -> Iterator[Tuple[Scope, ast.AST]]:
+        yield from self._import_nodes
+
+    @property
+    def expr_table(self) -> 'ExprTable':
+        return self._expr_table
+
+    def add_expr_worklist(self, scope: Scope, expr_indices: List[int]):
+        self._expr_worklists.append((scope, expr_indices))
+
+    def iter_expr_worklists(self) -> Iterator[Tuple[Scope, List[int]]]:
+        yield from self._expr_worklists
+
+    def add_imported_module(self, module: 'Module'):
+        if module is not self and module not in self._imported_modules:
+            self._imported_modules.append(module)
+
+    def iter_imported_modules(self) -> Iterator['Module']:
+        yield from self._imported_modules
+
+    def add_unresolved_import(self, module_fullname: str):
+        if module_fullname not in self._unresolved_imports:
+            self._unresolved_imports.append(module_fullname)
+
+    def iter_unresolved_imports(self) -> Iterator[str]:
+        yield from self._unresolved_imports
+
+    def add_main_block(self, first_lineno: int, last_lineno: int):
+        """ registers the lines of an "if __name__ == '__main__':" block """
+        self._main_blocks.append((first_lineno, last_lineno))
+
+    @property
+    def has_main_block(self) -> bool:
+        return len(self._main_blocks) > 0
+
+    def is_in_main_block(self, lineno: int) -> bool:
+        return any(first <= lineno <= last for first, last in self._main_blocks)
+
+    def forget_modules(self, modules: Set['Module']) -> bool:
+        """ removes all references to the given modules, p.e. before they are rebuilt
+
+            Returns True, if call targets or derived classes were removed. The calls of the module must
+            be found again then, when the modules are rebuilt.
+        """
+        for name, symbol in list(self.iter_local_symbols()):
+            if isinstance(symbol, Symbol) and symbol.module in modules:
+                self._remove_symbol(name)
+        self._imported_modules = [x for x in self._imported_modules if x not in modules]
+        is_pruned = False
+        for class_def in self.iter_descendant_scopes(ClassDef):
+            is_pruned |= class_def.remove_derived_of_modules(modules)
+        is_pruned |= self._call_graph.remove_calls_to_modules(modules)
+        return is_pruned
+
+    @property
+    def lines(self) -> List[str]:
+        if self._lines is None:
+            self._lines = self.source.split('\n')
         return self._lines
 
     @property
@@ -283,12 +560,30 @@ class Module(Scope):
 
     @property
     def source(self) -> str:
-        return self._buf
+        """ the decoded source, it is read again from the file, if it is not kept """
+        return decode_source(self._buf) if self._buf is not None else self._file.read()
+
+    @property
+    def source_hash(self) -> Optional[str]:
+        return self._source_hash
+
+    def set_source_hash(self, source_hash: str):  # for modules, which are not read yet
+        self._source_hash = source_hash
+
+    @property
+    def hierarchy_signature(self) -> Optional[str]:
+        return self._hierarchy_signature
+
+    def set_hierarchy_signature(self, hierarchy_signature: str):
+        self._hierarchy_signature = hierarchy_signature
 
     @property
     def call_graph(self):
         return self._call_graph
 
+    def set_call_graph(self, call_graph: 'CallGraph'):
+        self._call_graph = call_graph
+
     def find_scope_at_position(self, lineno: int, col_offset: int) -> Scope:
         pass
         
@@ -297,18 +592,84 @@ class Module(Scope):
         
             
 class ClassDef(Scope):
+    __slots__ = ('lineno', '_base_nodes', '_bases', '_derived', '_class_ref', '_member_table')
 
     def __init__(self, ast_node: ast.ClassDef, parent: Scope):
-        super().__init__(ast_node.name, parent, ast_node)
+        super().__init__(ast_node.name, parent)
         self.lineno = ast_node.lineno   # type: int
+        self._base_nodes = ast_node.bases  # type: List[ast.AST]  # until the module is linked
         self._bases = []                # type: List[ClassDef]
         self._derived = []      # type: List[ClassDef]
+        self._class_ref = ClassRef(self)  # the only ClassRef, which is created for this class
+        self._member_table = None       # type: Optional[Mapping[str, Symbol]]  # built on first use
 
-    def add_base(self, base_class: 'ClassDef'):
-        self._bases.append(base_class)
+    def __getstate__(self):
+        # derived classes of other modules are linked again, when these modules are loaded
+        _, state = super().__getstate__()
+        state['_derived'] = [x for x in self._derived if x.module is self.module]
+        state['_member_table'] = None
+        return None, state
+
+    @property
+    def base_nodes(self) -> List[ast.AST]:
+        return self._base_nodes
+
+    def release_ast_nodes(self):
+        super().release_ast_nodes()
+        self._base_nodes = []
+
+    def set_bases(self, base_classes: List['ClassDef']):
+        """ the bases in the order of the class statement """
+        self._bases = base_classes
+        self._invalidate_member_tables()
+        self.module.prog_context.invalidate_class_hierarchy()
+
+    def _set_symbol(self, name: str, symbol) -> None:
+        super()._set_symbol(name, symbol)
+        self._invalidate_member_tables()
+
+    def _remove_symbol(self, name: str) -> None:
+        super()._remove_symbol(name)
+        self._invalidate_member_tables()
+
+    def find_member(self, name: str) -> Optional[Symbol]:
+        """ finds a local or inherited attribute. The bases are searched in the method resolution order. """
+        if not self._bases:
+            return self.find_local_symbol_by_name(name)
+        if self._member_table is None:
+            self._member_table = self._build_member_table()
+        return self._member_table.get(name, None)
+
+    def _build_member_table(self) -> Mapping[str, Symbol]:
+        member_table = {}
+        for class_def in reversed(self.get_mro()):  # the nearest class wins
+            member_table.update(class_def.iter_local_symbols())
+        return member_table
+
+    def _invalidate_member_tables(self):
+        """ the member tables of the derived classes contain the members of this class """
+        visited = set()
+        todo = [self]
+        while todo:
+            class_def = todo.pop()
+            if class_def not in visited:
+                visited.add(class_def)
+                class_def._member_table = None
+                todo.extend(class_def._derived)
 
     def add_derived(self, derived_class: 'ClassDef'):
         self._derived.append(derived_class)
+        self.module.prog_context.invalidate_class_hierarchy()
+
+    def remove_derived_of_modules(self, modules: Set['Module']) -> bool:
+        """ returns True, if derived classes were removed """
+        num_derived = len(self._derived)
+        self._derived = [x for x in self._derived if x.module not in modules]
+        if len(self._derived) == num_derived:
+            return False
+        self._invalidate_member_tables()
+        self.module.prog_context.invalidate_class_hierarchy()
+        return True
 
     def iter_bases(self):
         yield from self._bases
@@ -317,42 +678,67 @@ class ClassDef(Scope):
         yield from self._derived
 
     def iter_self_and_derived(self):
-        yield self
-        yield from self._derived
+        """ yields the class and the classes, which derive from it directly or indirectly """
+        yield from self.module.prog_context.class_hierarchy.get_subclasses(self)
+
+    def is_subclass_of(self, base_class: 'ClassDef') -> bool:
+        return self.module.prog_context.class_hierarchy.is_subclass(self, base_class)
+
+    def get_mro(self) -> Tuple['ClassDef', ...]:
+        """ the method resolution order, the classes outside of the program are left out """
+        return self.module.prog_context.class_hierarchy.get_mro(self)
+
+    @property
+    def class_ref(self) -> 'ClassRef':
+        return self._class_ref
 
 
 class FuncDef(Scope):
+    __slots__ = ('lineno', '_returns_node', '_return_type', '_func_ref')
 
     def __init__(self, ast_node: ast.FunctionDef, parent: Scope):
-        super().__init__(ast_node.name, parent, ast_node)
+        super().__init__(ast_node.name, parent)
         self.lineno = ast_node.lineno  # type: int
+        self._returns_node = ast_node.returns  # type: Optional[ast.AST]  # until the types are calculated
         self._return_type = None
+        self._func_ref = FuncRef(self)  # the only FuncRef, which is created for this function
+
+    @property
+    def returns_node(self) -> Optional[ast.AST]:
+        return self._returns_node
+
+    def release_ast_nodes(self):
+        super().release_ast_nodes()
+        self._returns_node = None
 
     @property
     def return_type(self):
         return self._return_type
+
+    @property
+    def func_ref(self) -> 'FuncRef':
+        return self._func_ref
         
     def add_func_arg_variable(self, func_arg_node: ast.arg) -> 'FuncArgVariable':
-        var_name = func_arg_node.arg
-        assert var_name not in self._variables
-        new_var = FuncArgVariable(func_arg_node, scope=self)
-        self._variables[var_name] = new_var
-        self._symbol_table[var_name] = new_var
-        return new_var
+        assert self.find_variable(func_arg_node.arg) is None
+        return self._add_variable(FuncArgVariable(func_arg_node, scope=self))
 
     def add_self_variable(self, func_arg_node: ast.arg, class_def: ClassDef) -> 'Variable':
         var_name = func_arg_node.arg
-        assert var_name not in self._variables
-        new_var = Variable(func_arg_node, ClassRef(class_def), self)
-        self._variables[var_name] = new_var
-        self._symbol_table[var_name] = new_var
-        return new_var
+        assert self.find_variable(var_name) is None
+        return self._add_variable(Variable(var_name, class_def.class_ref, self))
 
     def set_return_type(self, return_type: 'ExprType'):
         self._return_type = return_type
 
 
 class ExprType:
+    """ type of an expression
+
+        ExprTypes are values: equal types have the same hash, so sets of types stay minimal. Use
+        ClassDef.class_ref and FuncDef.func_ref instead of creating new references.
+    """
+    __slots__ = ()
 
     def get_attr_type(self, attr_name: str) -> Optional['ExprType']:
         return None
@@ -363,67 +749,133 @@ class ExprType:
     def iter_call_return_types(self) -> Optional['ExprType']:
         pass
 
+    def iter_instance_types(self) -> Iterable['ExprType']:
+        """ the types, which a value annotated with this type can have, p.e. the derived classes """
+        yield self
+
 
 class ClassRef(ExprType):
+    __slots__ = ('_class_def',)
 
     def __init__(self, class_def: ClassDef):
         self._class_def = class_def
 
+    def __eq__(self, other):
+        return isinstance(other, ClassRef) and other._class_def is self._class_def
+
+    def __hash__(self):
+        return hash(self._class_def)
+
     @property
     def class_def(self):
         return self._class_def
 
     def get_attr_type(self, attr_name: str) -> Optional['ExprType']:
-        symbol = self._class_def.find_local_symbol_by_name(attr_name)
+        symbol = self._class_def.find_member(attr_name)
         if isinstance(symbol, ClassDef):
-            return ClassRef(symbol)
+            return symbol.class_ref
         elif isinstance(symbol, FuncDef):
-            return FuncRef(symbol)
+            return symbol.func_ref
         elif isinstance(symbol, Variable):
             return symbol.type_
 
     def iter_call_return_types(self) -> Optional['ExprType']:
         yield self
 
+    def iter_instance_types(self) -> Iterable['ExprType']:
+        return self._class_def.module.prog_context.class_hierarchy.get_subclass_refs(self._class_def)
+
 
 class FuncRef(ExprType):
+    __slots__ = ('_func_def',)
 
     def __init__(self, func_def: FuncDef):
         self._func_def = func_def
 
+    def __eq__(self, other):
+        return isinstance(other, FuncRef) and other._func_def is self._func_def
+
+    def __hash__(self):
+        return hash(self._func_def)
+
     @property
     def func_def(self):
         return self._func_def
 
     def iter_call_return_types(self) -> Optional['ExprType']:
         return_type = self._func_def.return_type
-        if isinstance(return_type, ClassRef):
-            for derived_class in return_type.class_def.iter_self_and_derived():
-                yield ClassRef(derived_class)
-        else:
-            yield return_type
+        if return_type is not None:
+            yield from return_type.iter_instance_types()
 
 
 class TSequence(ExprType):
+    __slots__ = ('_item_type',)
 
     def __init__(self, item_type: ExprType):
         self._item_type = item_type
 
+    def __eq__(self, other):
+        return type(other) is type(self) and other._item_type == self._item_type
+
+    def __hash__(self):
+        return hash((type(self), self._item_type))
+
     def get_slice_type(self) -> Optional['ExprType']:
         return self._item_type
 
 
 class TList(TSequence):
-
-    pass
+    __slots__ = ()
 
 
 class TMapping(TSequence):
+    __slots__ = ('_key_type',)
 
     def __init__(self, key_type: ExprType, value_type: ExprType):
         super().__init__(value_type)
         self._key_type = key_type
 
+    def __eq__(self, other):
+        return super().__eq__(other) and other._key_type == self._key_type
+
+    def __hash__(self):
+        return hash((type(self), self._key_type, self._item_type))
+
+
+class TUnion(ExprType):
+    """ one of several types, p.e. Union[A, B]. ExprInfos contain the members instead of the union. """
+    __slots__ = ('_types',)
+
+    def __init__(self, types: Iterable[ExprType]):
+        self._types = frozenset(types)  # type: FrozenSet[ExprType]
+
+    def __eq__(self, other):
+        return isinstance(other, TUnion) and other._types == self._types
+
+    def __hash__(self):
+        return hash((TUnion, self._types))
+
+    def iter_types(self) -> Iterator[ExprType]:
+        yield from self._types
+
+    def iter_instance_types(self) -> Iterator[ExprType]:
+        for expr_type in self._types:
+            yield from expr_type.iter_instance_types()
+
+
+def make_union_type(types: Iterable[Optional[ExprType]]) -> Optional[ExprType]:
+    """ returns the only type, a TUnion of the types or None. Nested unions are flattened. """
+    members = set()
+    for expr_type in types:
+        if isinstance(expr_type, TUnion):
+            members.update(expr_type.iter_types())
+        elif expr_type is not None:
+            members.add(expr_type)
+    if len(members) > 1:
+        return TUnion(members)
+    elif members:
+        return members.pop()
+
 
 # class TIterator(TSequence):
 #
@@ -432,6 +884,7 @@ class TMapping(TSequence):
 
 
 class Variable(Symbol):
+    __slots__ = ('_type', '_scope')
 
     def __init__(self, name: str, var_type: Optional['ExprType'], scope: Scope):
         super().__init__(name)
@@ -449,21 +902,45 @@ class Variable(Symbol):
     def anno_node(self):  # for late calculation of self._type
         return None
 
+    def release_anno_node(self):
+        pass
+
     @property
     def scope(self):
         return self._scope
 
+    def _calc_fullname(self) -> str:
+        return _join_names(self._scope.fullname, self.name)
+
     @property
-    def path(self) -> SymbolPath:
-        return self._scope.path + self.name
+    def module(self) -> 'Module':
+        return self._scope.module
+
+
+class AssignVariable(Variable):
+    """ a variable without annotation, p.e. a loop variable. Its type is inferred, when the calls are found. """
+    __slots__ = ()
+
+    def __init__(self, var_name: str, scope: Scope):
+        super().__init__(var_name, None, scope)
+
+    def __getstate__(self):
+        # the inferred type can refer to modules, which are not imported, so it is inferred again
+        state = get_attribute_state(self)
+        state['_type'] = None
+        return None, state
+
+    def clear_type(self):
+        self._type = None
 
 
 class AnnAssignVariable(Variable):
+    __slots__ = ('_anno_node',)
 
-    def __init__(self, var_name: str, assign_node: ast.AnnAssign, scope: Scope):
+    def __init__(self, var_name: str, anno_node: ast.AST, scope: Scope):
         var_type = None
         super().__init__(var_name, var_type, scope)
-        self._assign_node = assign_node   # type: ast.AnnAssign
+        self._anno_node = anno_node   # type: Optional[ast.AST]  # only the annotation, not the value
 #        self.lineno = assign_node.lineno # type: int
 
     # def _calc_var_name(self, assign_node: ast.AnnAssign) -> str:
@@ -476,89 +953,535 @@ class AnnAssignVariable(Variable):
     #
     @property
     def anno_node(self):
-        return self._assign_node.annotation
+        return self._anno_node
+
+    def release_anno_node(self):
+        self._anno_node = None
 
 
 class FuncArgVariable(Variable):
+    __slots__ = ('_anno_node',)
 
     def __init__(self, arg_node: ast.arg, scope: Scope):
         arg_name = arg_node.arg
         arg_type = None
         super().__init__(arg_name, arg_type, scope)
-        self._arg_node = arg_node      # type: ast.arg
+        self._anno_node = arg_node.annotation  # type: Optional[ast.AST]
 #        self.lineno = arg_node.lineno # type: int
 
     @property
     def anno_node(self):
-        return self._arg_node.annotation
+        return self._anno_node
+
+    def release_anno_node(self):
+        self._anno_node = None
 
 
 class ExprInfos:
+    __slots__ = ('_scope_of_expr', '_repr_scopes', '_expr_types')
+
+    _MAX_LIST_LEN = 8
 
     def __init__(self, scope_of_expr: Scope):
         self._scope_of_expr = scope_of_expr  # the scope, which contains the expression
-        self._repr_scopes = set()  # type: Set[Scope]
-        self._expr_types = set()  # type: Set[EsprType]
+        self._repr_scopes = None  # type: Optional[Set[Scope]]
+        self._expr_types = None  # type: Optional[Union[List[ExprType], Set[ExprType]]]
 
     def add_repr_scope(self, scope: Scope) -> None:
+        if self._repr_scopes is None:
+            self._repr_scopes = set()
         self._repr_scopes.add(scope)
 
     def add_var(self, var: Variable) -> None:
         #if isinstance(var, TypedVariable):
-        self.expr_types.add(var.type_)
+        if var.type_ is not None:
+            self.add_expr_type(var.type_)
 
     def add_symbol(self, symbol: Symbol):
         if isinstance(symbol, Scope):
             scope = symbol
-            self._repr_scopes.add(scope)
+            self.add_repr_scope(scope)
         elif isinstance(symbol, Variable):
             var = symbol
             self.add_var(var)
 
     def add_expr_type(self, expr_type: ExprType):
-        self._expr_types.add(expr_type)
+        if isinstance(expr_type, TUnion):
+            for member_type in expr_type.iter_types():
+                self.add_expr_type(member_type)
+            return
+        # most expressions have one or few types, a small list is much smaller than a set
+        expr_types = self._expr_types
+        if expr_types is None:
+            self._expr_types = [expr_type]
+        elif isinstance(expr_types, set):
+            expr_types.add(expr_type)
+        elif expr_type not in expr_types:
+            if len(expr_types) < self._MAX_LIST_LEN:
+                expr_types.append(expr_type)
+            else:
+                self._expr_types = set(expr_types)
+                self._expr_types.add(expr_type)
+
+    def is_empty(self) -> bool:
+        return not self._repr_scopes and not self._expr_types
 
     @property
     def scope_of_expr(self):
         return self._scope_of_expr
 
     def iter_repr_scopes(self):
-        yield from self._repr_scopes
+        if self._repr_scopes is not None:
+            yield from self._repr_scopes
 
     def iter_expr_types(self):
-        yield from self._expr_types
+        if self._expr_types is not None:
+            yield from self._expr_types
+
+
+# kinds of expressions in the ExprTable
+EXPR_NAME = 0
+EXPR_ATTR = 1
+EXPR_CALL = 2
+EXPR_SUBSCRIPT = 3
+EXPR_FOR = 4
+
+# compact form of an expression node: kind, index of the sub expression, which the evaluation
+# depends on (-1, if there is none), name (Name.id, Attribute.attr or the loop variable) and position
+Expr = namedtuple('Expr', ['kind', 'sub_index', 'name', 'lineno', 'col_offset'])
+
+
+class ExprTable:
+    """ side table of the expressions of a module
+
+        The ScopeBuildingVisitor numbers the expression nodes of a module in post order and stores only,
+        what the evaluation needs. So the ast is not needed by the later phases. The ExprInfos are keyed
+        by the node index and only kept for the nodes, which resolve to something.
+    """
+
+    def __init__(self):
+        self._exprs = []       # type: List[Expr]
+        self._expr_infos = {}  # type: Mapping[int, ExprInfos]
+
+    def __getstate__(self):
+        # the infos refer to other modules and are evaluated again. The expressions are stored
+        # by column, because a tuple per expression makes pickling slow.
+        kinds, sub_indices, names, linenos, col_offsets = zip(*self._exprs) if self._exprs else ((),) * 5
+        return {'kinds': array('b', kinds), 'sub_indices': array('i', sub_indices), 'names': list(names),
+                'linenos': array('i', linenos), 'col_offsets': array('i', col_offsets)}
+
+    def __setstate__(self, state):
+        self._exprs = list(map(Expr._make, zip(state['kinds'], state['sub_indices'], state['names'],
+                                               state['linenos'], state['col_offsets'])))
+        self._expr_infos = {}
+
+    def __len__(self):
+        return len(self._exprs)
+
+    def add_expr(self, expr: Expr) -> int:
+        self._exprs.append(expr)
+        return len(self._exprs) - 1
+
+    def get_expr(self, index: int) -> Expr:
+        return self._exprs[index]
+
+    def find_expr_infos(self, index: int) -> Optional[ExprInfos]:
+        return self._expr_infos.get(index, None)
+
+    def set_expr_infos(self, index: int, expr_infos: ExprInfos):
+        self._expr_infos[index] = expr_infos
+
+    def clear_expr_infos(self):
+        self._expr_infos.clear()
+
+    @property
+    def num_expr_infos(self) -> int:
+        return len(self._expr_infos)
 
 
 class CallGraph:
+    """ the calls of a module
+
+        A call can dispatch to several callees, p.e. to the overriding methods of the derived classes.
+        It is stored once as CallSite with the set of its targets. Equal target sets are shared
+        by all call sites of the module, so a method call on a widely derived base class costs one
+        entry instead of one per derived class. iter_calls() expands the call sites to Call objects.
+    """
+
     def __init__(self):
-        self.calls = set()
-        self._call_strings = set()
+        self._call_sites = []    # type: List[CallSite]
+        self._target_sets = {}   # type: Mapping[FrozenSet[Scope], FrozenSet[Scope]]
+        self._call_names = None  # type: Optional[Set[Tuple[str, str]]]  # (caller fullname, callee fullname)
+
+    def add_call(self, caller: Scope, callee: Scope, lineno: int, col_offset: int):
+        self.add_call_site(caller, (callee,), lineno, col_offset)
+
+    def add_call_site(self, caller: Scope, callees: Iterable[Scope], lineno: int, col_offset: int):
+        targets = frozenset(callees)
+        if not targets:
+            return
+        targets = self._target_sets.setdefault(targets, targets)
+        self._call_sites.append(CallSite(caller, targets, lineno, col_offset))
+        self._call_names = None
+
+    @property
+    def num_call_sites(self) -> int:
+        return len(self._call_sites)
+
+    @property
+    def num_target_sets(self) -> int:
+        return len(self._target_sets)
 
-    def add_call(self, caller: Scope, callee: Scope, call_node: ast.Call):
-        call = Call(caller, callee, call_node)
-        self.calls.add(call)
-        self._call_strings.add(str(call))
+    @property
+    def calls(self) -> Set['Call']:
+        """ the calls expanded to one per target """
+        return set(self.iter_calls())
+
+    def iter_call_sites(self) -> Iterator['CallSite']:
+        yield from self._call_sites
+
+    def iter_calls(self, expand: bool = True) -> Iterator[Union['Call', 'CallSite']]:
+        """ yields a Call per target of each call site, or the call sites themselves, if expand is False """
+        if not expand:
+            yield from self._call_sites
+            return
+        for call_site in self._call_sites:
+            yield from call_site.iter_calls()
+
+    def remove_calls_to_modules(self, modules: Set['Module']) -> bool:
+        """ returns True, if call targets were removed """
+        if not any(x.module in modules for targets in self._target_sets for x in targets):
+            return False
+        call_sites = self._call_sites
+        self._call_sites = []
+        self._target_sets = {}
+        self._call_names = None
+        for call_site in call_sites:
+            self.add_call_site(call_site.caller, [x for x in call_site.targets if x.module not in modules],
+                               call_site.lineno, call_site.col_offset)
+        return True
 
     def contains(self,
                  call_str: str):  # p.e. 'g -> f' or 'gui.frame.MyFrame.on_button_clicked -> gui.frame.button.set_icon'
-        return call_str in self._call_strings
+        if self._call_names is None:
+            self._call_names = {(x.caller.fullname, callee.fullname)
+                                for x in self._call_sites for callee in x.targets}
+        caller_name, _, callee_name = call_str.partition(' -> ')
+        return (caller_name, callee_name) in self._call_names
+
+
+class ProgCallGraph:
+    """ the calls of all modules in compressed sparse row form
+
+        Each scope (module, class, function) gets a dense node id, the ones without calls too, so exports
+        and metrics contain the isolated scopes. A call site has an edge per target.
+        The edges from node i are _forward_offsets[i]:_forward_offsets[i + 1], sorted by the callee id,
+        _call_sites holds the call site of each edge. The edges to node i are the edges with the indices
+        _reverse_call_indices[_reverse_offsets[i]:_reverse_offsets[i + 1]], sorted by the caller id.
+        Queries are O(degree). Call objects are only created, when the calls are iterated expanded.
+
+        The graph is immutable, it is built again, when modules change.
+    """
+
+    def __init__(self, modules: Iterable['Module']):
+        self._nodes = []     # type: List[Scope]
+        self._node_ids = {}  # type: Mapping[Scope, int]
+        call_sites = []  # type: List[CallSite]
+        caller_ids = array('l')
+        callee_ids = array('l')
+        modules = list(modules)
+        for module in modules:
+            self._add_node(module)
+            for scope in module.iter_descendant_scopes():
+                self._add_node(scope)
+        for module in modules:
+            for call_site in module.call_graph.iter_call_sites():
+                caller_id = self._add_node(call_site.caller)
+                for callee in call_site.targets:
+                    call_sites.append(call_site)
+                    caller_ids.append(caller_id)
+                    callee_ids.append(self._add_node(callee))
+
+        num_nodes = len(self._nodes)
+        order = _counting_sort(range(len(call_sites)), callee_ids, num_nodes)
+        order = _counting_sort(order, caller_ids, num_nodes)  # stable => sorted by caller, then callee
+        self._call_sites = [call_sites[x] for x in order]                 # type: List[CallSite]
+        self._callee_ids = array('l', (callee_ids[x] for x in order))     # type: array
+        self._forward_offsets = _calc_offsets(caller_ids, num_nodes)      # type: array
+
+        forward_caller_ids = array('l', (caller_ids[x] for x in order))
+        self._reverse_call_indices = _counting_sort(range(len(call_sites)), self._callee_ids, num_nodes)  # type: array
+        self._caller_ids = array('l', (forward_caller_ids[x] for x in self._reverse_call_indices))  # type: array
+        self._reverse_offsets = _calc_offsets(callee_ids, num_nodes)      # type: array
+
+    def _add_node(self, scope: Scope) -> int:
+        node_id = self._node_ids.get(scope, None)
+        if node_id is None:
+            node_id = self._node_ids[scope] = len(self._nodes)
+            self._nodes.append(scope)
+        return node_id
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self._nodes)
+
+    @property
+    def num_calls(self) -> int:
+        """ the number of edges, a call site with several targets counts once per target """
+        return len(self._call_sites)
+
+    def find_node_id(self, scope: Scope) -> Optional[int]:
+        return self._node_ids.get(scope, None)
+
+    def get_node(self, node_id: int) -> Scope:
+        return self._nodes[node_id]
+
+    def iter_nodes(self) -> Iterator[Scope]:
+        yield from self._nodes
+
+    @property
+    def forward_adjacency(self) -> Tuple[array, array]:
+        """ (offsets, ids): the callees of node i are ids[offsets[i]:offsets[i + 1]], sorted, one per call """
+        return self._forward_offsets, self._callee_ids
+
+    @property
+    def reverse_adjacency(self) -> Tuple[array, array]:
+        """ (offsets, ids): the callers of node i are ids[offsets[i]:offsets[i + 1]], sorted, one per call """
+        return self._reverse_offsets, self._caller_ids
+
+    def iter_callee_ids(self, node_id: int) -> Iterator[int]:
+        """ yields each called node once """
+        yield from _iter_unique(self._callee_ids, self._forward_offsets[node_id], self._forward_offsets[node_id + 1])
+
+    def iter_caller_ids(self, node_id: int) -> Iterator[int]:
+        """ yields each calling node once """
+        yield from _iter_unique(self._caller_ids, self._reverse_offsets[node_id], self._reverse_offsets[node_id + 1])
+
+    def iter_calls_from(self, scope: Scope, expand: bool = True) -> Iterator[Union['Call', 'CallSite']]:
+        """ yields a Call per target or, if expand is False, each call site of the scope once """
+        node_id = self._node_ids.get(scope, None)
+        if node_id is None:
+            return
+        start, end = self._forward_offsets[node_id], self._forward_offsets[node_id + 1]
+        if expand:
+            for i in range(start, end):
+                yield self._make_call(i)
+        else:
+            yield from _iter_unique_objects(self._call_sites[start:end])
+
+    def iter_calls_to(self, scope: Scope, expand: bool = True) -> Iterator[Union['Call', 'CallSite']]:
+        """ yields a Call per calling site or, if expand is False, the call sites, which target the scope """
+        node_id = self._node_ids.get(scope, None)
+        if node_id is None:
+            return
+        for i in range(self._reverse_offsets[node_id], self._reverse_offsets[node_id + 1]):
+            index = self._reverse_call_indices[i]
+            yield self._make_call(index) if expand else self._call_sites[index]
+
+    def _make_call(self, index: int) -> 'Call':
+        call_site = self._call_sites[index]
+        return Call(call_site.caller, self._nodes[self._callee_ids[index]], call_site.lineno, call_site.col_offset)
+
+
+def _counting_sort(order: Iterable[int], keys: array, num_keys: int) -> array:
+    """ returns the indices of order stably sorted by their keys """
+    order = array('l', order)
+    offsets = _calc_offsets(keys, num_keys)
+    result = array('l', [0]) * len(order)
+    next_pos = offsets[:-1]
+    for index in order:
+        key = keys[index]
+        result[next_pos[key]] = index
+        next_pos[key] += 1
+    return result
+
+
+def _calc_offsets(keys: array, num_keys: int) -> array:
+    offsets = array('l', [0]) * (num_keys + 1)
+    for key in keys:
+        offsets[key + 1] += 1
+    for i in range(num_keys):
+        offsets[i + 1] += offsets[i]
+    return offsets
+
+
+def _iter_unique_objects(objects: Iterable[object]) -> Iterator[object]:
+    seen = set()
+    for obj in objects:
+        if id(obj) not in seen:
+            seen.add(id(obj))
+            yield obj
+
+
+def _iter_unique(sorted_ids: array, start: int, end: int) -> Iterator[int]:
+    last_id = -1
+    for i in range(start, end):
+        node_id = sorted_ids[i]
+        if node_id != last_id:
+            yield node_id
+            last_id = node_id
+
+
+class ClassHierarchy:
+    """ the transitive subclass relation of all classes of the program
+
+        The classes are condensed into strongly connected components (only invalid code has cycles)
+        and numbered in topological order, so the subclasses of a class have a higher number.
+        _descendant_bits[i] is a bitset of the components, which derive from component i, shifted
+        by i. A subclass test is a bit test, the subclasses of a class are cached on first use.
+
+        The hierarchy is immutable, it is built again, when bases are added or modules change.
+    """
+
+    def __init__(self, modules: Iterable['Module']):
+        classes = [x for module in modules for x in module.iter_descendant_scopes(ClassDef)]
+        self._condensation = Condensation(classes, ClassDef.iter_derived)  # type: Condensation[ClassDef]
+        num_components = self._condensation.num_components
+        self._descendant_bits = [0] * num_components  # type: List[int]
+        for index in reversed(range(num_components)):
+            bits = 1
+            for successor_index in self._condensation.iter_successor_indices(index):
+                bits |= self._descendant_bits[successor_index] << (successor_index - index)
+            self._descendant_bits[index] = bits
+        self._subclasses = {}  # type: Mapping[ClassDef, Tuple[ClassDef, ...]]
+        self._subclass_refs = {}  # type: Mapping[ClassDef, Tuple[ClassRef, ...]]
+        self._mros = {}        # type: Mapping[ClassDef, Tuple[ClassDef, ...]]
+
+    def is_subclass(self, class_def: 'ClassDef', base_class: 'ClassDef') -> bool:
+        """ True, if class_def is base_class or derives from it directly or indirectly """
+        index = self._condensation.find_component_index(class_def)
+        base_index = self._condensation.find_component_index(base_class)
+        if index is None or base_index is None:
+            return class_def is base_class
+        return index >= base_index and (self._descendant_bits[base_index] >> (index - base_index)) & 1 == 1
+
+    def get_subclasses(self, class_def: 'ClassDef') -> Tuple['ClassDef', ...]:
+        """ the class itself and all classes, which derive from it directly or indirectly """
+        subclasses = self._subclasses.get(class_def, None)
+        if subclasses is None:
+            subclasses = self._subclasses[class_def] = tuple(self._calc_subclasses(class_def))
+        return subclasses
+
+    def get_subclass_refs(self, class_def: 'ClassDef') -> Tuple['ClassRef', ...]:
+        """ the ClassRefs of get_subclasses(), the types which an instance of the class can have """
+        subclass_refs = self._subclass_refs.get(class_def, None)
+        if subclass_refs is None:
+            subclass_refs = self._subclass_refs[class_def] = tuple(x.class_ref for x in self.get_subclasses(class_def))
+        return subclass_refs
+
+    def _calc_subclasses(self, class_def: 'ClassDef') -> Iterator['ClassDef']:
+        yield class_def
+        index = self._condensation.find_component_index(class_def)
+        if index is None:  # p.e. the module is not registered in the program
+            visited = {class_def}
+            todo = list(class_def.iter_derived())
+            while todo:
+                derived_class = todo.pop()
+                if derived_class not in visited:
+                    visited.add(derived_class)
+                    yield derived_class
+                    todo.extend(derived_class.iter_derived())
+            return
+        bits = self._descendant_bits[index]
+        while bits:
+            lowest_bit = bits & -bits
+            for member in self._condensation.get_component(index + lowest_bit.bit_length() - 1):
+                if member is not class_def:
+                    yield member
+            bits ^= lowest_bit
+
+    def get_mro(self, class_def: 'ClassDef') -> Tuple['ClassDef', ...]:
+        """ the method resolution order by C3 linearization, only with the classes of the program
+
+            Inconsistent hierarchies, which python rejects, get the depth first order of the bases.
+        """
+        mro = self._mros.get(class_def, None)
+        if mro is None:
+            mro = self._mros[class_def] = self._calc_mro(class_def, set())
+        return mro
+
+    def _calc_mro(self, class_def: 'ClassDef', pending: Set['ClassDef']) -> Tuple['ClassDef', ...]:
+        mro = self._mros.get(class_def, None)
+        if mro is not None:
+            return mro
+        bases = [x for x in class_def.iter_bases() if x not in pending]  # a cycle is cut
+        pending.add(class_def)
+        base_mros = [self._calc_mro(x, pending) for x in bases]
+        pending.discard(class_def)
+        merged = _merge_mros([list(x) for x in base_mros] + [bases])
+        if merged is None:
+            merged = list(_iter_unique_objects(x for base_mro in base_mros for x in base_mro))
+        mro = self._mros[class_def] = (class_def,) + tuple(merged)
+        return mro
+
+
+def _merge_mros(sequences: List[List['ClassDef']]) -> Optional[List['ClassDef']]:
+    """ the merge step of the C3 linearization, None if there is no consistent order """
+    result = []
+    sequences = [x for x in sequences if x]
+    while sequences:
+        for sequence in sequences:
+            head = sequence[0]
+            if not any(head in x[1:] for x in sequences):
+                break
+        else:
+            return None
+        result.append(head)
+        sequences = [x[1:] if x[0] is head else x for x in sequences]
+        sequences = [x for x in sequences if x]
+    return result
 
 
 class Call:
-    def __init__(self, caller: Scope, callee: Scope, call_node: ast.Call):  # todo: use FuncDef instead of str
+    __slots__ = ('caller', 'callee', 'lineno', 'col_offset')
+
+    def __init__(self, caller: Scope, callee: Scope, lineno: int, col_offset: int):
         self.caller = caller
         self.callee = callee
-        self.call_node = call_node
+        self.lineno = lineno
+        self.col_offset = col_offset
 
     def __str__(self):
         return str(self.caller) + ' -> ' + str(self.callee)
 
-    @property
-    def lineno(self):
-        return self.call_node.lineno
 
-    @property
-    def col_offset(self):
-        return self.call_node.col_offset
+class CallSite:
+    """ a call in the source with all scopes, which it can dispatch to """
+    __slots__ = ('caller', 'targets', 'lineno', 'col_offset')
+
+    def __init__(self, caller: Scope, targets: FrozenSet[Scope], lineno: int, col_offset: int):
+        self.caller = caller
+        self.targets = targets
+        self.lineno = lineno
+        self.col_offset = col_offset
+
+    def iter_calls(self) -> Iterator[Call]:
+        for callee in self.targets:
+            yield Call(self.caller, callee, self.lineno, self.col_offset)
+
+    def __str__(self):
+        return str(self.caller) + ' -> {' + ', '.join(sorted(str(x) for x in self.targets)) + '}'
+
+
+def get_attribute_state(obj) -> Mapping[str, object]:
+    """ returns the attributes of the object, the slots included """
+    state = dict(getattr(obj, '__dict__', {}))
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            if hasattr(obj, name):
+                state[name] = getattr(obj, name)
+    return state
+
+
+def _find_sub_symbol(symbol: Symbol, names: List[str]) -> Optional[Symbol]:
+    for name in names:
+        if not isinstance(symbol, Scope):
+            return
+        symbol = symbol.find_local_symbol_by_name(name)
+        if symbol is None:
+            return
+    return symbol
 
 
+def _join_names(parent_fullname: str, name: str) -> str:
+    return parent_fullname + '.' + name if parent_fullname else name
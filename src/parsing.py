@@ -1,41 +1,148 @@
-from typing import Optional, List
+from typing import Optional, List, Iterator, Tuple, Mapping
+from collections import deque
 import ast
+import hashlib
 
-from moduleobjects import Module, ClassDef, ClassRef, FuncDef, FuncRef, Scope, ExprInfos, Symbol, ProgContext, Variable
-from filesystem import Dir, File
-from annoanalyzer import AnnotationAnalyzer
+from moduleobjects import Module, ClassDef, ClassRef, FuncDef, FuncRef, Scope, ExprInfos, Symbol, ProgContext, \
+    Variable, AssignVariable, CallGraph, Expr, ExprTable, EXPR_NAME, EXPR_ATTR, EXPR_CALL, EXPR_SUBSCRIPT, EXPR_FOR, \
+    make_union_type
+from annoanalyzer import AnnotationAnalyzer, get_str_value
 
 
 class ModuleBuilder:
+    """ builds a module in phases:
+
+        1. build_scopes: parse the source and build scopes and variables (module local)
+        2. link: bind the imported symbols and the base classes
+        3. calc_types: evaluate the annotations
+        4. find_calls: evaluate the expressions and fill the call graph
+
+        Each phase must be finished for all modules, before the next phase starts.
+    """
 
     def __init__(self, module: Module):
         super().__init__()
         self._module = module
 
-    def build(self):
+    def build_scopes(self):
         self._module.read()
-        module_node = self._module.ast_node
-        ScopeBuildingVisitor(self._module, self._module.lines, self._module.prog_context).visit(module_node)
+        ScopeBuildingVisitor(self._module).build()
+        self._module.release_syntax_tree()
+
+    def link(self) -> int:
+        return ImportLinker(self._module).link()
+
+    def calc_types(self):
         TypeCalculator(self._module).calculate()
-        NameNodeExprInfosSetter(self._module, module_node).set_expr_infos()
-        i = 0
-        while True:
-            i += 1
-            expr_setter = OtherNodeExprInfosSetter(module_node)
-            expr_setter.set_expr_infos()
-            assert i <= 1 or expr_setter.num_settings == 0
-            if expr_setter.num_settings == 0:
-                break
-        CallVisitor(self._module.call_graph).visit(module_node)
+
+    def find_calls(self):
+        # the expression nodes of each scope were collected in post order by the ScopeBuildingVisitor,
+        # so the sub expressions of an expression are evaluated before the expression itself
+        expr_table = self._module.expr_table
+        worklists = list(self._module.iter_expr_worklists())
+        ExprInfosSetter(expr_table, worklists).set_expr_infos()
+
+        call_finder = CallFinder(expr_table, self._module.call_graph)
+        for _, expr_indices in worklists:
+            call_finder.find_calls(expr_indices)
+        self._module.set_hierarchy_signature(calc_hierarchy_signature(self._module))
+        self._module.prog_context.invalidate_indices()
+
+    def refind_calls(self):
+        """ evaluates the expressions again, p.e. after derived classes were added """
+        self._module.expr_table.clear_expr_infos()
+        for scope in [self._module] + list(self._module.iter_descendant_scopes()):
+            for var in scope.iter_variables():
+                if isinstance(var, AssignVariable):
+                    var.clear_type()  # the loop variables get their types again
+        self._module.set_call_graph(CallGraph())
+        self.find_calls()
+
+
+def calc_hierarchy_signature(module: Module) -> str:
+    """ fingerprint of the direct and indirect derived classes of the classes in the module
+
+        The member names of the derived classes are included, because an added or removed override
+        changes the targets of the calls too.
+    """
+    derivations = []
+    for class_def in module.iter_descendant_scopes(ClassDef):
+        for derived in class_def.iter_self_and_derived():
+            if derived is not class_def:
+                member_names = sorted(name for name, _ in derived.iter_local_symbols())
+                derivations.append(class_def.fullname + '>' + derived.fullname + ':' + ','.join(member_names))
+    return hashlib.sha1('\n'.join(sorted(derivations)).encode('utf-8')).hexdigest()
+
+
+def iter_import_chains(import_node: ast.AST, module: Module) -> Iterator[List[str]]:
+    """ yields for each imported name the module fullnames, which must be loaded in this order
+
+        p.e. "import a.b" => ['a', 'a.b'], "from a import c" => ['a', 'a.c'] (a.c is optional)
+    """
+    if isinstance(import_node, ast.Import):
+        for alias in import_node.names:
+            yield _calc_parent_names(alias.name)
+    elif isinstance(import_node, ast.ImportFrom):
+        module_fullname = resolve_module_name(import_node, module)
+        if module_fullname is None:
+            return
+        parent_names = _calc_parent_names(module_fullname)
+        for alias in import_node.names:
+            yield parent_names + [module_fullname + '.' + alias.name]
+
+
+def _calc_parent_names(module_fullname: str) -> List[str]:
+    name_parts = module_fullname.split('.')
+    return ['.'.join(name_parts[:i]) for i in range(1, len(name_parts) + 1)]
+
+
+def resolve_module_name(import_from_node: ast.ImportFrom, module: Module) -> Optional[str]:
+    """ returns the absolute name of the module in "from ... import", p.e. "from ..a import b" in p.q.r => 'p.a'
+
+        None, if a relative import goes beyond the top level package.
+    """
+    if not import_from_node.level:
+        return import_from_node.module
+    name_parts = module.fullname.split('.')
+    if not module.is_package:
+        name_parts.pop()
+    num_parts = len(name_parts) - (import_from_node.level - 1)
+    if num_parts < 1:
+        return
+    if import_from_node.module:
+        return '.'.join(name_parts[:num_parts] + [import_from_node.module])
+    return '.'.join(name_parts[:num_parts])
 
 
 class ScopeBuildingVisitor(ast.NodeVisitor):
+    """ builds the scopes of a module in one walk through the ast
+
+        The nodes, which are needed by the later phases (names, attributes, calls, subscripts and for loops),
+        are added in post order to the ExprTable of the module and their indices are collected into one
+        worklist per scope. Imports are only registered and bound later by the ImportLinker.
+    """
 
-    def __init__(self, scope: Scope, lines: List[str], prog_context: ProgContext):
+    _EXPR_NODE_TYPES = (ast.Name, ast.Attribute, ast.Call, ast.Subscript)
+
+    def __init__(self, module: Module):
         super().__init__()
+        self._module = module
+        self._expr_table = module.expr_table  # type: ExprTable
+        self._scope = module                  # type: Scope
+        self._expr_indices = None             # type: List[int]
+        self._node_indices = {}               # type: Mapping[ast.AST, int]  # only while building
+
+    def build(self) -> None:
+        self._visit_scope_body(self._module, self._module.ast_node.body)
+
+    def _visit_scope_body(self, scope: Scope, body: List[ast.AST]) -> None:
+        old_scope, old_expr_indices = self._scope, self._expr_indices
         self._scope = scope
-        self._lines = lines
-        self._prog_context = prog_context
+        self._expr_indices = []
+        self._module.add_expr_worklist(scope, self._expr_indices)
+        for child_node in body:
+            self.visit(child_node)
+        self._scope, self._expr_indices = old_scope, old_expr_indices
 
     def visit(self, node):  # only for cc-pyparser
         super().visit(node)
@@ -45,21 +152,21 @@ class ScopeBuildingVisitor(ast.NodeVisitor):
             self.visit_AnnAssign(node)
             self.visit_Import(node)
             self.visit_ImportFrom(node)
+            self.visit_If(node)
 
-    def visit_ClassDef(self, class_def_node: ast.ClassDef):
-        new_class = self._scope.add_class(class_def_node)
+    def generic_visit(self, node):
+        super().generic_visit(node)
+        if isinstance(node, self._EXPR_NODE_TYPES):
+            self._add_expr(node, _create_expr(node, self._node_indices))
 
-        for base_node in class_def_node.bases:
-            if isinstance(base_node, ast.Name):
-                base_class_name = base_node.id
-                base_class = self._scope.find_symbol_by_name(base_class_name)
-                if not base_class:
-                    continue
-                new_class.add_base(base_class)
-                base_class.add_derived(new_class)
+    def _add_expr(self, node: ast.AST, expr: Expr) -> None:
+        index = self._expr_table.add_expr(expr)
+        self._node_indices[node] = index
+        self._expr_indices.append(index)
 
-        for child_node in class_def_node.body:
-            ScopeBuildingVisitor(new_class, self._lines, self._prog_context).visit(child_node)
+    def visit_ClassDef(self, class_def_node: ast.ClassDef):
+        new_class = self._scope.add_class(class_def_node)
+        self._visit_scope_body(new_class, class_def_node.body)
 
     def visit_FunctionDef(self, func_def_node: ast.FunctionDef):
         new_func = self._scope.add_function(func_def_node)
@@ -70,10 +177,13 @@ class ScopeBuildingVisitor(ast.NodeVisitor):
             else:
                 new_func.add_func_arg_variable(arg)
 
-        for child_node in func_def_node.body:
-            ScopeBuildingVisitor(new_func, self._lines, self._prog_context).visit(child_node)
+        self._visit_scope_body(new_func, func_def_node.body)
 
     def visit_AnnAssign(self, ann_assign_node: ast.AnnAssign):
+        self._add_ann_assign_variable(ann_assign_node)
+        self.generic_visit(ann_assign_node)
+
+    def _add_ann_assign_variable(self, ann_assign_node: ast.AnnAssign):
         target_node = ann_assign_node.target
         if isinstance(target_node, ast.Name):
             var_name = target_node.id
@@ -109,39 +219,106 @@ class ScopeBuildingVisitor(ast.NodeVisitor):
                 self._scope.add_assign_variable(var_name)
             # todo: x, y = ...
             # todo: self.x = ...
+        self.generic_visit(assign_node)
 
     def visit_For(self, for_node: ast.For):
         target_node = for_node.target
+        var_name = None
         if isinstance(target_node, ast.Name):
             var_name = target_node.id
-            target_node.variable = Variable(var_name, var_type=None, scope=self._scope)
-
-        for child_node in ast.iter_child_nodes(for_node):
+            self._scope.add_assign_variable(var_name)
+
+        self.visit(for_node.target)
+        self.visit(for_node.iter)
+        # the loop variable gets its type before the body is evaluated
+        iter_index = self._node_indices.get(for_node.iter, -1)
+        self._add_expr(for_node, Expr(EXPR_FOR, iter_index, var_name, for_node.lineno, for_node.col_offset))
+        for child_node in for_node.body + for_node.orelse:
             self.visit(child_node)
 
+    def visit_If(self, if_node: ast.If):
+        if self._scope is self._module and _is_main_block_test(if_node.test):
+            # the else branch runs, when the module is imported
+            last_lineno = max(getattr(x, 'end_lineno', None) or getattr(x, 'lineno', 0)
+                              for body_node in if_node.body for x in ast.walk(body_node))
+            self._module.add_main_block(if_node.lineno, last_lineno)
+        self.generic_visit(if_node)
+
     def visit_Import(self, import_node: ast.Import):
+        self._module.add_import_node(self._scope, import_node)
+
+    def visit_ImportFrom(self, import_from_node: ast.ImportFrom):
+        self._module.add_import_node(self._scope, import_from_node)
+
+
+def _is_main_block_test(test_node: ast.AST) -> bool:
+    """ if __name__ == '__main__': """
+    if not isinstance(test_node, ast.Compare) or len(test_node.ops) != 1 or not isinstance(test_node.ops[0], ast.Eq):
+        return False
+    operands = [test_node.left, test_node.comparators[0]]
+    names = [x.id for x in operands if isinstance(x, ast.Name)]
+    strings = [get_str_value(x) for x in operands if get_str_value(x) is not None]
+    return names == ['__name__'] and strings == ['__main__']
+
+
+def _create_expr(node: ast.AST, node_indices: Mapping[ast.AST, int]) -> Expr:
+    if isinstance(node, ast.Name):
+        return Expr(EXPR_NAME, -1, node.id, node.lineno, node.col_offset)
+    elif isinstance(node, ast.Attribute):
+        return Expr(EXPR_ATTR, node_indices.get(node.value, -1), node.attr, node.lineno, node.col_offset)
+    elif isinstance(node, ast.Call):
+        return Expr(EXPR_CALL, node_indices.get(node.func, -1), None, node.lineno, node.col_offset)
+    else:
+        if _get_index_node(node) is None:  # todo: "x[:2]" has lower, step, upper
+            sub_index = -1
+        else:
+            sub_index = node_indices.get(node.value, -1)
+        return Expr(EXPR_SUBSCRIPT, sub_index, None, node.lineno, node.col_offset)
+
+
+class ImportLinker:
+    """ binds the imported symbols and the base classes of a module
+
+        The imported modules must be loaded and their scopes must be built before.
+    """
+
+    def __init__(self, module: Module):
+        self._module = module
+        self._prog_context = module.prog_context  # type: ProgContext
+        self._num_bindings = 0
+
+    def link(self) -> int:
+        """ returns the number of new bindings. Linking again binds only, what was not found before. """
+        for scope, import_node in self._module.iter_import_nodes():
+            if isinstance(import_node, ast.Import):
+                self._link_import(scope, import_node)
+            else:
+                self._link_import_from(scope, import_node)
+
+        for class_def in self._module.iter_descendant_scopes(ClassDef):
+            self._link_bases(class_def)
+        return self._num_bindings
+
+    def _link_import(self, scope: Scope, import_node: ast.Import):
         for alias in import_node.names:
             # import a.b as c  =>  alias.name = 'a.b', alias.asname = 'c'
             # "import .a" or "import ..a" is not allowed !
             fullname = alias.name
             asname = alias.asname
-            imported_module = self._import_module_with_parents(fullname)
-            if imported_module is not None:
-                if asname:
-                    module = self._prog_context.find_module(fullname)
-                    if module is not None:
-                        self._scope.add_symbol(asname, module)
-                else:
-                    name_parts = fullname.split('.')
-                    package_name = name_parts[0]
-                    package = self._prog_context.find_module(package_name)
-                    self._scope.add_symbol(package_name, package)
+            imported_module = self._find_module_with_parents(fullname)
+            if imported_module is None:
+                self._module.add_unresolved_import(fullname)
+            elif asname:
+                self._bind_symbol(scope, asname, imported_module)
+            else:
+                package_name = fullname.split('.')[0]
+                self._bind_symbol(scope, package_name, self._prog_context.find_module(package_name))
 
-    def visit_ImportFrom(self, import_from_node: ast.ImportFrom):
-        module_name = import_from_node.module
-        module_fullname = self._resolve_module_name(module_name)
-        the_module = self._import_module_with_parents(module_fullname)
+    def _link_import_from(self, scope: Scope, import_from_node: ast.ImportFrom):
+        module_fullname = resolve_module_name(import_from_node, self._module)
+        the_module = self._find_module_with_parents(module_fullname) if module_fullname else None
         if the_module is None:
+            self._module.add_unresolved_import(module_fullname or '.' * import_from_node.level + (import_from_node.module or ''))
             return
 
         for alias in import_from_node.names:
@@ -149,128 +326,68 @@ class ScopeBuildingVisitor(ast.NodeVisitor):
             orig_name = alias.name
             as_name = alias.asname
             target_name = as_name if as_name else orig_name
-            if the_module.is_package:
-                submodule_fullname = module_fullname + '.' + orig_name
-                package = the_module
-                submodule = self._import_module_without_parents(submodule_fullname, package)
-                self._scope.add_symbol(target_name, submodule)
+            submodule_fullname = module_fullname + '.' + orig_name
+            submodule = self._prog_context.find_module(submodule_fullname) if the_module.is_package else None
+            if submodule is not None:
+                self._module.add_imported_module(submodule)
+                self._bind_symbol(scope, target_name, submodule)
             else:
                 symbol = the_module.find_local_symbol_by_name(orig_name)
                 if symbol is not None:
-                    self._scope.add_symbol(target_name, symbol)
-
-    def _import_module_without_parents(self, module_fullname: str, parent_package: Module) -> Optional[Module]:
-        module = self._prog_context.find_module(module_fullname)
-        if module is not None:
-            return module
-
-        name_parts = module_fullname.split('.')
-        return self._import_module(name_parts, parent_package)
-
-    def _import_module_with_parents(self, module_fullname: str) -> Optional[Module]:
-        module = self._prog_context.find_module(module_fullname)
-        if module is not None:
-            return module
-
-        name_parts = module_fullname.split('.')
-
-        parent_package = None
-        if len(name_parts) > 1:
-            parent_package = self._import_packages(name_parts[:-1])
-            if parent_package is None:
-                return  # import not possible
-
-        return self._import_module(name_parts, parent_package)
+                    self._bind_symbol(scope, target_name, symbol)
+                elif the_module.is_package:
+                    self._module.add_unresolved_import(submodule_fullname)
+
+    def _find_module_with_parents(self, module_fullname: str) -> Optional[Module]:
+        modules = [self._prog_context.find_module(x) for x in _calc_parent_names(module_fullname)]
+        if None in modules:
+            return  # import not possible
+        for module in modules:
+            self._module.add_imported_module(module)
+        return modules[-1]
+
+    def _link_bases(self, class_def: ClassDef):
+        old_bases = list(class_def.iter_bases())
+        new_bases = []
+        for base_node in class_def.base_nodes:
+            base_class = _find_dotted_symbol(class_def.parent_scope, base_node)
+            if isinstance(base_class, ClassDef) and base_class is not class_def and base_class not in new_bases:
+                new_bases.append(base_class)
+                if base_class not in old_bases:
+                    base_class.add_derived(class_def)
+                    self._num_bindings += 1
+        if len(new_bases) > len(old_bases):  # keep the order of the class statement, p.e. for the mro
+            class_def.set_bases(new_bases)
+
+    def _bind_symbol(self, scope: Scope, name: str, symbol: Symbol) -> None:
+        if _bind_symbol(scope, name, symbol):
+            self._num_bindings += 1
+
+
+def link_package(module: Module, prog_context: ProgContext) -> None:
+    """ binds the module as symbol in its parent package """
+    name_parts = module.fullname.split('.')
+    if len(name_parts) > 1:
+        parent_package = prog_context.find_module('.'.join(name_parts[:-1]))
+        if parent_package is not None:
+            _bind_symbol(parent_package, name_parts[-1], module)
 
-    def _import_packages(self, name_parts: List[str]) -> Optional[Module]:
-        n = len(name_parts)
-        assert n > 0
 
-        parent_package = None
-        if n > 1:
-            parent_package = self._import_packages(name_parts[:-1])
-            if parent_package is None:
-                return  # import not possible
+def _find_dotted_symbol(scope: Scope, node: ast.AST) -> Optional[Symbol]:
+    """ finds the symbol of a name or a dotted name like mod.Base, which is visible in the scope """
+    if isinstance(node, ast.Name):
+        return scope.find_symbol_by_name(node.id)
+    elif isinstance(node, ast.Attribute):
+        parent_symbol = _find_dotted_symbol(scope, node.value)
+        if isinstance(parent_symbol, (Module, ClassDef)):
+            return parent_symbol.find_local_symbol_by_name(node.attr)
 
-        fullname = '.'.join(name_parts)
-        package = self._prog_context.find_module(fullname)
-        if package is None:
-            package = self._try_to_load_package(name_parts)
-            if package is None:
-                return  # import not possible
 
-        if parent_package is not None:
-            package_name = name_parts[-1]
-            parent_package.add_symbol(package_name, package)  # todo: decide what todo, when symbol already exists
-
-        return package
-
-    def _import_module(self, name_parts: List[str], parent_package: Optional[Module]) -> Optional[Module]:
-        module = self._try_to_load_regular_module(name_parts)
-        if module is not None:
-            if parent_package is not None:
-                module_name = name_parts[-1]
-                parent_package.add_symbol(module_name, module)
-            return module
-
-        package = self._try_to_load_package(name_parts)
-        if package is not None:
-            if parent_package is not None:
-                package_name = name_parts[-1]
-                parent_package.add_symbol(package_name, package)
-            return package
-
-    def _get_dir_by_name_parts(self, name_parts: List[str]) -> Optional[Dir]:
-        if len(name_parts) == 0:
-            return self._prog_context.root_dir
-
-        parent_dir = self._get_dir_by_name_parts(name_parts[:-1])
-        if parent_dir is not None:
-            return parent_dir.get_subdir(name_parts[-1])
-
-    def _try_to_load_package(self, name_parts: List[str]) -> Optional[Module]:
-        if len(name_parts) > 0:
-            fullname = '.'.join(name_parts)
-            package_dir = self._get_dir_by_name_parts(name_parts)
-            if package_dir is not None:
-                return self._try_to_load_module(fullname, package_dir.get_file('__init__.py'))
-
-    def _try_to_load_regular_module(self, name_parts: List[str]) -> Optional[Module]:
-        parant_parts = name_parts[:-1]
-        module_name = name_parts[-1]
-        fullname = '.'.join(name_parts)
-
-        parent_dir = self._get_dir_by_name_parts(parant_parts)
-        if parent_dir is not None:
-            module_file = parent_dir.get_file(module_name + '.py')
-            return self._try_to_load_module(fullname, module_file)
-
-    def _try_to_load_module(self, module_fullname: str, file_: File) -> Optional[Module]:
-        if file_ is not None:
-            return self._load_module(module_fullname, file_)
-
-    def _load_module(self, module_fullname: str, file_: File) -> Module:
-        # module_fullname = module.fullname
-        # import_spec = importlib.util.find_spec(module_fullname)
-        # if import_spec is None:
-        #     return
-        # import_fpathname = import_spec.origin
-        # if not import_fpathname:
-        #     return
-
-        loaded_module = Module(module_fullname, file_, self._prog_context)
-        module_builder = ModuleBuilder(loaded_module)
-        module_builder.build()
-        self._prog_context.add_module(loaded_module)
-        return loaded_module
-
-    def _resolve_module_name(self, module_name):
-        n_dots = 0
-        for i in module_name:
-            if i != '.':
-                break
-            n_dots += 1
-        return module_name  # todo: consider leading dots
+def _bind_symbol(scope: Scope, name: str, symbol: Symbol) -> bool:
+    if scope.find_local_symbol_by_name(name) is not None:  # todo: decide what todo, when symbol already exists
+        return False
+    scope.add_symbol(name, symbol)
+    return True
 
 
 # class VarFinderVisitor(ast.NodeVisitor):
@@ -341,103 +458,114 @@ class TypeCalculator:
     def _calc_func_return_type(self):
         func_def = self._scope
         parent_scope = func_def.parent_scope
-        anno_node = func_def.ast_node.returns
+        anno_node = func_def.returns_node
         return_type = AnnotationAnalyzer(anno_node, parent_scope).evaluate_type()
         func_def.set_return_type(return_type)
 
 
-class NameNodeExprInfosSetter(ast.NodeVisitor):
-
-    def __init__(self, scope: Scope, start_node: ast.AST):
-        super().__init__()
-        self._scope = scope
-        self._start_node = start_node
-
-    def set_expr_infos(self) -> None:
-        self.visit(self._start_node)
-
-    def visit(self, node):  # only hint for cc-pyparser
-        super().visit(node)
-        if False:
-            self.visit_Name(node)
-            self.visit_ClassDef(node)
-            self.visit_FunctionDef(node)
-
-    def visit_Name(self, name_node: ast.Name):
-        symbol = self._scope.find_symbol_by_name(name_node.id)
-        if symbol is not None:
-            name_node.expr_infos = ExprInfos(self._scope)
-            if isinstance(symbol, Variable):
-                var = symbol
-                if var.type_ is not None:
-                    if isinstance(var.type_, ClassRef):
-                        for derived_class in var.type_.class_def.iter_self_and_derived():
-                            name_node.expr_infos.add_expr_type(ClassRef(derived_class))
-                    else:
-                        name_node.expr_infos.add_expr_type(var.type_)
-            elif isinstance(symbol, FuncDef):
-                name_node.expr_infos.add_expr_type(FuncRef(symbol))
-            elif isinstance(symbol, ClassDef):
-                name_node.expr_infos.add_expr_type(ClassRef(symbol))
-            else: # p.e. Module
-                name_node.expr_infos.add_symbol(symbol)
-
-    def visit_ClassDef(self, class_def_node: ast.ClassDef):
-        class_name = class_def_node.name
-        class_def = self._scope.find_class_def(class_name)
-        assert class_def is not None
-        for x in class_def_node.body:
-            NameNodeExprInfosSetter(class_def, x).set_expr_infos()
+class ExprInfosSetter:
+    """ evaluates the expressions of a module with a worklist
 
-    def visit_FunctionDef(self, func_def_node: ast.FunctionDef):
-        func_name = func_def_node.name
-        func_def = self._scope.find_function_def(func_name)
-        assert func_def is not None
-        for x in func_def_node.body:
-            NameNodeExprInfosSetter(func_def, x).set_expr_infos()
+        The expression indices of each scope must be in post order, so the first pass evaluates the
+        sub expressions before the expressions, which depend on them. Later only the expressions are
+        evaluated again, whose dependencies got new expr_infos: the enclosing expression and the names,
+        which read a loop variable, when it gets its type.
+    """
 
+    _MAX_EVALUATIONS = 8  # per expression, only a safety net
 
-class OtherNodeExprInfosSetter(ast.NodeVisitor):
-
-    def __init__(self, ast_node: ast.AST):
-        super().__init__()
-        self._ast_node = ast_node
+    def __init__(self, expr_table: ExprTable, worklists: List[Tuple[Scope, List[int]]]):
+        self._expr_table = expr_table
+        self._worklists = worklists
+        self._scope = None             # type: Scope  # scope of the evaluated expression
+        self._is_first_pass = True
+        self._var_readers = {}         # type: Mapping[Variable, List[Tuple[int, Scope]]]
+        self._parent_indices = None    # type: List[int]
+        self._num_evaluations = {}     # type: Mapping[int, int]
         self.num_settings = 0
 
-    def visit(self, node):  # only hint for cc-pyparser
-        super().visit(node)
-        if False:
-            self.visit_Attribute(node)
-            self.visit_Call(node)
-            self.visit_Subscript(node)
-
-    def set_expr_infos(self) -> None:
-        self.visit(self._ast_node)
-
-    def visit_Attribute(self, attr_node: ast.Attribute):
-        if hasattr(attr_node, 'expr_infos'):
-            return
-
-        # call recursive
-        attr_expr = attr_node.value
-        self._call_recursive(attr_expr)
-        if not hasattr(attr_expr, 'expr_infos'):
-             return
-
-        # evaluate
-        attr_name = attr_node.attr
-        new_expr_infos = self._attr_expr(attr_expr.expr_infos, attr_name)
-        if new_expr_infos is not None:
-            attr_node.expr_infos = new_expr_infos
+    def set_expr_infos(self) -> int:
+        todo = deque()  # type: deque[Tuple[int, Scope]]
+        for scope, expr_indices in self._worklists:
+            self._scope = scope
+            for index in expr_indices:
+                if self._evaluate(index) and self._expr_table.get_expr(index).kind == EXPR_FOR:
+                    todo.extend(self._iter_loop_var_readers(index))  # read before the loop
+        self._is_first_pass = False
+
+        if todo:
+            self._parent_indices = [-1] * len(self._expr_table)
+            for index in range(len(self._expr_table)):
+                sub_index = self._expr_table.get_expr(index).sub_index
+                if sub_index >= 0:
+                    self._parent_indices[sub_index] = index
+
+        while todo:
+            index, self._scope = todo.popleft()
+            num_evaluations = self._num_evaluations.get(index, 0)
+            if num_evaluations >= self._MAX_EVALUATIONS:
+                continue
+            self._num_evaluations[index] = num_evaluations + 1
+            if self._evaluate(index):
+                todo.extend(self._iter_dependent_exprs(index))
+        return self.num_settings
+
+    def _evaluate(self, index: int) -> bool:
+        expr = self._expr_table.get_expr(index)
+        kind = expr.kind
+        if kind == EXPR_FOR:
+            is_set = self._set_for_var_type(expr)
+        else:
+            if kind == EXPR_NAME:
+                new_expr_infos = self._name_expr(index, expr.name)
+            else:
+                sub_expr_infos = self._expr_table.find_expr_infos(expr.sub_index) if expr.sub_index >= 0 else None
+                if sub_expr_infos is None:
+                    new_expr_infos = None
+                elif kind == EXPR_ATTR:
+                    new_expr_infos = self._attr_expr(sub_expr_infos, expr.name)
+                elif kind == EXPR_CALL:
+                    new_expr_infos = self._call_expr(sub_expr_infos)
+                else:
+                    new_expr_infos = self._subscript_expr(sub_expr_infos)
+            is_set = new_expr_infos is not None and not new_expr_infos.is_empty()
+            if is_set:
+                self._expr_table.set_expr_infos(index, new_expr_infos)
+        if is_set:
             self.num_settings += 1
-
-    def _call_recursive(self, expr_node: ast.AST):
-        if not hasattr(expr_node, 'expr_infos'):
-            sub_setter = OtherNodeExprInfosSetter(expr_node)
-            sub_setter.set_expr_infos()
-            self.num_settings += sub_setter.num_settings
-            if not hasattr(expr_node, 'expr_infos'):
-                return
+        return is_set
+
+    def _iter_dependent_exprs(self, index: int) -> Iterator[Tuple[int, Scope]]:
+        parent_index = self._parent_indices[index]
+        if parent_index >= 0:
+            yield parent_index, self._scope
+        if self._expr_table.get_expr(index).kind == EXPR_FOR:
+            yield from self._iter_loop_var_readers(index)
+
+    def _iter_loop_var_readers(self, for_index: int) -> Iterator[Tuple[int, Scope]]:
+        var = self._scope.find_local_symbol_by_name(self._expr_table.get_expr(for_index).name)
+        yield from self._var_readers.get(var, [])
+
+    def _name_expr(self, index: int, name: str) -> Optional[ExprInfos]:
+        symbol = self._scope.find_symbol_by_name(name)
+        if symbol is None:
+            return None
+
+        new_expr_infos = ExprInfos(self._scope)
+        if isinstance(symbol, Variable):
+            if self._is_first_pass and symbol.type_ is None:  # can get a type by a for loop
+                self._var_readers.setdefault(symbol, []).append((index, self._scope))
+            var = symbol
+            if var.type_ is not None:
+                for expr_type in var.type_.iter_instance_types():
+                    new_expr_infos.add_expr_type(expr_type)
+        elif isinstance(symbol, FuncDef):
+            new_expr_infos.add_expr_type(symbol.func_ref)
+        elif isinstance(symbol, ClassDef):
+            new_expr_infos.add_expr_type(symbol.class_ref)
+        else: # p.e. Module
+            new_expr_infos.add_symbol(symbol)
+        return new_expr_infos
 
     def _attr_expr(self, old_expr_infos: ExprInfos, attr_name: str) -> Optional[ExprInfos]:
         new_expr_infos = ExprInfos(old_expr_infos.scope_of_expr)
@@ -449,32 +577,12 @@ class OtherNodeExprInfosSetter(ast.NodeVisitor):
 
         for old_expr_type in old_expr_infos.iter_expr_types():
             new_expr_type = old_expr_type.get_attr_type(attr_name)
-            if isinstance(new_expr_type, ClassRef):
-                for derived_class in new_expr_type.class_def.iter_self_and_derived():
-                    new_expr_infos.add_expr_type(ClassRef(derived_class))
-            else:
-                if new_expr_type is not None:
-                    new_expr_infos.add_expr_type(new_expr_type)
+            if new_expr_type is not None:
+                for expr_type in new_expr_type.iter_instance_types():
+                    new_expr_infos.add_expr_type(expr_type)
 
         return new_expr_infos
 
-    def visit_Call(self, call_node: ast.Call):
-        if hasattr(call_node, 'expr_infos'):
-            return
-
-        # call recursive
-        call_expr = call_node.func
-        self._call_recursive(call_expr)
-        if not hasattr(call_expr, 'expr_infos'):
-           return
-        # todo: call args recursive
-
-        # evaluate
-        new_expr_infos = self._call_expr(call_expr.expr_infos)
-        if new_expr_infos is not None:
-            call_node.expr_infos = new_expr_infos
-            self.num_settings += 1
-
     def _call_expr(self, old_expr_infos: ExprInfos) -> Optional[ExprInfos]:
         new_expr_infos = ExprInfos(old_expr_infos.scope_of_expr)
 
@@ -494,27 +602,9 @@ class OtherNodeExprInfosSetter(ast.NodeVisitor):
                 new_expr_infos.add_expr_type(func.return_type)
         elif isinstance(old_symbol, ClassDef):
             cls = old_symbol
-            new_expr_infos.add_expr_type(ClassRef(cls))  # A() -> A
-
-    def visit_Subscript(self, subscript_node: ast.Subscript):
-        if hasattr(subscript_node, 'expr_infos'):
-            return
-
-        # call recursive
-        subscript_expr = subscript_node.value
-        self._call_recursive(subscript_expr)
-        if not hasattr(subscript_expr, 'expr_infos'):
-            return
-        # todo: call subscript_node.slice.value recursive
-
-        # evaluate
-        if hasattr(subscript_node.slice, 'value'):  # todo: not valid for "x[:2]" this has lower, step, upper
-            new_expr_infos = self._subscript_expr(subscript_expr.expr_infos, subscript_node.slice.value)
-            if new_expr_infos is not None:
-                subscript_node.expr_infos = new_expr_infos
-                self.num_settings += 1
+            new_expr_infos.add_expr_type(cls.class_ref)  # A() -> A
 
-    def _subscript_expr(self, old_expr_infos: ExprInfos, slice_node: ast.AST) -> Optional[ExprInfos]:
+    def _subscript_expr(self, old_expr_infos: ExprInfos) -> Optional[ExprInfos]:
         new_expr_infos = ExprInfos(old_expr_infos.scope_of_expr)
 
         for old_expr_type in old_expr_infos.iter_expr_types():
@@ -524,28 +614,18 @@ class OtherNodeExprInfosSetter(ast.NodeVisitor):
 
         return new_expr_infos
 
-    def visit_For(self, for_node: ast.For):
-        target_node = for_node.target
-        if not isinstance(target_node, ast.Name):
-            return
-        var_name = target_node.id
-
-        if not hasattr(target_node, 'variable'):
-            return
-        var = target_node.variable
+    def _set_for_var_type(self, for_expr: Expr) -> bool:
+        if for_expr.name is None:  # todo: "for x, y in ..."
+            return False
+        var = self._scope.find_local_symbol_by_name(for_expr.name)
         if not isinstance(var, Variable):
-            return
-        if var.name != var_name:
-            return
+            return False
         if var.type_ is not None:
-            return
+            return False
 
-        # call recursive
-        iter_node = for_node.iter
-        self._call_recursive(iter_node)
-        if not hasattr(iter_node, 'expr_infos'):
-            return
-        iter_expr_infos = iter_node.expr_infos
+        iter_expr_infos = self._expr_table.find_expr_infos(for_expr.sub_index) if for_expr.sub_index >= 0 else None
+        if iter_expr_infos is None:
+            return False
 
         # iter_var_type
         iter_var_types = []
@@ -554,51 +634,46 @@ class OtherNodeExprInfosSetter(ast.NodeVisitor):
             if new_expr_type is not None:
                 iter_var_types.append(new_expr_type)
         if len(iter_var_types) == 0:
-            return
+            return False
 
-        assert len(iter_var_types) == 1
-        iter_var_type = iter_var_types[0]
+        var.set_type(make_union_type(iter_var_types))
+        return True
 
-        var.set_type(iter_var_type)
 
-        for child_node in for_node.body:
-            self.visit(child_node)
+def _get_index_node(subscript_node: ast.Subscript) -> Optional[ast.AST]:
+    slice_node = subscript_node.slice
+    if hasattr(ast, 'Index') and isinstance(slice_node, ast.Index):  # python < 3.9
+        return slice_node.value
+    if isinstance(slice_node, ast.Slice) or type(slice_node).__name__ == 'ExtSlice':
+        return None
+    return slice_node
 
 
-class CallVisitor(ast.NodeVisitor):
+class CallFinder:
 
-    def __init__(self, call_graph):
-        super().__init__()
+    def __init__(self, expr_table: ExprTable, call_graph: CallGraph):
+        self._expr_table = expr_table
         self._call_graph = call_graph
 
-    def visit(self, node):  # only for cc-pyparser
-        super().visit(node)
-        if False:
-            self.visit_Call(node)
+    def find_calls(self, expr_indices: List[int]) -> None:
+        for index in expr_indices:
+            expr = self._expr_table.get_expr(index)
+            if expr.kind == EXPR_CALL and expr.sub_index >= 0:
+                self._find_call(expr)
 
-    def visit_Call(self, call_node: ast.Call):
-        call_expr = call_node.func
-        if not hasattr(call_expr, 'expr_infos'):
+    def _find_call(self, call_expr: Expr):
+        expr_infos = self._expr_table.find_expr_infos(call_expr.sub_index)
+        if expr_infos is None:
             return
 
-        expr_infos = call_expr.expr_infos
+        callees = []
         for expr_type in expr_infos.iter_expr_types():
-            callee = None
             if isinstance(expr_type, FuncRef):
-                callee = expr_type.func_def
+                callees.append(expr_type.func_def)
             elif isinstance(expr_type, ClassRef):
-                callee = expr_type.class_def
-            if callee:
-                self._potentially_add_call(expr_infos.scope_of_expr, callee, call_node)
-
+                callees.append(expr_type.class_def)
         for callee in expr_infos.iter_repr_scopes():
-            self._potentially_add_call(expr_infos.scope_of_expr, callee, call_node)
-
-        for child_node in ast.iter_child_nodes(call_node):
-            CallVisitor(self._call_graph).visit(child_node)
-
-    def _potentially_add_call(self, caller: Scope, callee: Symbol, call_node: ast.AST):
-        if isinstance(callee, FuncDef) or isinstance(callee, ClassDef):
-            self._call_graph.add_call(caller, callee, call_node)
-
-
+            if isinstance(callee, (FuncDef, ClassDef)):
+                callees.append(callee)
+        # one call site for all targets, p.e. the overriding methods of the derived classes
+        self._call_graph.add_call_site(expr_infos.scope_of_expr, callees, call_expr.lineno, call_expr.col_offset)
@@ -0,0 +1,198 @@
+from typing import Iterable, List, Mapping, Iterator, Set
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import os
+
+from filesystem import File
+from moduleobjects import Module, ProgContext
+from modulecache import CacheEntry, dumps_module_state, loads_module_state
+from parsing import ModuleBuilder, iter_import_chains, link_package, calc_hierarchy_signature
+from graphalgo import iter_strongly_connected_components
+
+
+class ProgramBuilder:
+    """ builds all modules, which are reachable from the start modules and not built yet
+
+        The module local phase (parsing, building scopes) runs in worker processes, if jobs > 1 and there
+        is more than one cpu. Otherwise the workers would only add the cost of transferring the results.
+        Linking, typing and the call analysis run in the parent process, when all modules are known.
+    """
+
+    def __init__(self, prog_context: ProgContext, jobs: int = 1):
+        self._prog_context = prog_context
+        self._module_cache = prog_context.module_cache
+        self._jobs = min(jobs, os.cpu_count() or 1)
+        self._old_modules = set(prog_context.iter_modules())  # type: Set[Module]
+        self._new_modules = []         # type: List[Module]
+        self._dependencies = {}        # type: Mapping[Module, List[Module]]
+        self._cache_entries = {}       # type: Mapping[Module, CacheEntry]
+        self._restored_modules = set() # type: Set[Module]
+
+    def build(self, start_modules: List[Module], pruned_modules: Iterable[Module] = ()) -> None:
+        """ pruned_modules: kept modules, whose calls into rebuilt modules were removed """
+        self._old_modules.difference_update(start_modules)
+        if self._jobs > 1:
+            self._discover_modules_parallel(start_modules)
+        else:
+            self._discover_modules(start_modules)
+
+        self._restore_and_link_modules()
+        analysed_modules = [x for x in self._new_modules if x not in self._restored_modules]
+        for module in analysed_modules:
+            ModuleBuilder(module).calc_types()
+        for module in self._new_modules:  # restored modules too, their calls are not cached
+            ModuleBuilder(module).find_calls()
+        analysed_modules.extend(self._refind_outdated_calls(pruned_modules))
+        self._prog_context.invalidate_indices()
+        for module in analysed_modules:
+            module.release_ast_nodes()  # linking and typing are done
+
+        if self._module_cache is not None:
+            for module in analysed_modules:
+                self._module_cache.store(module)
+
+    # --- phase 1: discover the modules and build their scopes
+
+    def _discover_modules(self, start_modules: List[Module]) -> None:
+        todo = deque(start_modules)
+        while todo:
+            module = todo.popleft()
+            if not self._try_to_use_cache_entry(module):
+                ModuleBuilder(module).build_scopes()
+            todo.extend(self._register_new_module(module))
+
+    def _discover_modules_parallel(self, start_modules: List[Module]) -> None:
+        with ProcessPoolExecutor(max_workers=self._jobs) as executor:
+            pending = {}
+            todo = list(start_modules)
+            while todo or pending:
+                modules_to_parse = []
+                while todo:
+                    module = todo.pop()
+                    if self._try_to_use_cache_entry(module):
+                        todo.extend(self._register_new_module(module))
+                    else:
+                        modules_to_parse.append(module)
+
+                modules_to_parse.sort(key=lambda x: x.file_.size or 0, reverse=True)  # largest first
+                for module in modules_to_parse:
+                    future = executor.submit(_build_scopes_in_worker, module.fullname, module.file_)
+                    pending[future] = module
+
+                done_futures, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done_futures:
+                    module = pending.pop(future)
+                    loads_module_state(module, future.result())
+                    todo.extend(self._register_new_module(module))
+
+    def _try_to_use_cache_entry(self, module: Module) -> bool:
+        if self._module_cache is None:
+            return False
+        entry = self._module_cache.find_entry(module.file_)
+        if entry is None:
+            return False
+        self._cache_entries[module] = entry
+        module.set_source_hash(entry.file_state.source_hash)
+        return True
+
+    def _register_new_module(self, module: Module) -> Iterator[Module]:
+        """ registers a module, which is read or restorable, and yields the unknown imported modules """
+        self._new_modules.append(module)
+        self._dependencies[module] = dependencies = []
+
+        entry = self._cache_entries.get(module, None)
+        if entry is not None:
+            import_chains = [[x] for x in entry.imports]
+        else:
+            import_chains = [chain for _, import_node in module.iter_import_nodes()
+                             for chain in iter_import_chains(import_node, module)]
+
+        for import_chain in import_chains:
+            for module_fullname in import_chain:
+                imported_module = self._prog_context.find_module(module_fullname)
+                if imported_module is None:
+                    imported_module = self._create_module(module_fullname)
+                    if imported_module is None:
+                        break
+                    yield imported_module
+                if imported_module is not module and imported_module not in dependencies:
+                    dependencies.append(imported_module)
+
+    def _create_module(self, module_fullname: str) -> Module:
+        file_ = self._prog_context.find_module_file(module_fullname)
+        if file_ is not None:
+            module = Module(module_fullname, file_, self._prog_context)
+            self._prog_context.add_module(module)  # register before analysing
+            return module
+
+    # --- phase 2: restore cached modules or link the symbols
+
+    def _restore_and_link_modules(self) -> None:
+        # the submodules are bound in their packages first, so bases like "pkg.mod.Base" are found
+        submodules = {}  # type: Mapping[str, List[Module]]  # package fullname -> submodules
+        for module in self._prog_context.iter_modules():
+            link_package(module, self._prog_context)
+            submodules.setdefault(module.fullname.rpartition('.')[0], []).append(module)
+
+        # the imported modules come first, modules which import each other are handled as group
+        components = iter_strongly_connected_components(self._new_modules, self._iter_new_dependencies)
+        for component in components:
+            for module in component:
+                if module in self._cache_entries:
+                    self._restore_module(module)
+                    for submodule in submodules.get(module.fullname, []):  # the symbol table was replaced
+                        link_package(submodule, self._prog_context)
+            modules_to_link = [x for x in component if x not in self._restored_modules]
+            if len(component) == 1:
+                for module in modules_to_link:
+                    ModuleBuilder(module).link()
+            else:
+                # symbols can be imported from a module of the group, which imports them itself
+                while sum(ModuleBuilder(x).link() for x in modules_to_link) > 0:
+                    pass
+
+    def _iter_new_dependencies(self, module: Module) -> Iterator[Module]:
+        for dependency in self._dependencies.get(module, []):
+            if dependency in self._dependencies:
+                yield dependency
+
+    def _restore_module(self, module: Module) -> None:
+        entry = self._cache_entries.get(module, None)
+        if entry is None:
+            return
+        if self._module_cache.restore(module, entry):
+            self._restored_modules.add(module)
+        else:
+            ModuleBuilder(module).build_scopes()  # p.e. a dependency has changed
+
+    # --- phase 4: calls of kept modules, which see new or rebuilt derived classes
+
+    def _refind_outdated_calls(self, pruned_modules: Iterable[Module]) -> List[Module]:
+        # the rebuilt classes have the same signature as the removed ones, so the pruned modules are added
+        changed_modules = [x for x in self._prog_context.iter_modules()
+                           if x.hierarchy_signature != calc_hierarchy_signature(x)]
+        changed_modules.extend(pruned_modules)
+        importing_map = {}  # type: Mapping[Module, List[Module]]
+        for module in self._prog_context.iter_modules():
+            for imported_module in module.iter_imported_modules():
+                importing_map.setdefault(imported_module, []).append(module)
+
+        outdated_modules = []
+        visited = set()
+        todo = changed_modules
+        while todo:
+            module = todo.pop()
+            if module in visited:
+                continue
+            visited.add(module)
+            todo.extend(importing_map.get(module, []))
+            if module in self._old_modules:
+                ModuleBuilder(module).refind_calls()
+                outdated_modules.append(module)
+        return outdated_modules
+
+
+def _build_scopes_in_worker(module_fullname: str, file_: File) -> bytes:
+    module = Module(module_fullname, file_, ProgContext(root_dir=None, module_map={}))
+    ModuleBuilder(module).build_scopes()  # releases the syntax tree, so only the compact state is sent back
+    return dumps_module_state(module)
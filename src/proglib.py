@@ -1,35 +1,167 @@
-from typing import Iterator, Optional
+from typing import Iterator, Optional, Set, Mapping, List
+from pathlib import Path
 
-from filesystem import File
-from parsing import ModuleBuilder
-from moduleobjects import Module, ProgContext
+from filesystem import Dir, File, FileState
+from progbuilder import ProgramBuilder
+from moduleobjects import Module, ProgContext, ProgCallGraph, Symbol, Scope
+from modulecache import ModuleCache
+from graphalgo import Condensation
 
 
 class Program:
 
-    def __init__(self, main_file: File):
+    def __init__(self, main_file: File, cache_dir: Optional[Path] = None, search_dirs: Optional[List[Dir]] = None,
+                 keep_sources: bool = True):
+        """ search_dirs: where imported modules are searched after the directory of the main file
+            keep_sources: False parses the files from memory maps and reads a source again, when it is needed
+        """
         self._module_map = {}
+        self._file_states = {}  # type: Mapping[str, FileState]  # snapshot of the last build
         self._main_file = main_file
+        self._module_cache = ModuleCache(cache_dir) if cache_dir is not None else None
+        self._context = ProgContext(root_dir=main_file.dir_, module_map=self._module_map,
+                                    module_cache=self._module_cache,
+                                    search_dirs=[main_file.dir_] + list(search_dirs or []),
+                                    keep_sources=keep_sources)
         self._main_module = Module(main_file.stem, main_file, self.context)
         self.add_module(self._main_module)
+        self._call_condensation = None    # type: Optional[Condensation[Scope]]
+        self._call_condensation_graph = None  # type: Optional[ProgCallGraph]  # graph of _call_condensation
+        self._import_condensation = None  # type: Optional[Condensation[Module]]
 
     @property
     def context(self):
-        return ProgContext(root_dir=self._main_file.dir_, module_map=self._module_map)
+        return self._context
+
+    @property
+    def call_graph(self) -> ProgCallGraph:
+        """ the calls of all modules with node ids for graph algorithms """
+        return self._context.call_graph
+
+    @property
+    def call_condensation(self) -> Condensation[Scope]:
+        """ the groups of (mutually) recursive scopes and the call DAG between them, cached until the next build """
+        call_graph = self.call_graph
+        if self._call_condensation is None or self._call_condensation_graph is not call_graph:
+            self._call_condensation = Condensation(
+                call_graph.iter_nodes(),
+                lambda x: (call_graph.get_node(y) for y in call_graph.iter_callee_ids(call_graph.find_node_id(x))))
+            self._call_condensation_graph = call_graph
+        return self._call_condensation
+
+    @property
+    def import_condensation(self) -> Condensation[Module]:
+        """ the import cycles and the import DAG between them, cached until the next build """
+        if self._import_condensation is None:
+            self._import_condensation = Condensation(self.iter_modules(), lambda x: x.iter_imported_modules())
+        return self._import_condensation
+
+    def iter_recursive_call_groups(self) -> Iterator[List[Scope]]:
+        """ yields the recursive functions and the groups of mutually recursive scopes """
+        yield from self.call_condensation.iter_cyclic_components()
+
+    @property
+    def module_cache(self) -> Optional[ModuleCache]:
+        return self._module_cache
+
+    def build(self, jobs: int = 1) -> None:
+        """ builds all modules, which are reachable from the main module
+
+            jobs > 1 parses in worker processes, if there are several cpus.
+        """
+        self._context.refresh()
+        ProgramBuilder(self._context, jobs).build([self._main_module])
+        self._take_snapshot()
+        self._import_condensation = None
+
+    def update(self, jobs: int = 1) -> None:
+        """ rebuilds the new or changed modules and all modules, which import them """
+        self._context.refresh()
+        main_file = self._main_file.dir_.get_file(self._main_file.name)
+        if main_file is None:
+            raise Exception('main file {} was removed'.format(self._main_file))
+
+        changed_modules = {x for x in self.iter_modules() if self._has_module_changed(x)}
+        if not changed_modules:
+            return
+
+        outdated_modules = self._calc_importing_modules(changed_modules)
+        pruned_modules = self._remove_modules(outdated_modules)
+        if self._main_module in outdated_modules:
+            self._main_file = main_file
+            self._main_module = Module(main_file.stem, main_file, self.context)
+            self.add_module(self._main_module)
+            ProgramBuilder(self._context, jobs).build([self._main_module], pruned_modules)
+        self._remove_modules(self._find_unreachable_modules())
+        self._take_snapshot()
+        self._import_condensation = None
+
+    def _take_snapshot(self):
+        self._file_states = {x.fullname: FileState.of(x.file_, x.source_hash) for x in self.iter_modules()}
+
+    def _has_module_changed(self, module: Module) -> bool:
+        if module is self._main_module:
+            cur_file = module.file_.dir_.get_file(module.file_.name)
+        else:
+            cur_file = self._context.find_module_file(module.fullname)
+        if cur_file is None or str(cur_file) != str(module.file_):
+            return True  # removed or shadowed by another search dir
+
+        file_state = self._file_states.get(module.fullname, None)
+        if file_state is None or not file_state.matches(cur_file):
+            return True
+
+        return any(self._context.find_module_file(x) is not None for x in module.iter_unresolved_imports())
+
+    def _calc_importing_modules(self, modules: Set[Module]) -> Set[Module]:
+        importing_map = {}  # type: Mapping[Module, List[Module]]
+        for module in self.iter_modules():
+            for imported_module in module.iter_imported_modules():
+                importing_map.setdefault(imported_module, []).append(module)
+
+        result = set()
+        todo = list(modules)
+        while todo:
+            module = todo.pop()
+            if module not in result:
+                result.add(module)
+                todo.extend(importing_map.get(module, []))
+        return result
+
+    def _find_unreachable_modules(self) -> Set[Module]:
+        reachable_modules = self._calc_imported_modules(self._main_module)
+        return {x for x in self.iter_modules() if x not in reachable_modules}
+
+    def _calc_imported_modules(self, start_module: Module) -> Set[Module]:
+        result = set()
+        todo = [start_module]
+        while todo:
+            module = todo.pop()
+            if module not in result:
+                result.add(module)
+                todo.extend(module.iter_imported_modules())
+        return result
+
+    def _remove_modules(self, modules: Set[Module]) -> Set[Module]:
+        """ returns the kept modules, which lost call targets or derived classes into the removed modules """
+        for module in modules:
+            self._context.remove_module(module)
+        return {x for x in self.iter_modules() if x.forget_modules(modules)}
 
-    def build(self) -> None:
-        ModuleBuilder(self._main_module).build()
-         
     @property
     def main_module(self) -> 'Module':
         return self._main_module
 
     def add_module(self, module):
-        self._module_map[module.fullname] = module
+        self._context.add_module(module)
 
     def find_module(self, fullname: str) -> Optional[Module]:
         return self._module_map.get(fullname, None)
 
+    def find_symbol(self, fullname: str) -> Optional[Symbol]:
+        """ p.e. find_symbol('gui.frame.MyFrame.on_button_clicked') """
+        return self._context.find_symbol(fullname)
+
     def iter_modules(self) -> Iterator['Module']:
         yield from self._module_map.values()
         
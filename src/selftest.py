@@ -1,14 +1,26 @@
+"""
+usage: python selftest.py                        prints the calls of each module
+       python selftest.py --dead-code [entry ...]  prints the definitions, which are not reachable from the
+                                                   entry points (fullnames, default: the main module)
+"""
+
+import sys
 from pathlib import Path
 from filesystem import RegularFile
 
 from proglib import Program
+from deadcode import DeadCodeFinder, format_report
 
 
 main_file = RegularFile(Path('selftest.py'))
 prg: Program = Program(main_file)
 prg.build()
 
-for module in prg.iter_modules():
-    print(module.fullname)
-    for call in module._call_graph.calls:
-        print('  {}'.format(call))
\ No newline at end of file
+if len(sys.argv) > 1 and sys.argv[1] == '--dead-code':
+    unreachable = DeadCodeFinder(prg).find_unreachable(sys.argv[2:] or None, include_main_blocks=True)
+    print(format_report(unreachable))
+else:
+    for module in prg.iter_modules():
+        print(module.fullname)
+        for call in module.call_graph.calls:
+            print('  {}'.format(call))
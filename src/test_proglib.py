@@ -1,9 +1,26 @@
 import unittest
-from typing import Mapping
+from unittest import mock
+import io
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Mapping, Optional
 
 from proglib import Program
-from filesystem import VirtualDir, VirtualFile
-from moduleobjects import CallGraph
+from filesystem import VirtualDir, VirtualFile, RegularDir, RegularFile
+from archivefs import ZipDir, TarDir
+from gitfs import GitRepository
+from moduleobjects import CallGraph, ClassRef, TList, Module, ProgContext
+from modulecache import loads_module_state
+from progbuilder import _build_scopes_in_worker
+from moduleindex import ModuleIndex
+from parsing import ModuleBuilder
+from callquery import CallQuery
+from deadcode import DeadCodeFinder
+import graphmetrics
 
 
 class TestParseDefinitions(unittest.TestCase):
@@ -26,6 +43,10 @@ class TestParseDefinitions(unittest.TestCase):
             """})
         f = prg.main_module.find_function_def('f')
         self.assertIsNotNone(f)
+        self.assertFalse(hasattr(f, '__dict__'))
+        self.assertEqual([], list(f.iter_child_scopes()))
+        self.assertEqual([], list(f.iter_variables()))
+        self.assertIsNone(f.find_local_symbol_by_name('x'))
 
     def test_method_def(self):
         prg = _create_program({
@@ -170,6 +191,138 @@ class TestImport(unittest.TestCase):
         mod2 = prg.main_module.find_local_symbol_by_name('mod2')
         self.assertIsNotNone(mod2)
 
+    def test_relative_import(self):
+        prg = _create_program({
+            'main': """
+                import pck1.sub.mod2
+                """,
+            'pck1.__init__': """
+                from . import mod1
+                """,
+            'pck1.mod1': """
+                class A:
+                    pass
+                """,
+            'pck1.sub.__init__': """
+                """,
+            'pck1.sub.mod2': """
+                from .mod3 import B
+                from ..mod1 import A
+                from ... import x
+                """,
+            'pck1.sub.mod3': """
+                class B:
+                    pass
+                """,
+        })
+        self.assertIs(prg.find_module('pck1').find_local_symbol_by_name('mod1'), prg.find_module('pck1.mod1'))
+        mod2 = prg.find_module('pck1.sub.mod2')
+        self.assertEqual(mod2.find_local_symbol_by_name('B').fullname, 'pck1.sub.mod3.B')
+        self.assertEqual(mod2.find_local_symbol_by_name('A').fullname, 'pck1.mod1.A')
+        self.assertIsNone(mod2.find_local_symbol_by_name('x'))
+
+
+class TestModuleIndex(unittest.TestCase):
+
+    def test_first_search_dir_wins(self):
+        dir1 = _create_dir_tree({'mod': '', 'pck.__init__': ''})
+        dir2 = _create_dir_tree({'mod': '', 'pck.__init__': '', 'pck.mod': '', 'other': ''})
+        index = ModuleIndex([dir1, dir2])
+        self.assertIs(index.find_module_file('mod'), dir1.get_file('mod.py'))
+        self.assertIs(index.find_module_file('pck'), dir1.get_subdir('pck').get_file('__init__.py'))
+        self.assertIsNone(index.find_module_file('pck.mod'))  # the package in dir1 hides the one in dir2
+        self.assertIs(index.find_module_file('other'), dir2.get_file('other.py'))
+        self.assertIsNone(index.find_module_file('missing.mod'))
+
+    def test_package_before_module(self):
+        root_dir = _create_dir_tree({'a': '', 'a.__init__': '', 'b': '', 'ns.c': ''})
+        index = ModuleIndex([root_dir])
+        self.assertEqual(index.find_module_file('a').name, '__init__.py')
+        self.assertEqual(sorted(index.iter_module_names()), ['a', 'b', 'ns', 'ns.c'])
+
+    def test_namespace_package(self):
+        dir1 = _create_dir_tree({'main': 'import ns.a\nfrom ns import b', 'ns.a': ''})
+        dir2 = _create_dir_tree({'ns.b': '', 'ns.a': ''})
+        prg = Program(dir1.get_file('main.py'), search_dirs=[dir2])
+        prg.build()
+        self.assertIs(prg.find_module('ns.a').file_, dir1.get_subdir('ns').get_file('a.py'))
+        self.assertIs(prg.find_module('ns.b').file_, dir2.get_subdir('ns').get_file('b.py'))
+        self.assertEqual(prg.find_module('ns').file_.read(), '')
+        self.assertIs(prg.main_module.find_local_symbol_by_name('b'), prg.find_module('ns.b'))
+
+        prg.update()
+        self.assertIsNotNone(prg.find_module('ns.b'))
+
+    def test_module_in_first_dir_shadows_later_dir(self):
+        dir1 = _create_dir_tree({'main': 'import mod'})
+        dir2 = _create_dir_tree({'mod': 'class A:\n    pass'})
+        prg = Program(dir1.get_file('main.py'), search_dirs=[dir2])
+        prg.build()
+        self.assertIsNotNone(prg.find_module('mod').find_local_symbol_by_name('A'))
+
+        dir1.add_file('mod.py', 'class B:\n    pass')
+        prg.update()
+        self.assertIsNotNone(prg.find_module('mod').find_local_symbol_by_name('B'))
+
+
+class TestImportCycles(unittest.TestCase):
+
+    def test_modules_import_each_other(self):
+        prg = _create_program({
+            'main': """
+                import mod2
+                """,
+            'mod2': """
+                import mod3
+
+                def f():
+                    mod3.g()
+                """,
+            'mod3': """
+                import mod2
+
+                def g():
+                    mod2.f()
+                """,
+        })
+        self.assertTrue(prg.find_module('mod2').call_graph.contains('mod2.f -> mod3.g'))
+        self.assertTrue(prg.find_module('mod3').call_graph.contains('mod3.g -> mod2.f'))
+
+    def test_import_symbol_imported_in_cycle(self):
+        prg = _create_program({
+            'main': """
+                from mod2 import A
+                """,
+            'mod2': """
+                from mod3 import A
+                """,
+            'mod3': """
+                from mod4 import A
+                import mod2
+                """,
+            'mod4': """
+                import mod3
+
+                class A:
+                    pass
+                """,
+        })
+        class_a = prg.find_module('mod4').find_class_def('A')
+        self.assertIs(prg.main_module.find_local_symbol_by_name('A'), class_a)
+        self.assertIs(prg.find_module('mod2').find_local_symbol_by_name('A'), class_a)
+
+    def test_long_import_chain(self):
+        n = 2000
+        sources = {'main': 'import mod0'}
+        for i in range(n):
+            sources['mod{}'.format(i)] = 'import mod{}'.format(i + 1)
+        sources['mod{}'.format(n)] = """
+            def f():
+                pass
+            """
+        prg = _create_program(sources)
+        self.assertIsNotNone(prg.find_module('mod{}'.format(n)).find_function_def('f'))
+
 
 class TestSymbolTables(unittest.TestCase):
 
@@ -187,6 +340,200 @@ class TestSymbolTables(unittest.TestCase):
         self.assertIsNotNone(a)
 #        self.assertEqual(str(a.type_expr) == 'main.A')
 
+    def test_name_resolution(self):
+        prg = _create_program({
+            'main': """
+                import pck
+
+                x: int = 1
+
+                class A:
+                    y: int = 2
+
+                    def f(self):
+                        pass
+                """,
+            'pck': """
+                class B:
+                    def g(self):
+                        pass
+                """})
+        a = prg.find_symbol('main.A')
+        f = prg.find_symbol('main.A.f')
+        self.assertIs(prg.find_symbol('main.x'), f.find_symbol_by_name('x'))
+        self.assertIs(prg.find_symbol('main.A.y'), a.find_symbol_by_name('y'))
+        self.assertIsNone(f.find_symbol_by_name('y'))  # class names are not visible in methods
+        self.assertIsNone(f.find_symbol_by_name('len'))
+        self.assertIs(prg.find_symbol('pck.B.g'), f.find_symbol_by_fullname('pck.B.g'))
+        self.assertIsNone(f.find_symbol_by_fullname('pck.B.h'))
+        self.assertIsNone(f.find_symbol_by_fullname('x.y'))
+
+        b = prg.find_symbol('pck.B')
+        prg.main_module.add_symbol('len', b)  # bound late, p.e. by an import
+        self.assertIs(b, f.find_symbol_by_name('len'))
+
+    def test_name_resolution_after_forget_modules(self):
+        prg = _create_program({
+            'main': """
+                import pck1.mod2
+                """,
+            'pck1.__init__': """
+                def f():
+                    pass
+                """,
+            'pck1.mod2': """
+                """})
+        mod2 = prg.find_module('pck1.mod2')
+        f = prg.find_symbol('pck1.f')
+        self.assertIs(mod2, f.find_symbol_by_name('mod2'))
+
+        prg.find_module('pck1').forget_modules({mod2})
+        self.assertIsNone(f.find_symbol_by_name('mod2'))  # not memorised any more
+
+    def test_find_symbol_by_fullname(self):
+        prg = _create_program({
+            'main': """
+                import pck1.mod2
+
+                class A:
+                    def f(self):
+                        x = 1
+                """,
+            'pck1.__init__': """
+                """,
+            'pck1.mod2': """
+                def g():
+                    pass
+                """})
+        f = prg.main_module.find_class_def('A').find_function_def('f')
+        self.assertIs(f, prg.find_symbol('main.A.f'))
+        self.assertIs(f.find_local_symbol_by_name('x'), prg.find_symbol('main.A.f.x'))
+        self.assertIs(prg.find_module('pck1.mod2').find_function_def('g'), prg.find_symbol('pck1.mod2.g'))
+        self.assertIs(prg.find_module('pck1'), prg.find_symbol('pck1'))
+        self.assertIsNone(prg.find_symbol('main.pck1'))  # imported, not defined there
+        self.assertIsNone(prg.find_symbol('main.A.g'))
+        self.assertEqual('main.A.f', f.fullname)
+        self.assertIs(f.fullname, f.fullname)
+
+
+class TestClassHierarchy(unittest.TestCase):
+
+    _PACKAGE_BASE_SOURCES = {
+        'main': """
+            import pkg.mod
+
+            class D(pkg.mod.Base):
+                def g(self):
+                    self.f()
+            """,
+        'pkg.__init__': """
+            """,
+        'pkg.mod': """
+            class Base:
+                def f(self):
+                    pass
+            """,
+    }
+
+    def test_base_in_package(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for cache_dir in [None, Path(tmp_dir), Path(tmp_dir)]:  # without cache, cold and warm cache
+                prg = _create_program(self._PACKAGE_BASE_SOURCES, cache_dir=cache_dir)
+                self.assertEqual(['pkg.mod.Base'], [x.fullname for x in prg.find_symbol('main.D').iter_bases()])
+                self.assertTrue(prg.main_module.call_graph.contains('main.D.g -> pkg.mod.Base.f'))
+
+    def test_transitive_subclasses(self):
+        prg = _create_program({
+            'main': """
+                import base
+
+                class B(base.A):
+                    pass
+
+                class C(B):
+                    pass
+
+                class D:
+                    pass
+                """,
+            'base': """
+                class A:
+                    pass
+                """})
+        a, b, c, d = [prg.find_symbol(x) for x in ('base.A', 'main.B', 'main.C', 'main.D')]
+        self.assertEqual([a], list(b.iter_bases()))
+        self.assertEqual([a, b, c], list(a.iter_self_and_derived()))
+        self.assertEqual([b, c], list(b.iter_self_and_derived()))
+        self.assertTrue(c.is_subclass_of(a))
+        self.assertTrue(a.is_subclass_of(a))
+        self.assertFalse(a.is_subclass_of(c))
+        self.assertFalse(d.is_subclass_of(a))
+
+    def test_mro(self):
+        prg = _create_program({
+            'main': """
+                class A:
+                    pass
+
+                class B(A):
+                    pass
+
+                class C(A):
+                    pass
+
+                class D(B, C):
+                    pass
+                """})
+        d = prg.find_symbol('main.D')
+        self.assertEqual(['main.D', 'main.B', 'main.C', 'main.A'], [x.fullname for x in d.get_mro()])
+        self.assertIs(d.get_mro(), d.get_mro())
+
+    def test_call_of_indirect_override(self):
+        call_graph = _create_call_graph("""
+            class A:
+                def f():
+                    pass
+
+            class B(A):
+                pass
+
+            class C(B):
+                def f():
+                    pass
+
+            def g(a: A):
+                a.f()
+        """)
+        self.assertTrue(call_graph.contains('main.g -> main.A.f'))
+        self.assertTrue(call_graph.contains('main.g -> main.C.f'))
+
+    def test_inherited_members(self):
+        prg = _create_program({
+            'main': """
+                class A:
+                    def f(self):
+                        pass
+
+                    def g(self):
+                        pass
+
+                class B(A):
+                    def g(self):
+                        self.f()
+
+                class C:
+                    def f(self):
+                        pass
+                """})
+        a, b, c = [prg.find_symbol(x) for x in ('main.A', 'main.B', 'main.C')]
+        self.assertTrue(prg.main_module.call_graph.contains('main.B.g -> main.A.f'))
+        self.assertIs(prg.find_symbol('main.A.f'), b.find_member('f'))
+        self.assertIs(prg.find_symbol('main.B.g'), b.find_member('g'))
+        self.assertIsNone(b.find_member('h'))
+
+        b.set_bases([c, a])  # the member tables of the derived classes are built again
+        self.assertIs(prg.find_symbol('main.C.f'), b.find_member('f'))
+
 
 class TestCallGraph(unittest.TestCase):
 
@@ -293,6 +640,49 @@ class TestCallGraph(unittest.TestCase):
         """)
         self.assertTrue(call_graph.contains('main.g -> main.A.f'))
 
+    def test_typing_annotations(self):
+        call_graph = _create_call_graph("""
+            class A:
+                def f():
+                    pass
+
+            class B:
+                def f():
+                    pass
+
+            def g1(a: Optional[A], b: typing.Dict[str, 'B']):
+                a.f()
+                b['x'].f()
+
+            def g2(x: Union[A, 'B', None]):
+                x.f()
+
+            def g3(a_seq: Sequence[A], b_iter: Iterator[B]):
+                for a in a_seq:
+                    a.f()
+                for b in b_iter:
+                    b.f()
+
+            def g4(t: Tuple[A, B], u: Tuple[A, ...]):
+                t[0].f()
+                u[0].f()
+
+            def g5(x: 'Optional[A]', y: Callable[[A], B]) -> A | None:
+                x.f()
+                y.f()
+                g5(x, y).f()
+        """)
+        self.assertTrue(call_graph.contains('main.g1 -> main.A.f'))
+        self.assertTrue(call_graph.contains('main.g1 -> main.B.f'))
+        self.assertTrue(call_graph.contains('main.g2 -> main.A.f'))
+        self.assertTrue(call_graph.contains('main.g2 -> main.B.f'))
+        self.assertTrue(call_graph.contains('main.g3 -> main.A.f'))
+        self.assertTrue(call_graph.contains('main.g3 -> main.B.f'))
+        self.assertTrue(call_graph.contains('main.g4 -> main.A.f'))
+        self.assertTrue(call_graph.contains('main.g4 -> main.B.f'))
+        self.assertTrue(call_graph.contains('main.g5 -> main.A.f'))
+        self.assertFalse(call_graph.contains('main.g5 -> main.B.f'))
+
     def test_map_of_list_of_classes(self):
         call_graph = _create_call_graph("""
             class A:
@@ -389,6 +779,35 @@ class TestCallGraph(unittest.TestCase):
         self.assertTrue(call_graph.contains('main.h -> main.A.f'))
         self.assertTrue(call_graph.contains('main.h -> main.B.f'))
 
+    def test_polymorphic_call_sites(self):
+        prg = _create_program({'main': """
+            class A:
+                def f():
+                    pass
+
+            class B(A):
+                def f():
+                    pass
+
+            def g(a: A):
+                a.f()
+                a.f()
+        """})
+        call_graph = prg.main_module.call_graph
+        self.assertEqual(2, call_graph.num_call_sites)
+        self.assertEqual(1, call_graph.num_target_sets)
+        call_site1, call_site2 = call_graph.iter_call_sites()
+        self.assertIs(call_site1.targets, call_site2.targets)
+        self.assertEqual({'main.A.f', 'main.B.f'}, {x.fullname for x in call_site1.targets})
+        self.assertEqual(4, len(call_graph.calls))
+
+        g = prg.find_symbol('main.g')
+        self.assertEqual(4, len(list(g.iter_calls_from_here())))
+        self.assertEqual([(10, 4), (11, 4)],
+                         sorted((x.lineno, x.col_offset) for x in prg.call_graph.iter_calls_from(g, expand=False)))
+        b_f = prg.find_symbol('main.B.f')
+        self.assertEqual([call_site1, call_site2], list(prg.call_graph.iter_calls_to(b_f, expand=False)))
+
     def test_local_var_overwrite_global(self):
         call_graph = _create_call_graph("""
             class A:
@@ -439,24 +858,880 @@ class TestCallGraph(unittest.TestCase):
     #     self.assertTrue(call_graph.contains('main.g -> main.A.f'))
 
 
+class TestProgCallGraph(unittest.TestCase):
+
+    def test_calls_from_and_to(self):
+        prg = _create_program({
+            'main': """
+                from mod2 import f, h
+
+                def g():
+                    f()
+                    h()
+                    f()
+                """,
+            'mod2': """
+                def f():
+                    pass
+
+                def h():
+                    f()
+                """})
+        func_g = prg.find_symbol('main.g')
+        func_f = prg.find_symbol('mod2.f')
+        self.assertEqual(['mod2.f', 'mod2.f', 'mod2.h'], sorted(str(x.callee) for x in func_g.iter_calls_from_here()))
+        self.assertEqual(['main.g', 'main.g', 'mod2.h'], [str(x.caller) for x in func_f.iter_calls_to_me()])
+        self.assertEqual([], list(func_f.iter_calls_from_here()))
+        self.assertEqual([], list(func_g.iter_calls_to_me()))
+
+        call_graph = prg.call_graph
+        self.assertEqual(5, call_graph.num_nodes)  # the modules too
+        self.assertEqual(4, call_graph.num_calls)
+        g_id = call_graph.find_node_id(func_g)
+        self.assertEqual(['mod2.f', 'mod2.h'],
+                         sorted(call_graph.get_node(x).fullname for x in call_graph.iter_callee_ids(g_id)))
+        f_id = call_graph.find_node_id(func_f)
+        self.assertEqual(['main.g', 'mod2.h'],
+                         sorted(call_graph.get_node(x).fullname for x in call_graph.iter_caller_ids(f_id)))
+
+
+class TestCallQuery(unittest.TestCase):
+
+    def setUp(self):
+        self._prg = _create_program({
+            'main': """
+                def a():
+                    b()
+                    c()
+
+                def b():
+                    c()
+
+                def c():
+                    d()
+                    a()
+
+                def d():
+                    pass
+
+                def e():
+                    d()
+                """})
+        self._query = CallQuery(self._prg.call_graph)
+
+    def test_callees(self):
+        callees = self._names(self._query.find_callees(self._func('a')))
+        self.assertEqual(['main.b', 'main.c'], sorted(callees[:2]))  # depth 1 before depth 2
+        self.assertEqual(['main.d'], callees[2:])
+        self.assertEqual(['main.b', 'main.c'], sorted(self._names(self._query.find_callees(self._func('a'), max_depth=1))))
+        self.assertEqual([], self._query.find_callees(self._func('d')))
+
+    def test_callers(self):
+        callers = self._names(self._query.find_callers(self._func('d')))
+        self.assertEqual(['main.c', 'main.e'], sorted(callers[:2]))
+        self.assertEqual(['main.a', 'main.b'], sorted(callers[2:]))
+        self.assertEqual(['main.c', 'main.e'], sorted(self._names(self._query.find_callers(self._func('d'), max_depth=1))))
+
+    def test_shortest_path(self):
+        self.assertEqual(['main.a', 'main.c', 'main.d'],
+                         self._names(self._query.find_shortest_path(self._func('a'), self._func('d'))))
+        self.assertEqual(['main.b', 'main.c', 'main.a'],
+                         self._names(self._query.find_shortest_path(self._func('b'), self._func('a'))))
+        self.assertIsNone(self._query.find_shortest_path(self._func('d'), self._func('a')))
+        self.assertIsNone(self._query.find_shortest_path(self._func('e'), self._func('a')))
+
+    def test_paths(self):
+        paths = self._query.find_paths(self._func('a'), self._func('d'), max_length=3)
+        self.assertEqual([['main.a', 'main.b', 'main.c', 'main.d'], ['main.a', 'main.c', 'main.d']],
+                         sorted(self._names(x) for x in paths))
+        paths = self._query.find_paths(self._func('a'), self._func('d'), max_length=2)
+        self.assertEqual([['main.a', 'main.c', 'main.d']], [self._names(x) for x in paths])
+        self.assertEqual(1, len(self._query.find_paths(self._func('a'), self._func('d'), max_length=3, max_paths=1)))
+
+    def _func(self, name):
+        return self._prg.main_module.find_function_def(name)
+
+    def _names(self, scopes):
+        return [x.fullname for x in scopes]
+
+
+class TestDeadCode(unittest.TestCase):
+
+    _SOURCES = {
+        'main': """
+            from mod2 import A, run
+
+            def unused():
+                helper()
+
+            def helper():
+                pass
+
+            run()
+            """,
+        'mod2': """
+            class A:
+                def __init__(self):
+                    pass
+
+                def f(self):
+                    pass
+
+            class B:
+                pass
+
+            def run():
+                A()
+
+            def test():
+                B()
+
+            if __name__ == '__main__':
+                test()
+            """}
+
+    def test_unreachable_from_main(self):
+        prg = _create_program(self._SOURCES)
+        unreachable = DeadCodeFinder(prg).find_unreachable()
+        self.assertEqual({'main': ['main.unused', 'main.helper'], 'mod2': ['mod2.A.f', 'mod2.B', 'mod2.test']},
+                         {k.fullname: [x.fullname for x in v] for k, v in unreachable.items()})
+
+    def test_else_branch_not_in_main_block(self):
+        prg = _create_program({
+            'main': """
+                def a():
+                    pass
+
+                def b():
+                    pass
+
+                if __name__ == '__main__':
+                    a()
+                else:
+                    b()
+                """})
+        module = prg.main_module
+        linenos = {str(x.callee): x.lineno for x in module.call_graph.iter_calls()}
+        self.assertTrue(module.is_in_main_block(linenos['main.a']))
+        self.assertFalse(module.is_in_main_block(linenos['main.b']))
+
+    def test_main_blocks_and_explicit_entry_points(self):
+        prg = _create_program(self._SOURCES)
+        unreachable = DeadCodeFinder(prg).find_unreachable(['main.unused'], include_main_blocks=True)
+        self.assertEqual({'mod2': ['mod2.A', 'mod2.A.__init__', 'mod2.A.f', 'mod2.run']},
+                         {k.fullname: [x.fullname for x in v] for k, v in unreachable.items()})
+
+
+class TestCondensation(unittest.TestCase):
+
+    def test_recursive_call_groups(self):
+        prg = _create_program({
+            'main': """
+                def a():
+                    b()
+
+                def b():
+                    c()
+                    a()
+
+                def c():
+                    c()
+                    d()
+
+                def d():
+                    pass
+                """})
+        groups = sorted(sorted(x.fullname for x in group) for group in prg.iter_recursive_call_groups())
+        self.assertEqual([['main.a', 'main.b'], ['main.c']], groups)
+
+        condensation = prg.call_condensation
+        self.assertIs(condensation, prg.call_condensation)
+        order = [x.fullname for x in condensation.iter_nodes_in_topological_order()]
+        self.assertLess(order.index('main.b'), order.index('main.c'))
+        self.assertLess(order.index('main.c'), order.index('main.d'))
+        index_ab = condensation.find_component_index(prg.find_symbol('main.a'))
+        index_c = condensation.find_component_index(prg.find_symbol('main.c'))
+        self.assertEqual([index_c], list(condensation.iter_successor_indices(index_ab)))
+        self.assertFalse(condensation.is_cyclic(condensation.find_component_index(prg.find_symbol('main.d'))))
+
+    def test_import_cycles(self):
+        prg = _create_program({
+            'main': """
+                import mod2
+                """,
+            'mod2': """
+                import mod3
+                """,
+            'mod3': """
+                import mod2
+                import mod4
+                """,
+            'mod4': """
+                """})
+        condensation = prg.import_condensation
+        self.assertEqual([['mod2', 'mod3']], [sorted(x.fullname for x in c) for c in condensation.iter_cyclic_components()])
+        self.assertEqual([['main'], ['mod2', 'mod3'], ['mod4']],
+                         [sorted(x.fullname for x in c) for c in condensation.iter_components()])
+
+
+class TestGraphMetrics(unittest.TestCase):
+
+    def setUp(self):
+        prg = _create_program({
+            'main': """
+                def a():
+                    b()
+                    b()
+                    c()
+
+                def b():
+                    c()
+
+                def c():
+                    pass
+
+                def d():
+                    pass
+                """})
+        self._call_graph = prg.call_graph
+
+    def test_export_and_degrees(self):
+        indptr, indices, names = graphmetrics.export_csr(self._call_graph, use_numpy=False)
+        callees = {names[i]: sorted(names[x] for x in indices[indptr[i]:indptr[i + 1]]) for i in range(len(names))}
+        self.assertEqual({'main': [], 'main.a': ['main.b', 'main.c'], 'main.b': ['main.c'], 'main.c': [],
+                          'main.d': []}, callees)  # isolated scopes are nodes too
+
+        fan_out = graphmetrics.calc_fan_out(indptr, use_numpy=False)
+        fan_in = graphmetrics.calc_fan_in(indptr, indices, use_numpy=False)
+        self.assertEqual({'main': 0, 'main.a': 2, 'main.b': 1, 'main.c': 0, 'main.d': 0}, dict(zip(names, fan_out)))
+        self.assertEqual({'main': 0, 'main.a': 0, 'main.b': 1, 'main.c': 2, 'main.d': 0}, dict(zip(names, fan_in)))
+
+    def test_pagerank(self):
+        indptr, indices, names = graphmetrics.export_csr(self._call_graph, use_numpy=False)
+        ranks = dict(zip(names, graphmetrics.calc_pagerank(indptr, indices, use_numpy=False)))
+        self.assertAlmostEqual(1.0, sum(ranks.values()))
+        self.assertLess(ranks['main.a'], ranks['main.b'])
+        self.assertLess(ranks['main.b'], ranks['main.c'])
+
+    @unittest.skipUnless(graphmetrics.has_numpy(), 'numpy is not installed')
+    def test_numpy_like_python(self):
+        indptr, indices, names = graphmetrics.export_csr(self._call_graph, use_numpy=False)
+        np_indptr, np_indices, np_names = graphmetrics.export_csr(self._call_graph, use_numpy=True)
+        self.assertEqual((indptr, indices, names), (list(np_indptr), list(np_indices), np_names))
+        self.assertEqual(graphmetrics.calc_fan_in(indptr, indices, use_numpy=False),
+                         list(graphmetrics.calc_fan_in(np_indptr, np_indices, use_numpy=True)))
+        ranks = graphmetrics.calc_pagerank(indptr, indices, use_numpy=False)
+        np_ranks = graphmetrics.calc_pagerank(np_indptr, np_indices, use_numpy=True)
+        for rank, np_rank in zip(ranks, np_ranks):
+            self.assertAlmostEqual(rank, np_rank)
+
+
+class TestExprEvaluation(unittest.TestCase):
+
+    def test_loop_var_read_before_loop(self):
+        prg = _create_program({
+            'main': """
+                class A:
+                    def f(self):
+                        pass
+
+                def g(a_list):
+                    while True:
+                        a.f()
+                        for a in a_list:
+                            pass
+                """})
+        module = prg.main_module
+        self.assertFalse(module.call_graph.contains('main.g -> main.A.f'))
+
+        class_a = module.find_class_def('A')
+        module.find_function_def('g').find_local_symbol_by_name('a_list').set_type(TList(ClassRef(class_a)))
+        ModuleBuilder(module).refind_calls()
+        self.assertTrue(module.call_graph.contains('main.g -> main.A.f'))
+
+    def test_expr_infos_in_side_table(self):
+        prg = _create_program({
+            'main': """
+                def f():
+                    pass
+
+                def g():
+                    unknown.h()
+                    f()
+                """})
+        module = prg.main_module
+        self.assertTrue(module.call_graph.contains('main.g -> main.f'))
+        self.assertEqual([(6, 4)], [(x.lineno, x.col_offset) for x in module.call_graph.calls])
+
+        expr_table = module.expr_table
+        self.assertEqual(5, len(expr_table))  # unknown, unknown.h, unknown.h(), f, f()
+        self.assertEqual(1, expr_table.num_expr_infos)  # f, the call f() has no type
+        self.assertIsNone(module.ast_node)  # released after the build
+
+    def test_expr_types_are_values(self):
+        prg = _create_program({
+            'main': """
+                class A:
+                    def f(self) -> A:
+                        pass
+
+                class B(A):
+                    def f(self) -> A:
+                        pass
+
+                def g(a: A):
+                    a.f()
+                """})
+        module = prg.main_module
+        class_a = module.find_class_def('A')
+        self.assertEqual(ClassRef(class_a), class_a.class_ref)
+        self.assertEqual(hash(ClassRef(class_a)), hash(class_a.class_ref))
+        self.assertEqual(TList(ClassRef(class_a)), TList(class_a.class_ref))
+        self.assertNotEqual(TList(class_a.class_ref), TList(module.find_class_def('B').class_ref))
+
+        # A.f() and B.f() both return A or B
+        func_g = module.find_function_def('g')
+        expr_indices = [x for scope, x in module.iter_expr_worklists() if scope is func_g][0]
+        call_expr_infos = module.expr_table.find_expr_infos(expr_indices[-1])
+        self.assertEqual(2, len(list(call_expr_infos.iter_expr_types())))
+
+
+class TestModuleCache(unittest.TestCase):
+
+    _SOURCES = {
+        'main': """
+            from mod2 import A
+
+            class B(A):
+                def f(self):
+                    pass
+
+            def g(a: A):
+                a.f()
+            """,
+        'mod2': """
+            class A:
+                def f(self):
+                    pass
+            """,
+    }
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self._cache_dir = Path(self._tmp_dir.name)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_restore_unchanged_modules(self):
+        prg1 = _create_program(self._SOURCES, cache_dir=self._cache_dir)
+        self.assertEqual(prg1.module_cache.num_hits, 0)
+
+        prg2 = _create_program(self._SOURCES, cache_dir=self._cache_dir)
+        self.assertEqual(prg2.module_cache.num_hits, 2)
+        call_graph = prg2.main_module.call_graph
+        self.assertTrue(call_graph.contains('main.g -> mod2.A.f'))
+        self.assertTrue(call_graph.contains('main.g -> main.B.f'))
+
+        class_a = prg2.find_module('mod2').find_class_def('A')
+        class_b = prg2.main_module.find_class_def('B')
+        self.assertIs(prg2.main_module.find_local_symbol_by_name('A'), class_a)
+        self.assertEqual(list(class_a.iter_derived()), [class_b])
+
+    def test_evict_stale_entry(self):
+        _create_program(self._SOURCES, cache_dir=self._cache_dir)
+
+        changed_sources = dict(self._SOURCES)
+        changed_sources['mod2'] = """
+            class A:
+                def h(self):
+                    pass
+            """
+        prg = _create_program(changed_sources, cache_dir=self._cache_dir)
+        self.assertEqual(prg.module_cache.num_hits, 0)  # main depends on mod2
+        self.assertEqual(prg.module_cache.num_evictions, 2)
+        self.assertFalse(prg.main_module.call_graph.contains('main.g -> mod2.A.f'))
+
+        prg = _create_program(changed_sources, cache_dir=self._cache_dir)
+        self.assertEqual(prg.module_cache.num_hits, 2)
+
+    def test_restored_module_sees_new_derived_class(self):
+        sources = {
+            'main': """
+                import mod2
+                """,
+            'mod2': """
+                class A:
+                    def f(self):
+                        pass
+
+                def g(a: A):
+                    a.f()
+                """,
+        }
+        _create_program(sources, cache_dir=self._cache_dir)
+
+        sources['main'] = """
+            from mod2 import A
+
+            class B(A):
+                def f(self):
+                    pass
+            """
+        prg = _create_program(sources, cache_dir=self._cache_dir)
+        self.assertEqual(prg.module_cache.num_hits, 1)
+        self.assertTrue(prg.find_module('mod2').call_graph.contains('mod2.g -> main.B.f'))
+
+    def test_restore_calls_into_not_imported_module(self):
+        sources = {
+            'main': """
+                import base
+                import derived
+                """,
+            'base': """
+                class Base:
+                    def m(self):
+                        pass
+
+                def use(b: Base):
+                    b.m()
+                """,
+            'derived': """
+                import base
+
+                class Derived(base.Base):
+                    def m(self):
+                        pass
+                """,
+        }
+        _create_program(sources, cache_dir=self._cache_dir)
+
+        for _ in range(2):  # base does not import derived, its entry must stay valid nevertheless
+            prg = _create_program(sources, cache_dir=self._cache_dir)
+            self.assertEqual(prg.module_cache.num_hits, 3)
+            self.assertEqual(prg.module_cache.num_evictions, 0)
+            self.assertTrue(prg.find_module('base').call_graph.contains('base.use -> derived.Derived.m'))
+
+
+class TestParallelBuild(unittest.TestCase):
+
+    def test_same_calls_as_sequential_build(self):
+        sources = {
+            'main': """
+                import pck1.mod2
+                from mod3 import C
+
+                def h(c: C):
+                    pck1.mod2.f()
+                    c.g()
+                """,
+            'pck1.__init__': """
+                """,
+            'pck1.mod2': """
+                def f():
+                    pass
+                """,
+            'mod3': """
+                class C:
+                    def g(self):
+                        pass
+                """,
+        }
+        prg1 = _create_program(sources)
+        with mock.patch('progbuilder.os.cpu_count', return_value=2):  # the workers are used on any machine
+            prg2 = _create_program(sources, jobs=2)
+        self.assertEqual(sorted(x.fullname for x in prg2.iter_modules()),
+                         ['main', 'mod3', 'pck1', 'pck1.mod2'])
+        for module in prg1.iter_modules():
+            self.assertEqual(sorted((str(x), x.lineno, x.col_offset) for x in module.call_graph.iter_calls()),
+                             sorted((str(x), x.lineno, x.col_offset)
+                                    for x in prg2.find_module(module.fullname).call_graph.iter_calls()))
+        self.assertTrue(prg2.main_module.call_graph.contains('main.h -> pck1.mod2.f'))
+        self.assertTrue(prg2.main_module.call_graph.contains('main.h -> mod3.C.g'))
+
+    def test_serial_build_on_one_cpu(self):
+        with mock.patch('progbuilder.os.cpu_count', return_value=1), \
+                mock.patch('progbuilder.ProcessPoolExecutor', side_effect=AssertionError('no workers')):
+            prg = _create_program({'main': 'import mod2', 'mod2': ''}, jobs=4)
+        self.assertIsNotNone(prg.find_module('mod2'))
+
+    def test_worker_result_without_syntax_tree(self):
+        root_dir = _create_dir_tree({'main': """
+            def f(a: int) -> int:
+                return a
+            """})
+        file_ = root_dir.get_file('main.py')
+        module = Module('main', file_, ProgContext(root_dir=None, module_map={}))
+        loads_module_state(module, _build_scopes_in_worker('main', file_))
+        self.assertIsNone(module.ast_node)
+        self.assertIsNotNone(module.find_function_def('f'))
+
+
+class TestRegularDir(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self._root_path = Path(self._tmp_dir.name)
+        (self._root_path / 'pck').mkdir()
+        (self._root_path / 'pck' / '__init__.py').write_text('')
+        (self._root_path / 'pck' / 'mod2.py').write_text('def f():\n    pass\n')
+        (self._root_path / 'main.py').write_text('import pck.mod2\n\ndef g():\n    pck.mod2.f()\n')
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_canonical_instances(self):
+        root_dir = RegularDir(self._root_path)
+        self.assertIs(root_dir, RegularDir(self._root_path))
+        main_file = RegularFile(self._root_path / 'main.py')
+        self.assertIs(main_file, root_dir.get_file('main.py'))
+        self.assertIs(root_dir, main_file.dir_)
+        pck_dir = root_dir.get_subdir('pck')
+        self.assertIs(pck_dir, root_dir.get_subdir('pck'))
+        self.assertIs(root_dir, pck_dir.parent_dir)
+        self.assertEqual(['__init__.py', 'mod2.py'], sorted(x.name for x in pck_dir.iter_files()))
+        self.assertFalse(root_dir.has_file('pck'))
+        self.assertTrue(root_dir.has_subdir('pck'))
+
+    def test_listing_is_kept_until_refresh(self):
+        root_dir = RegularDir(self._root_path)
+        root_dir.refresh()
+        self.assertIsNone(root_dir.get_file('mod3.py'))
+        (self._root_path / 'mod3.py').write_text('')
+        self.assertIsNone(root_dir.get_file('mod3.py'))
+        root_dir.refresh()
+        self.assertEqual(0, root_dir.get_file('mod3.py').size)
+
+    def test_build_and_update(self):
+        prg = Program(RegularFile(self._root_path / 'main.py'))
+        prg.build()
+        self.assertTrue(prg.main_module.call_graph.contains('main.g -> pck.mod2.f'))
+        (self._root_path / 'pck' / 'mod2.py').write_text('def f2():\n    pass\n')
+        prg.update()
+        self.assertFalse(prg.main_module.call_graph.contains('main.g -> pck.mod2.f'))
+
+    def test_encoding_declaration(self):
+        (self._root_path / 'pck' / 'mod2.py').write_bytes(
+            b'# -*- coding: latin-1 -*-\r\ndef f():\r\n    return "\xe9"\r\n')
+        prg = Program(RegularFile(self._root_path / 'main.py'))
+        prg.build()
+        self.assertTrue(prg.main_module.call_graph.contains('main.g -> pck.mod2.f'))
+        mod2 = prg.find_module('pck.mod2')
+        self.assertEqual('    return "\xe9"', mod2.lines[2])
+
+    def test_sources_not_kept(self):
+        prg = Program(RegularFile(self._root_path / 'main.py'), keep_sources=False)
+        prg.build()
+        self.assertTrue(prg.main_module.call_graph.contains('main.g -> pck.mod2.f'))
+        self.assertEqual('def f():', prg.find_module('pck.mod2').lines[0])
+        prg.find_module('pck.mod2').release_source()
+        (self._root_path / 'pck' / 'mod2.py').write_text('def f2():\n    pass\n')
+        prg.update()
+        self.assertFalse(prg.main_module.call_graph.contains('main.g -> pck.mod2.f'))
+        self.assertEqual('def f2():', prg.find_module('pck.mod2').lines[0])
+
+
+class TestArchiveDir(unittest.TestCase):
+
+    _SOURCES = {
+        'main.py': 'import pck.mod2\n\ndef g():\n    pck.mod2.f()\n',
+        'pck/__init__.py': '',
+        'pck/mod2.py': 'def f():\n    pass\n',
+    }
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self._root_path = Path(self._tmp_dir.name)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_zip(self):
+        zip_path = self._root_path / 'proj-1.0-py3-none-any.whl'
+        self._write_zip(zip_path, self._SOURCES)
+        zip_dir = ZipDir(zip_path)
+        self.assertEqual(['pck'], [x.name for x in zip_dir.iter_subdirs()])
+        self.assertTrue(zip_dir.has_file('main.py'))
+        self.assertFalse(zip_dir.has_file('pck'))
+        self.assertIs(zip_dir, zip_dir.get_subdir('pck').parent_dir)
+
+        prg = Program(zip_dir.get_file('main.py'))
+        prg.build()
+        self.assertTrue(prg.main_module.call_graph.contains('main.g -> pck.mod2.f'))
+        self.assertEqual(str(zip_path / 'pck' / 'mod2.py'), str(prg.find_module('pck.mod2').file_))
+
+        self._write_zip(zip_path, dict(self._SOURCES, **{'pck/mod2.py': 'def f2():\n    pass\n'}))
+        prg.update()
+        self.assertFalse(prg.main_module.call_graph.contains('main.g -> pck.mod2.f'))
+
+    def test_read_after_close(self):
+        zip_path = self._root_path / 'proj-1.0-py3-none-any.whl'
+        self._write_zip(zip_path, self._SOURCES)
+        zip_dir = ZipDir(zip_path)
+        prg = Program(zip_dir.get_file('main.py'))
+        prg.build()
+        zip_dir.close()
+        self.assertEqual(b'def f():\n    pass\n', zip_dir.get_subdir('pck').get_file('mod2.py').read_bytes())
+
+        zip_dir.close()
+        self._write_zip(zip_path, dict(self._SOURCES, **{'pck/mod2.py': 'def f2():\n    pass\n'}))
+        prg.update()  # reopens the archive
+        self.assertIsNotNone(prg.find_symbol('pck.mod2.f2'))
+
+    def test_tar_as_search_dir(self):
+        tar_path = self._root_path / 'proj-1.0.tar.gz'
+        with tarfile.open(str(tar_path), 'w:gz') as tar:
+            for name, source in self._SOURCES.items():
+                if name != 'main.py':
+                    info = tarfile.TarInfo('./proj-1.0/' + name)
+                    info.size = len(source)
+                    tar.addfile(info, io.BytesIO(source.encode('utf-8')))
+        (self._root_path / 'main.py').write_text(self._SOURCES['main.py'])
+
+        prg = Program(RegularFile(self._root_path / 'main.py'),
+                      search_dirs=[TarDir(tar_path).get_subdir('proj-1.0')])
+        prg.build(jobs=2)
+        self.assertTrue(prg.main_module.call_graph.contains('main.g -> pck.mod2.f'))
+
+    def _write_zip(self, zip_path: Path, sources: Mapping[str, str]):
+        with zipfile.ZipFile(str(zip_path), 'w') as zip_file:
+            for name, source in sources.items():
+                zip_file.writestr(name, source)
+
+
+@unittest.skipUnless(shutil.which('git'), 'git is not installed')
+class TestGitDir(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self._repo_path = Path(self._tmp_dir.name) / 'repo'
+        self._repo_path.mkdir()
+        self._git('init', '-q')
+        (self._repo_path / 'pck').mkdir()
+        (self._repo_path / 'pck' / '__init__.py').write_text('')
+        (self._repo_path / 'pck' / 'mod2.py').write_text('def f():\n    pass\n')
+        (self._repo_path / 'main.py').write_text('import pck.mod2\n\ndef g():\n    pck.mod2.f()\n')
+        self._commit()
+        (self._repo_path / 'main.py').write_text('import pck.mod2\n\ndef g():\n    pass\n')
+        self._commit()
+        self._repository = GitRepository(self._repo_path)
+
+    def tearDown(self):
+        self._repository.close()
+        self._tmp_dir.cleanup()
+
+    def test_revisions(self):
+        cache_dir = Path(self._tmp_dir.name) / 'cache'
+        old_prg = Program(self._repository.find_file('HEAD~1:main.py'), cache_dir=cache_dir)
+        old_prg.build()
+        self.assertTrue(old_prg.main_module.call_graph.contains('main.g -> pck.mod2.f'))
+        self.assertEqual(str(self._repo_path / 'pck' / 'mod2.py'), str(old_prg.find_module('pck.mod2').file_))
+
+        new_prg = Program(self._repository.find_file('HEAD:main.py'), cache_dir=cache_dir)
+        new_prg.build(jobs=2)
+        self.assertFalse(new_prg.main_module.call_graph.contains('main.g -> pck.mod2.f'))
+        self.assertEqual(new_prg.module_cache.num_hits, 2)  # the package and mod2 have the same blobs
+
+    def test_listing_and_refresh(self):
+        root_dir = self._repository.get_root_dir('HEAD')
+        self.assertEqual(['pck'], [x.name for x in root_dir.iter_subdirs()])
+        self.assertIsNone(self._repository.find_file('HEAD:pck/mod3.py'))
+        pck_dir = root_dir.get_subdir('pck')
+        self.assertIs(root_dir, pck_dir.parent_dir)
+
+        (self._repo_path / 'pck' / 'mod3.py').write_text('')
+        self._commit()
+        self.assertFalse(pck_dir.has_file('mod3.py'))
+        root_dir.refresh()
+        self.assertTrue(pck_dir.has_file('mod3.py'))
+        self.assertEqual(b'', pck_dir.get_file('mod3.py').read_bytes())
+
+    def test_find_file_without_revision(self):
+        self.assertEqual(self._repository.find_file('HEAD:pck/mod2.py').blob_id,
+                         self._repository.find_file('pck/mod2.py').blob_id)
+        self.assertEqual(self._repository.find_file('HEAD:main.py').blob_id,
+                         self._repository.find_file(':main.py').blob_id)
+        self.assertNotEqual(self._repository.find_file('HEAD~1:main.py').blob_id,
+                            self._repository.find_file('main.py').blob_id)
+        self.assertIsNone(self._repository.find_file('mod3.py'))
+
+    def _commit(self):
+        self._git('add', '-A')
+        self._git('-c', 'user.name=test', '-c', 'user.email=test@test', 'commit', '-q', '-m', 'test')
+
+    def _git(self, *args):
+        subprocess.run(['git'] + list(args), cwd=str(self._repo_path), check=True)
+
+
+class TestProgramUpdate(unittest.TestCase):
+
+    def setUp(self):
+        self._prg = _create_program({
+            'main': """
+                import mod2
+                import mod3
+                import mod4
+
+                def g():
+                    mod2.f()
+                    mod3.h()
+                """,
+            'mod2': """
+                def f():
+                    pass
+                """,
+            'mod3': """
+                def h():
+                    pass
+                """,
+        })
+        self._root_dir = self._prg.main_module.file_.dir_
+
+    def test_rebuild_changed_module_and_importers(self):
+        old_main = self._prg.main_module
+        old_mod3 = self._prg.find_module('mod3')
+        self._write_file('mod2.py', """
+            def f2():
+                pass
+            """)
+        self._prg.update()
+
+        self.assertIsNot(self._prg.main_module, old_main)
+        self.assertIs(self._prg.find_module('mod3'), old_mod3)
+        self.assertIsNotNone(self._prg.find_module('mod2').find_function_def('f2'))
+        self.assertIsNotNone(self._prg.find_symbol('mod2.f2'))
+        self.assertIsNone(self._prg.find_symbol('mod2.f'))
+        self.assertFalse(self._prg.main_module.call_graph.contains('main.g -> mod2.f'))
+        self.assertTrue(self._prg.main_module.call_graph.contains('main.g -> mod3.h'))
+
+    def test_unchanged_program(self):
+        old_main = self._prg.main_module
+        self._write_file('mod2.py', self._prg.find_module('mod2').source)
+        self._prg.update()
+        self.assertIs(self._prg.main_module, old_main)
+
+    def test_removed_module(self):
+        self._root_dir.remove_file('mod3.py')
+        self._prg.update()
+        self.assertIsNone(self._prg.find_module('mod3'))
+        self.assertFalse(self._prg.main_module.call_graph.contains('main.g -> mod3.h'))
+        self.assertTrue(self._prg.main_module.call_graph.contains('main.g -> mod2.f'))
+
+    def test_new_module(self):
+        self.assertIsNone(self._prg.find_module('mod4'))
+        self._root_dir.add_file('mod4.py', '')
+        self._prg.update()
+        self.assertIsNotNone(self._prg.find_module('mod4'))
+
+    def test_kept_module_keeps_calls_into_rebuilt_derived_class(self):
+        prg = _create_program({
+            'main': """
+                import base
+                import derived
+                """,
+            'base': """
+                class Base:
+                    def m(self):
+                        pass
+
+                def use(b: Base):
+                    b.m()
+                """,
+            'derived': """
+                import base
+
+                class Derived(base.Base):
+                    def m(self):
+                        pass
+                """,
+        })
+        self.assertTrue(prg.find_module('base').call_graph.contains('base.use -> derived.Derived.m'))
+        prg.main_module.file_.dir_.get_file('derived.py').write(
+            prg.find_module('derived').source + '\n# touched\n')
+        old_base = prg.find_module('base')
+        prg.update()
+
+        self.assertIs(prg.find_module('base'), old_base)
+        self.assertTrue(prg.find_module('base').call_graph.contains('base.use -> derived.Derived.m'))
+        derived_m = prg.find_symbol('derived.Derived.m')
+        self.assertEqual(['base.use'], [str(x.caller) for x in derived_m.iter_calls_to_me()])
+
+    def test_kept_module_sees_member_changes_of_derived_classes(self):
+        sources = {
+            'main': """
+                import a
+                import b
+                import c
+                """,
+            'a': """
+                class A:
+                    def f(self):
+                        pass
+
+                    def g(self):
+                        self.f()
+                """,
+            'b': """
+                import a
+
+                class B(a.A):
+                    def f(self):
+                        pass
+                """,
+            'c': """
+                import b
+
+                class C(b.B):
+                    def f(self):
+                        pass
+                """,
+        }
+        prg = _create_program(sources)
+        root_dir = prg.main_module.file_.dir_
+        old_a = prg.find_module('a')
+        root_dir.get_file('c.py').write(_TestSourceCodeAdapter("""
+            import b
+
+            class C(b.B):
+                pass
+            """).adapt())
+        prg.update()
+        self.assertFalse(prg.find_module('a').call_graph.contains('a.A.g -> c.C.f'))
+
+        root_dir.get_file('c.py').write(_TestSourceCodeAdapter(sources['c']).adapt())
+        prg.update()
+        self.assertIs(prg.find_module('a'), old_a)  # kept, but its calls are found again
+        fresh_prg = _create_program(sources)
+        for module in fresh_prg.iter_modules():
+            self.assertEqual(sorted(str(x) for x in module.call_graph.iter_calls()),
+                             sorted(str(x) for x in prg.find_module(module.fullname).call_graph.iter_calls()))
+
+    def _write_file(self, file_name, raw_source_code):
+        source_code = _TestSourceCodeAdapter(raw_source_code).adapt()
+        self._root_dir.get_file(file_name).write(source_code)
+
+
 def _create_call_graph(raw_source_code: str) -> CallGraph:
     prg = _create_program({'main': raw_source_code})
     return prg.main_module.call_graph
 
 
-def _create_program(module_fullname2raw_source_code_map: Mapping[str, str]) -> Program:
+def _create_program(module_fullname2raw_source_code_map: Mapping[str, str],
+                    cache_dir: Optional[Path] = None, jobs: int = 1) -> Program:
+    root_dir = _create_dir_tree(module_fullname2raw_source_code_map)
+    program = Program(root_dir.get_file('main.py'), cache_dir=cache_dir)
+    program.build(jobs=jobs)
+    return program
+
+
+def _create_dir_tree(module_fullname2raw_source_code_map: Mapping[str, str]) -> VirtualDir:
     root_dir = VirtualDir(name='', parent_dir=None)
-    main_file = None
     for module_fullname, raw_source_code in module_fullname2raw_source_code_map.items():
         dir_fullname, module_name = _split_fullname(module_fullname)
         cur_dir = _create_dir(dir_fullname, root_dir)
         source_code = _TestSourceCodeAdapter(raw_source_code).adapt()
-        new_file = cur_dir.add_file(module_name + '.py', file_buf=source_code)
-        if module_name == 'main':
-            main_file = new_file
-    program = Program(main_file)
-    program.build()
-    return program
+        cur_dir.add_file(module_name + '.py', file_buf=source_code)
+    return root_dir
 
 
 def _split_fullname(fullname: str):